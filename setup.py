@@ -20,7 +20,8 @@ setup(name="wampnado",
       #download_url = 'http://pypi.python.org/pypi/wampnado',
       description=u"WAMP (Web Application Messaging Protocol)",
       include_package_data=True,
-      install_requires=["tornado>=4.0", "enum34", "tornadis==0.8.0", "six==1.10.0", "msgpack"],
+      install_requires=["tornado>=6.5", "enum34", "tornadis==0.8.0", "six==1.10.0", "msgpack"],
+      extras_require={"cbor": ["cbor2"], "ubjson": ["py-ubjson"]},
       license="Apache License",
       long_description=README,
       packages=find_packages(),
@@ -0,0 +1,21 @@
+"""
+Fixtures shared by the tests.
+"""
+from wampnado.agent.server import WAMPMetaServerHandler
+from wampnado.serializer import NONE_PROTOCOL, SERIALIZERS
+
+
+class Handler(WAMPMetaServerHandler):
+    """
+    A server handler without a transport, that keeps what it is sent.  With a protocol other than NONE_PROTOCOL, it
+    keeps the messages serialized with it, like a transport would send them.
+    """
+    def __init__(self, protocol=NONE_PROTOCOL):
+        super().__init__()
+        self.protocol = protocol
+        self.sent = []
+
+    def write_message(self, msg):
+        if self.protocol != NONE_PROTOCOL:
+            msg = SERIALIZERS[self.protocol].encode(msg)
+        self.sent.append(msg)
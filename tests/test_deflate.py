@@ -0,0 +1,61 @@
+"""
+permessage-deflate, with the arguments of an event compressed once for all its subscribers.
+"""
+import json
+import zlib
+
+from tornado.testing import AsyncTestCase, bind_unused_port, gen_test
+from tornado.websocket import websocket_connect
+
+from wampnado import ApplicationServer, ListenerParameters
+from wampnado.messages import Code, SerializedTail, SplicedMessage, HelloMessage, SubscribeMessage, PublishMessage
+from wampnado.serializer import SERIALIZERS, JSON_PROTOCOL
+from wampnado.transports.compression import DeflateOptions, SYNC_FLUSH_TAIL
+
+PAYLOAD = {'records': [{'id': n, 'name': 'record {}'.format(n)} for n in range(200)]}
+
+
+def inflate(data, window_bits):
+    """
+    Decompresses a message the way a permessage-deflate peer does.
+    """
+    return zlib.decompressobj(-window_bits).decompress(data + SYNC_FLUSH_TAIL)
+
+
+class TestSplicedDeflate(AsyncTestCase):
+    def test_head_and_shared_tail_inflate_to_the_message(self):
+        options = DeflateOptions(shared=True, window_bits=12)
+        serializer = SERIALIZERS[JSON_PROTOCOL]
+        tail = SerializedTail.payload(args=[PAYLOAD])
+        for subscription_id in (1, 2):
+            msg = SplicedMessage(Code.EVENT, [subscription_id, 3, {}], tail)
+            data = options.deflate_spliced(msg, serializer, options.window_bits)
+            self.assertEqual(inflate(data, options.window_bits), msg.json.encode())
+        self.assertEqual(len(tail.deflated), 1)
+
+    @gen_test
+    async def test_subscribers_get_the_event(self):
+        (sock, port) = bind_unused_port()
+        sock.close()
+        server = ApplicationServer('/ws', ListenerParameters(port=port, address='127.0.0.1'), compression=DeflateOptions(shared=True, window_bits=12))
+        server.listen()
+        clients = []
+        try:
+            for _ in range(3):
+                client = await websocket_connect('ws://127.0.0.1:{}/ws'.format(port), subprotocols=[JSON_PROTOCOL], compression_options={})
+                clients.append(client)
+                client.write_message(HelloMessage(realm='test.deflate', details={}).json)
+                self.assertEqual(json.loads(await client.read_message())[0], Code.WELCOME)
+                client.write_message(SubscribeMessage(request_id=1, options={}, uri='com.example.topic').json)
+                self.assertEqual(json.loads(await client.read_message())[0], Code.SUBSCRIBED)
+            self.assertIn('permessage-deflate', clients[0].headers.get('Sec-WebSocket-Extensions'))
+
+            clients[0].write_message(PublishMessage(request_id=2, options={'exclude_me': False}, uri_name='com.example.topic', args=[PAYLOAD]).json)
+            for client in clients:
+                event = json.loads(await client.read_message())
+                self.assertEqual(event[0], Code.EVENT)
+                self.assertEqual(event[4], [PAYLOAD])
+        finally:
+            for client in clients:
+                client.close()
+            server.stop()
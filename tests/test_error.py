@@ -0,0 +1,35 @@
+"""
+Errors and their pre-serialized ERROR messages.
+"""
+import unittest
+
+from wampnado.messages import Code
+from wampnado.uri.error import Error
+
+
+class TestErrorTemplates(unittest.TestCase):
+    def setUp(self):
+        self.error = Error('com.example.error')
+
+    def test_equal_args_of_other_types_are_not_shared(self):
+        self.assertTrue(self.error.message(Code.CALL, 1, True).json.endswith('[true]]'))
+        self.assertTrue(self.error.message(Code.CALL, 2, 1).json.endswith('[1]]'))
+        self.assertTrue(self.error.message(Code.CALL, 3, 1.0).json.endswith('[1.0]]'))
+
+    def test_equal_details_of_other_types_are_not_shared(self):
+        self.error.message(Code.CALL, 1, details={'a': 1.0})
+        self.assertIn('{"a": 1}', self.error.message(Code.CALL, 2, details={'a': 1}).json)
+
+    def test_nested_tuples(self):
+        self.error.message(Code.CALL, 1, (True,))
+        self.assertTrue(self.error.message(Code.CALL, 2, (1,)).json.endswith('[[1]]]'))
+
+    def test_identical_errors_share_a_template(self):
+        first = self.error.message(Code.CALL, 1, 'x', k=1)
+        second = self.error.message(Code.PUBLISH, 2, 'x', k=1)
+        self.assertIs(first.tail, second.tail)
+
+    def test_unhashable_args_are_not_cached(self):
+        self.error.message(Code.CALL, 1, [1])
+        self.assertTrue(self.error.message(Code.CALL, 2, [True]).json.endswith('[[true]]]'))
+        self.assertEqual(self.error.templates, {})
@@ -0,0 +1,58 @@
+"""
+Retained event history.
+"""
+import json
+import unittest
+
+from wampnado.messages import Code, SerializedTail, SplicedMessage, json_dumps
+from wampnado.serializer import SERIALIZERS, BINARY_PROTOCOL, JSON_PROTOCOL
+from wampnado.transports.compression import DeflateOptions
+from wampnado.uri.history import EventHistory
+
+
+class TestHistoryAccounting(unittest.TestCase):
+    def setUp(self):
+        self.args = [{'key': n, 'value': 'x' * 20} for n in range(50)]
+        self.kwargs = {'source': 'test'}
+
+    def fan_out(self, tail):
+        """
+        Sends an event with tail in both protocols, compressed, like Topic.publish does for mixed subscribers.
+        """
+        deflate = DeflateOptions()
+        for protocol in (BINARY_PROTOCOL, JSON_PROTOCOL):
+            msg = SplicedMessage(Code.EVENT, [1, 2, {}], tail)
+            deflate.deflate_spliced(msg, SERIALIZERS[protocol], deflate.window_bits)
+
+    def test_only_one_serialization_is_kept(self):
+        tail = SerializedTail.payload(args=self.args, kwargs=self.kwargs)
+        self.fan_out(tail)
+
+        history = EventHistory()
+        history.append(1, tail)
+        entry = history.events()[0]
+        self.fan_out(entry.event_message(3).tail)
+
+        kept = entry.tail
+        self.assertIsNone(kept._elements)
+        self.assertIsNone(kept._json)
+        self.assertEqual(kept.deflated, {})
+        self.assertEqual(entry.size, len(kept._msgpack))
+        self.assertEqual(history.bytes, entry.size)
+
+        self.assertEqual(entry.args, self.args)
+        self.assertEqual(entry.kwargs, self.kwargs)
+        self.assertIsNone(kept._elements)
+
+    def test_received_json_is_kept_as_is(self):
+        text = ','.join(json_dumps(element) for element in (self.args, self.kwargs))
+        tail = SerializedTail.received(json=text)
+
+        history = EventHistory()
+        history.append(1, tail)
+        entry = history.events()[0]
+        self.fan_out(entry.event_message(3).tail)
+
+        self.assertIsNone(entry.tail._msgpack)
+        self.assertEqual(entry.size, len(text))
+        self.assertEqual(json.loads(entry.event_message(3).json), [Code.EVENT.value, 3, 1, {'retained': True}, self.args, self.kwargs])
@@ -0,0 +1,40 @@
+"""
+Global scope IDs, and the set of those in use.
+"""
+import unittest
+
+from wampnado.identifier import existing_ids, random_id, MIN_ID, MAX_ID
+from wampnado.messages import Code, PublishMessage
+
+from tests import Handler
+
+
+class TestIdentifiers(unittest.TestCase):
+    def test_random_id_is_not_tracked(self):
+        before = len(existing_ids)
+        for _ in range(100):
+            self.assertTrue(MIN_ID <= random_id() <= MAX_ID)
+        self.assertEqual(len(existing_ids), before)
+
+    def test_publications_are_not_tracked(self):
+        (publisher, subscriber) = (Handler(), Handler())
+        for handler in (publisher, subscriber):
+            handler.attach_realm('test.identifier')
+        subscriber.realm.add_subscriber('com.example.topic', subscriber)
+        process_publish = publisher.dispatch[Code.PUBLISH]
+
+        before = len(existing_ids)
+        for request_id in range(1, 101):
+            process_publish(PublishMessage(request_id=request_id, options={'acknowledge': True}, uri_name='com.example.topic', args=[request_id]), publisher)
+        self.assertEqual(len(existing_ids), before)
+        self.assertEqual(len(subscriber.sent), 100)
+
+        for handler in (publisher, subscriber):
+            handler.on_close()
+
+    def test_session_id_is_released_on_close(self):
+        handler = Handler()
+        self.assertIn(handler.sessionid, existing_ids)
+        handler.attach_realm('test.identifier')
+        handler.on_close()
+        self.assertNotIn(handler.sessionid, existing_ids)
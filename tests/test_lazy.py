@@ -0,0 +1,116 @@
+"""
+Messages whose arguments are received undecoded.
+"""
+import json
+import unittest
+from time import monotonic
+
+import msgpack
+
+from wampnado.features import Options
+from wampnado.messages import Code, Message, PublishMessage, YieldMessage, json_dumps
+from wampnado.serializer import BINARY_PROTOCOL, JSON_PROTOCOL
+from wampnado.uri.error import WAMPException
+from wampnado.uri.procedure import Procedure
+
+from tests import Handler
+
+ARGS = ['x' * 600, {'key': 'value'}]
+KWARGS = {'source': 'test'}
+
+# A msgpack str of the same length as the placeholder, that is not UTF-8.
+PLACEHOLDER = 'placeholder'
+NOT_UTF8 = b'\xff' * len(PLACEHOLDER)
+
+
+def undecodable(value):
+    """
+    The MSGPack encoding of value, with PLACEHOLDER made into a string that does not decode.
+    """
+    return msgpack.packb(value, use_bin_type=True).replace(PLACEHOLDER.encode(), NOT_UTF8)
+
+
+class TestLazyDecoding(unittest.TestCase):
+    def test_arguments_are_kept_as_received(self):
+        value = [Code.PUBLISH.value, 1, {}, 'com.example.topic', ARGS, KWARGS]
+        for msg in (Message.from_text_lazy(json_dumps(value)), Message.from_bin_lazy(msgpack.packb(value))):
+            self.assertIsNotNone(msg._payload)
+            self.assertEqual(msg.args, ARGS)
+            self.assertEqual(msg.kwargs, KWARGS)
+
+    def test_malformed_json_is_rejected(self):
+        text = json_dumps([Code.PUBLISH.value, 1, {}, 'com.example.topic', ARGS, KWARGS])
+        for malformed in (text[:-1], text[:-2] + ']', text.replace('"source"', 'source'), text + 'x'):
+            with self.assertRaises(ValueError):
+                Message.from_text_lazy(malformed)
+
+    def test_malformed_msgpack_is_rejected(self):
+        data = msgpack.packb([Code.PUBLISH.value, 1, {}, 'com.example.topic', ARGS, KWARGS])
+        for malformed in (data[:-1], data + b'\xc0'):
+            with self.assertRaises(ValueError):
+                Message.from_bin_lazy(malformed)
+
+    def test_extra_elements_are_rejected(self):
+        value = [Code.PUBLISH.value, 1, {}, 'com.example.topic', ARGS, KWARGS, 5]
+        for decode in (lambda: Message.from_text_lazy(json_dumps(value)), lambda: Message.from_bin_lazy(msgpack.packb(value))):
+            with self.assertRaises(TypeError):
+                decode()
+
+    def test_unexpected_arguments_are_decoded(self):
+        value = [Code.PUBLISH.value, 1, {}, 'com.example.topic', KWARGS, ARGS]
+        for msg in (Message.from_text_lazy(json_dumps(value)), Message.from_bin_lazy(msgpack.packb(value))):
+            self.assertIsNone(msg._payload)
+            self.assertEqual(msg.args, KWARGS)
+
+
+class TestUndecodableArguments(unittest.TestCase):
+    def setUp(self):
+        self.handlers = []
+
+    def tearDown(self):
+        for handler in self.handlers:
+            handler.on_close()
+
+    def handler(self, protocol):
+        handler = Handler(protocol)
+        handler.attach_realm('test.lazy')
+        self.handlers.append(handler)
+        return handler
+
+    def test_publication_is_answered_with_an_error(self):
+        (publisher, binary, other, text) = [self.handler(protocol) for protocol in (BINARY_PROTOCOL, BINARY_PROTOCOL, BINARY_PROTOCOL, JSON_PROTOCOL)]
+        for subscriber in (binary, other, text):
+            publisher.realm.add_subscriber('com.example.topic', subscriber)
+
+        msg = Message.from_bin_lazy(undecodable([Code.PUBLISH.value, 1, {'acknowledge': True}, 'com.example.topic', ARGS + [PLACEHOLDER]]))
+        self.assertIsInstance(msg, PublishMessage)
+        with self.assertRaises(WAMPException) as raised:
+            publisher.dispatch[Code.PUBLISH](msg, publisher)
+
+        self.assertEqual(raised.exception.error_uri.name, 'wamp.error.invalid_argument')
+        # Nobody gets an event the publisher was told failed, whatever order the subscribers come in.
+        self.assertEqual(binary.sent + other.sent + text.sent, [])
+
+    def test_publication_in_the_same_protocol_is_not_decoded(self):
+        (publisher, subscriber) = (self.handler(BINARY_PROTOCOL), self.handler(BINARY_PROTOCOL))
+        publisher.realm.add_subscriber('com.example.topic', subscriber)
+
+        msg = Message.from_bin_lazy(undecodable([Code.PUBLISH.value, 1, {}, 'com.example.topic', ARGS + [PLACEHOLDER]]))
+        publisher.dispatch[Code.PUBLISH](msg, publisher)
+
+        self.assertTrue(msg.undecoded)
+        self.assertEqual(len(subscriber.sent), 1)
+
+    def test_call_is_answered_with_an_error(self):
+        (caller, callee) = (self.handler(JSON_PROTOCOL), self.handler(BINARY_PROTOCOL))
+        (procedure, _) = caller.realm.create_procedure('com.example.procedure', callee)
+        Procedure.pending[1] = (caller, monotonic(), Options(), procedure)
+
+        msg = Message.from_bin_lazy(undecodable([Code.YIELD.value, 1, {}, ARGS + [PLACEHOLDER]]))
+        self.assertIsInstance(msg, YieldMessage)
+        Procedure.yield_result(callee, msg)
+
+        self.assertNotIn(1, Procedure.pending)
+        (error,) = [json.loads(text) for text in caller.sent]
+        self.assertEqual(error[:3], [Code.ERROR.value, Code.CALL.value, 1])
+        self.assertEqual(error[4], 'wamp.error.invalid_argument')
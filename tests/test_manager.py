@@ -0,0 +1,49 @@
+"""
+Sessions leaving a realm.
+"""
+import unittest
+
+from wampnado.uri.manager import URIManager
+
+from tests import Handler
+
+
+class TestDisconnect(unittest.TestCase):
+    def setUp(self):
+        self.manager = URIManager()
+        (self.leaving, self.staying) = (Handler(), Handler())
+
+    def tearDown(self):
+        self.manager.clear()
+
+    def test_only_the_uris_of_the_session_are_visited(self):
+        self.manager.add_subscriber('com.example.shared', self.leaving)
+        self.manager.add_subscriber('com.example.shared', self.staying)
+        self.manager.add_subscriber('com.example.leaving', self.leaving)
+        self.manager.create_procedure('com.example.procedure', self.leaving)
+        self.manager.reserve_topic('com.example.reserved', self.leaving)
+        for n in range(100):
+            self.manager.add_subscriber('com.example.other{}'.format(n), self.staying)
+
+        visited = []
+        for uri in self.manager.uris.values():
+            disconnect = uri.disconnect
+            uri.disconnect = lambda handler, uri=uri, disconnect=disconnect: (visited.append(uri.name), disconnect(handler))
+
+        self.manager.disconnect(self.leaving)
+
+        self.assertEqual(sorted(visited), ['com.example.leaving', 'com.example.procedure', 'com.example.reserved', 'com.example.shared'])
+        self.assertNotIn('com.example.leaving', self.manager.uris)
+        self.assertNotIn('com.example.procedure', self.manager.uris)
+        self.assertNotIn('com.example.reserved', self.manager.uris)
+        self.assertEqual(list(self.manager.uris['com.example.shared'].sessions), [self.staying.sessionid])
+        self.assertNotIn(self.leaving.sessionid, self.manager.session_uris)
+
+    def test_unsubscribed_uris_are_forgotten(self):
+        self.manager.add_subscriber('com.example.topic', self.leaving)
+        self.manager.add_subscriber('com.example.topic', self.staying)
+        self.manager.remove_subscriber('com.example.topic', self.leaving)
+        self.assertEqual(self.manager.session_uris[self.leaving.sessionid], set())
+
+        self.manager.disconnect(self.staying)
+        self.assertNotIn('com.example.topic', self.manager.uris)
@@ -0,0 +1,66 @@
+"""
+The RawSocket client transport.
+"""
+import socket
+from asyncio import ensure_future
+
+import msgpack
+from tornado.iostream import IOStream
+from tornado.testing import AsyncTestCase, gen_test
+
+from wampnado.messages import Code
+from wampnado.transports.tcp import EncodedMessage, MessageType
+from wampnado.transports.tcp.client import TCPSocketClientTransport
+
+
+class RecordingClient(TCPSocketClientTransport):
+    """
+    A client that keeps the messages it is given to handle.
+    """
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.handled = []
+
+    async def handle_message(self, msg):
+        self.handled.append(msg)
+
+
+class TestClientRun(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        (router, client) = socket.socketpair()
+        self.router = IOStream(router)
+        self.client = RecordingClient(IOStream(client))
+
+    def tearDown(self):
+        self.router.close()
+        self.client.close()
+        super().tearDown()
+
+    async def accept_handshake(self):
+        await self.router.read_bytes(4)
+        await self.router.write(b'\x7f' + bytes([(15 << 4) + 2]) + b'\0\0')
+
+    @gen_test
+    async def test_ping_is_answered_and_not_handled(self):
+        run = ensure_future(self.client.run())
+        await self.accept_handshake()
+        await self.router.write(EncodedMessage(MessageType.Ping, b'abc'))
+        await self.router.write(EncodedMessage(MessageType.Regular, msgpack.packb([Code.WELCOME, 1, {}])))
+
+        pong = await self.router.read_bytes(7)
+        self.assertEqual(pong, EncodedMessage(MessageType.Pong, b'abc'))
+
+        self.router.close()
+        await run
+
+        self.assertEqual([msg.code for msg in self.client.handled], [Code.WELCOME])
+
+    @gen_test
+    async def test_unknown_frame_type_fails_the_connection(self):
+        run = ensure_future(self.client.run())
+        await self.accept_handshake()
+        await self.router.write(b'\x05\0\0\x01x')
+
+        await run
+        self.assertTrue(self.client.stream.closed())
@@ -0,0 +1,110 @@
+"""
+The RawSocket server transport.
+"""
+import socket
+from asyncio import ensure_future
+
+import msgpack
+from tornado.iostream import IOStream, StreamClosedError
+from tornado.testing import AsyncTestCase, gen_test
+
+from wampnado.agent.server import WAMPMetaServerHandler
+from wampnado.messages import Code
+from wampnado.transports.tcp import EncodedMessage, MessageType
+from wampnado.transports.tcp.server import TCPSocketServerTransport
+
+StreamHandler = TCPSocketServerTransport.factory(WAMPMetaServerHandler)
+
+
+def big():
+    return ['x' * 1000]
+
+
+class TestServerRun(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        (peer, server) = socket.socketpair()
+        self.peer = IOStream(peer)
+        self.handler = StreamHandler(IOStream(server))
+
+    def tearDown(self):
+        self.peer.close()
+        self.handler.stream.close()
+        super().tearDown()
+
+    async def start(self):
+        """
+        Runs the handler, and makes the handshake for MSGPack, accepting messages of up to 512 bytes.
+        """
+        self.run = ensure_future(self.handler.run())
+        await self.peer.write(b'\x7f' + bytes([(0 << 4) + 2]) + b'\0\0')
+        self.assertEqual((await self.peer.read_bytes(4))[0], 0x7f)
+
+    async def send(self, value):
+        await self.peer.write(EncodedMessage(MessageType.Regular, msgpack.packb(value)))
+
+    async def receive(self):
+        header = await self.peer.read_bytes(4)
+        self.assertEqual(header[0], MessageType.Regular.value)
+        return msgpack.unpackb(await self.peer.read_bytes((header[1] << 16) + (header[2] << 8) + header[3]))
+
+    async def join(self):
+        await self.send([Code.HELLO, 'test.rawsocket', {}])
+        self.assertEqual((await self.receive())[0], Code.WELCOME)
+
+    async def assert_failed(self):
+        """
+        The handler stopped, and closed its end of the connection.
+        """
+        await self.run
+        self.assertTrue(self.handler.stream.closed())
+        with self.assertRaises(StreamClosedError):
+            await self.peer.read_bytes(1)
+
+    @gen_test
+    async def test_unknown_frame_type_fails_the_connection(self):
+        await self.start()
+        await self.peer.write(b'\x05\0\0\x01x')
+        await self.assert_failed()
+
+    @gen_test
+    async def test_undecodable_message_fails_the_connection(self):
+        await self.start()
+        await self.peer.write(EncodedMessage(MessageType.Regular, b'\xc1\xc1\xc1'))
+        await self.assert_failed()
+
+    @gen_test
+    async def test_unknown_code_fails_the_connection(self):
+        await self.start()
+        await self.send([999, 1])
+        await self.assert_failed()
+
+    @gen_test
+    async def test_oversized_frame_fails_the_connection(self):
+        self.handler.max_receive_length = 1024
+        await self.start()
+        await self.peer.write(EncodedMessage(MessageType.Regular, b'\x90' * 2000))
+        await self.assert_failed()
+
+    @gen_test
+    async def test_oversized_frame_is_discarded(self):
+        self.handler.max_receive_length = 1024
+        self.handler.discard_oversized = True
+        await self.start()
+        await self.peer.write(EncodedMessage(MessageType.Regular, b'\x90' * 2000))
+
+        # The next frame is read from where it starts.
+        await self.join()
+        self.assertFalse(self.handler.stream.closed())
+
+    @gen_test
+    async def test_oversized_result_is_an_error(self):
+        await self.start()
+        await self.join()
+        self.handler.realm.create_procedure('com.example.big', big)
+
+        await self.send([Code.CALL, 1, {}, 'com.example.big'])
+        error = await self.receive()
+        self.assertEqual(error[:3], [Code.ERROR, Code.CALL, 1])
+        self.assertEqual(error[4], 'wamp.error.payload_size_exceeded')
+        self.assertFalse(self.handler.stream.closed())
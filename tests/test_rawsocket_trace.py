@@ -0,0 +1,41 @@
+"""
+Tracing of RawSocket connections.
+"""
+import socket
+
+import msgpack
+from tornado.iostream import IOStream
+from tornado.testing import AsyncTestCase, gen_test
+
+from wampnado.agent.server import WAMPMetaServerHandler
+from wampnado.messages import Code, WelcomeMessage
+from wampnado.serializer import BINARY_PROTOCOL
+from wampnado.trace import Tracer, RX, TX
+from wampnado.transports.tcp import EncodedMessage, MessageType, MAX_LENGTH
+from wampnado.transports.tcp.server import TCPSocketServerTransport
+
+
+class TestRawSocketTrace(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        (peer, server) = socket.socketpair()
+        self.peer = IOStream(peer)
+        self.handler = TCPSocketServerTransport.factory(WAMPMetaServerHandler)(IOStream(server))
+        self.handler.protocol = BINARY_PROTOCOL
+        self.handler.max_length = MAX_LENGTH
+        self.handler.tracer = Tracer(enabled=True)
+
+    def tearDown(self):
+        self.handler.on_close()
+        self.peer.close()
+        self.handler.close()
+        super().tearDown()
+
+    @gen_test
+    async def test_messages_are_traced(self):
+        await self.peer.write(EncodedMessage(MessageType.Regular, msgpack.packb([Code.HELLO, 'test.trace', {}])))
+        await self.handler.read_message()
+        self.handler.write_message(WelcomeMessage(session_id=self.handler.sessionid))
+
+        records = self.handler.tracer.records()
+        self.assertEqual([(record.direction, record.code) for record in records], [(RX, Code.HELLO), (TX, Code.WELCOME)])
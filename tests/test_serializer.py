@@ -0,0 +1,48 @@
+"""
+The serializer table, and the choice of a serializer for a session.
+"""
+import unittest
+
+from wampnado.messages import Message
+from wampnado.serializer import SERIALIZERS, RAWSOCKET_SERIALIZERS, BINARY_PROTOCOL, JSON_PROTOCOL, Serializer, register_serializer, select_protocol
+from wampnado.transports import WebSocketTransport
+from wampnado.transports.tcp import TCPSocketPeer
+
+TEST_PROTOCOL = 'wamp.2.test'
+
+
+class TestSelectProtocol(unittest.TestCase):
+    def test_preference(self):
+        supported = {BINARY_PROTOCOL: True, JSON_PROTOCOL: True}
+        self.assertEqual(select_protocol([JSON_PROTOCOL, BINARY_PROTOCOL], supported), BINARY_PROTOCOL)
+        self.assertEqual(select_protocol([JSON_PROTOCOL, 'wamp.2.unknown'], supported), JSON_PROTOCOL)
+        self.assertIsNone(select_protocol(['wamp.2.unknown'], supported))
+
+    def test_duplicate_keeps_its_first_rank(self):
+        supported = {BINARY_PROTOCOL: True, JSON_PROTOCOL: True}
+        preference = (JSON_PROTOCOL, BINARY_PROTOCOL, JSON_PROTOCOL)
+        self.assertEqual(select_protocol([BINARY_PROTOCOL, JSON_PROTOCOL], supported, preference), JSON_PROTOCOL)
+
+    def test_protocols_missing_from_preference_rank_last(self):
+        supported = {BINARY_PROTOCOL: True, JSON_PROTOCOL: True, TEST_PROTOCOL: True}
+        self.assertEqual(select_protocol([TEST_PROTOCOL, JSON_PROTOCOL], supported), JSON_PROTOCOL)
+        self.assertEqual(select_protocol([TEST_PROTOCOL], supported), TEST_PROTOCOL)
+
+
+class TestRegisterSerializer(unittest.TestCase):
+    def setUp(self):
+        self.serializer = Serializer(TEST_PROTOCOL, 15, False, lambda msg: msg.json, Message.from_text)
+        register_serializer(self.serializer)
+
+    def tearDown(self):
+        del SERIALIZERS[TEST_PROTOCOL]
+        del RAWSOCKET_SERIALIZERS[15]
+
+    def test_transports_support_later_registrations(self):
+        self.assertTrue(WebSocketTransport.supported_protocols.get(TEST_PROTOCOL))
+        self.assertTrue(TCPSocketPeer.supported_protocols.get(TEST_PROTOCOL))
+        self.assertIn(TEST_PROTOCOL, list(WebSocketTransport.supported_protocols))
+
+    def test_later_registrations_are_negotiated(self):
+        self.assertEqual(select_protocol([TEST_PROTOCOL], WebSocketTransport.supported_protocols), TEST_PROTOCOL)
+        self.assertEqual(select_protocol([TEST_PROTOCOL, BINARY_PROTOCOL], WebSocketTransport.supported_protocols), BINARY_PROTOCOL)
@@ -0,0 +1,42 @@
+"""
+The handler classes made by WAMPMetaServerHandler.factory().
+"""
+import unittest
+
+from wampnado.agent.server import WAMPMetaServerHandler
+from wampnado.messages import Code
+from wampnado.serializer import BINARY_PROTOCOL, JSON_PROTOCOL
+from wampnado.transports import WebSocketTransport
+
+
+def handler(server_cls):
+    """
+    An instance of server_cls without a connection.
+    """
+    handler = server_cls.__new__(server_cls)
+    WAMPMetaServerHandler.__init__(handler)
+    return handler
+
+
+class TestFactory(unittest.TestCase):
+    def test_preferred_protocol_defaults_to_msgpack(self):
+        server = handler(WAMPMetaServerHandler.factory(WebSocketTransport))
+        self.assertEqual(server.select_subprotocol([JSON_PROTOCOL, BINARY_PROTOCOL]), BINARY_PROTOCOL)
+
+    def test_preferred_protocol(self):
+        server = handler(WAMPMetaServerHandler.factory(WebSocketTransport, preferred_protocol=JSON_PROTOCOL))
+        self.assertEqual(server.select_subprotocol([BINARY_PROTOCOL, JSON_PROTOCOL]), JSON_PROTOCOL)
+        self.assertEqual(server.select_subprotocol([BINARY_PROTOCOL]), BINARY_PROTOCOL)
+
+    def test_dispatch_table_is_shared(self):
+        self.assertIs(WAMPMetaServerHandler.factory().dispatch, WAMPMetaServerHandler.dispatch)
+
+    def test_subclass_processors_get_their_own_dispatch_table(self):
+        def process_subscribe(message, handler):
+            return None
+
+        class Handler(WAMPMetaServerHandler):
+            processors = {**WAMPMetaServerHandler.processors, Code.SUBSCRIBE: process_subscribe}
+
+        self.assertIs(Handler.factory().dispatch[Code.SUBSCRIBE], process_subscribe)
+        self.assertIsNot(WAMPMetaServerHandler.dispatch[Code.SUBSCRIBE], process_subscribe)
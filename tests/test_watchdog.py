@@ -0,0 +1,40 @@
+"""
+IOLoop lag monitoring.
+"""
+import time
+from asyncio import sleep
+
+from tornado.testing import AsyncTestCase, gen_test
+
+from wampnado.watchdog import LoopWatchdog
+
+
+def block(seconds):
+    time.sleep(seconds)
+
+
+class TestLoopWatchdog(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.watchdog = LoopWatchdog(interval=0.01, threshold=0.05)
+        self.watchdog.loop = self.io_loop
+
+    def tearDown(self):
+        self.watchdog.stop()
+        super().tearDown()
+
+    @gen_test
+    async def test_stall_is_recorded_on_the_loop(self):
+        self.watchdog.start()
+        await sleep(0.05)
+
+        block(0.3)
+        # The watchdog thread saw the stall, but leaves it to the IOLoop to record.
+        self.assertIsNotNone(self.watchdog.stall)
+        self.assertEqual(len(self.watchdog.stalls), 0)
+
+        await sleep(0.05)
+        self.assertEqual(len(self.watchdog.stalls), 1)
+        stall = self.watchdog.stalls[0]
+        self.assertEqual(stall.culprit, 'tests.test_watchdog.test_stall_is_recorded_on_the_loop')
+        self.assertGreater(stall.duration, 0.2)
@@ -9,26 +9,75 @@ from tornado import web, ioloop
 from wampnado.agent.server import WAMPMetaServerHandler, WAMPMetaServerHandlerDebug
 from wampnado.agent.client import WAMPMetaClientHandler, WAMPMetaClientHandlerDebug
 
-from wampnado.transports import WebSocketTransport
+from wampnado.transports import WebSocketTransport, WEBSOCKET, RAWSOCKET
+from wampnado.transports.tcp.server import TCPSocketListener
+from wampnado.transports.compression import DeflateOptions
+from wampnado.metrics import MetricsHandler
+from wampnado.keepalive import keepalive
 
 
 class ApplicationServer:
-    
-    def __init__(self, path, *listener_parameters, handler_class=WAMPMetaServerHandler):
+    """
+    Serves WAMP over WebSockets at path, and over RawSocket, on every listener in listener_parameters.  All of them
+    share the same realms and IOLoop.  The router's metrics are served at metrics_path, unless it is None.  WebSockets
+    are compressed with permessage-deflate if compression, a DeflateOptions, is given.  Unless lazy is False, the args
+    and kwargs of the messages received are only decoded when they are read, and those of published events and calls
+    are forwarded as they were received.
+    """
+    def __init__(self, path, *listener_parameters, handler_class=WAMPMetaServerHandler, metrics_path='/metrics', compression=None, lazy=True):
         self.listener_parameters = listener_parameters
-        self.path_maps = [(path, handler_class.factory(WebSocketTransport))]
-
-    def run(self):
+        self.handler_class = handler_class
+        self.lazy = lazy
+        websocket_handler = handler_class.factory(WebSocketTransport)
+        websocket_handler.compression = compression
+        websocket_handler.lazy = lazy
+        self.path_maps = [(path, websocket_handler)]
+        if metrics_path is not None:
+            self.path_maps.append((metrics_path, MetricsHandler))
+        self.servers = []
+
+    def listen(self):
+        """
+        Starts listening without starting the IOLoop, for servers that are run alongside something else.
+        """
         self.app = web.Application(self.path_maps)
         for params in self.listener_parameters:
-            self.app.listen(params.port, address=params.address)
+            if getattr(params, 'transport', WEBSOCKET) == RAWSOCKET:
+                listener = TCPSocketListener(self.handler_class, ssl_options=params.ssl_options, max_message_length=params.max_message_length)
+                listener.StreamHandler.lazy = self.lazy
+                if params.port is not None:
+                    listener.listen(params.port, address=params.address)
+                if params.unix_path is not None:
+                    listener.listen_unix(params.unix_path)
+                self.servers.append(listener)
+            else:
+                self.servers.append(self.app.listen(params.port, address=params.address, ssl_options=getattr(params, 'ssl_options', None)))
+
+    def stop(self):
+        """
+        Stops accepting connections on every listener.  Open connections are left alone.
+        """
+        for server in self.servers:
+            server.stop()
+        self.servers = []
+
+    def run(self):
+        self.listen()
         ioloop.IOLoop.instance().start()
 
 
 
 class ListenerParameters:
-    def __init__(self, port=None, ssl_options=None, address='localhost', url='/ws'):
-        if port is None:
+    """
+    Where to listen, and for which transport: WEBSOCKET (the default) or RAWSOCKET.  A RawSocket listener listens on
+    port, on the Unix domain socket at unix_path, or on both, and has no default port.  max_message_length is the
+    longest message it accepts, 16 MB by default.
+    """
+    def __init__(self, port=None, ssl_options=None, address='localhost', url='/ws', transport=WEBSOCKET, unix_path=None, max_message_length=None):
+        if transport == RAWSOCKET:
+            if port is None and unix_path is None:
+                raise ValueError('A RawSocket listener needs a port or a unix_path.')
+        elif port is None:
             if ssl_options is None:
                 port = 80
             else:
@@ -38,6 +87,9 @@ class ListenerParameters:
         self.ssl_options = ssl_options
         self.address = address
         self.url=url
+        self.transport = transport
+        self.unix_path = unix_path
+        self.max_message_length = max_message_length
 
 
 def parse_args(*add_args, default_params=ListenerParameters()):
@@ -47,6 +99,14 @@ def parse_args(*add_args, default_params=ListenerParameters()):
     argparser.add_argument('-p', '--port', help="Port number.", default=default_params.port)
     argparser.add_argument('-a', '--address', help="IP address on.", default=default_params.address)
     argparser.add_argument('-u', '--url', help="URL for the WebSocket.  This should only be the path part of the URL (e.g.: /ws)", default=default_params.url)
+    argparser.add_argument('-r', '--rawsocket-port', help="Also serve RawSocket on this port.", type=int, default=None)
+    argparser.add_argument('--unix-socket', help="Also serve RawSocket on a Unix domain socket at this path.", default=None)
+    argparser.add_argument('-k', '--keepalive', help="Ping every session this often, in seconds, and close those that stop answering.", type=float, default=None)
+    argparser.add_argument('-z', '--deflate', help="Compress WebSockets with permessage-deflate, at this zlib level.", type=int, default=None)
+    argparser.add_argument('--deflate-threshold', help="Send messages shorter than this uncompressed, in bytes.", type=int, default=None)
+    argparser.add_argument('--deflate-shared', help="Compress each event once for all of its subscribers.", action='store_true', default=False)
+    argparser.add_argument('--eager', help="Decode the arguments of every message received, even those only forwarded.", action='store_true', default=False)
+    argparser.add_argument('--rawsocket-max-length', help="The longest RawSocket message accepted, in bytes.", type=int, default=None)
 
     for arg_list in add_args:
         argparser.add_argument(*(arg_list['args']), **(arg_list['kwargs']))
@@ -60,14 +120,57 @@ def parse_args(*add_args, default_params=ListenerParameters()):
 
     return url, args, debug
 
+
+def listener_parameters(args):
+    """
+    The listeners asked for by the arguments from parse_args(): the WebSocket one, and the RawSocket one, if a RawSocket
+    port or Unix domain socket was given.  These are taken out of args.
+    """
+    rawsocket_port = args.rawsocket_port
+    unix_socket = args.unix_socket
+    max_length = args.rawsocket_max_length
+    del args.rawsocket_port
+    del args.unix_socket
+    del args.rawsocket_max_length
+
+    listeners = [args]
+    if rawsocket_port is not None or unix_socket is not None:
+        listeners.append(ListenerParameters(port=rawsocket_port, address=args.address, transport=RAWSOCKET, unix_path=unix_socket, max_message_length=max_length))
+    return listeners
+
+def compression_options(args):
+    """
+    The DeflateOptions asked for by the arguments from parse_args(), or None.  These are taken out of args.
+    """
+    (level, threshold, shared) = (args.deflate, args.deflate_threshold, args.deflate_shared)
+    del args.deflate
+    del args.deflate_threshold
+    del args.deflate_shared
+
+    if level is None:
+        return None
+    options = DeflateOptions(level=level, shared=shared)
+    if threshold is not None:
+        options.threshold = threshold
+    return options
+
 # Called during regular execution.
 def main():
     url, args, debug = parse_args()
+    keepalive_interval = args.keepalive
+    del args.keepalive
+    compression = compression_options(args)
+    lazy = not args.eager
+    del args.eager
+    listeners = listener_parameters(args)
+
+    if keepalive_interval is not None:
+        keepalive.start(interval=keepalive_interval)
 
     if debug:
-        server = ApplicationServer(url, args, handler_class=WAMPMetaServerHandlerDebug)
+        server = ApplicationServer(url, *listeners, handler_class=WAMPMetaServerHandlerDebug, compression=compression, lazy=lazy)
     else:
-        server = ApplicationServer(url, args)
+        server = ApplicationServer(url, *listeners, compression=compression, lazy=lazy)
     server.run()
 
 if __name__ == "__main__":
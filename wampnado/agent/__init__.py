@@ -2,84 +2,147 @@
 Code common to clients and servers.
 """
 from inspect import isawaitable
+from time import perf_counter
+from warnings import warn
 
 from tornado.websocket import WebSocketClosedError
 
-from wampnado.messages import Code, AbortMessage
-from wampnado.processors import AbortProcessor, UnhandledProcessor, GoodbyeProcessor, ErrorProcessor, HelloProcessor, rpc, pubsub
-from wampnado.serializer import JSON_PROTOCOL, BINARY_PROTOCOL, NONE_PROTOCOL
-from wampnado.messages import Message
+from wampnado.messages import Code, AbortMessage, SplicedMessage
+from wampnado.processors import process_abort, process_goodbye, process_error, dispatch_table
+from wampnado.uri.error import WAMPException, WAMPSimpleException
+from wampnado.serializer import NONE_PROTOCOL, SERIALIZERS
+from wampnado.trace import tracer, RX, TX
+from wampnado.profiling import profiler
+from wampnado.keepalive import keepalive
+from wampnado.metrics import messages_received, messages_sent, message_errors, bytes_received, bytes_sent, serialize_seconds, deserialize_seconds
 
 class WAMPAgent:
     """
     Class the describes methods common to both clients and servers.  Incomplete in and of itself.
     """
     processors = {
-        Code.ABORT: AbortProcessor,
-        Code.GOODBYE: GoodbyeProcessor,
-        Code.ERROR: ErrorProcessor,
-
-        # Server:
-        #Code.HELLO: HelloProcessor,
-        #Code.SUBSCRIBE: pubsub.SubscribeProcessor,
-        #Code.PUBLISH: pubsub.PublishProcessor,
-        #Code.YIELD: rpc.YieldProcessor,
-        #Code.CALL: rpc.CallProcessor,
-        #Code.REGISTER: rpc.RegisterProcessor,
-
+        Code.ABORT: process_abort,
+        Code.GOODBYE: process_goodbye,
+        Code.ERROR: process_error,
     }
 
+    # The processors above, flattened into a list indexed by message code.  Shared by every instance of the class.
+    dispatch = dispatch_table(processors)
+
+    def __init_subclass__(cls, **kwargs):
+        """
+        Builds the dispatch table of a subclass that has processors of its own but no dispatch table for them, once for
+        the class.
+        """
+        super().__init_subclass__(**kwargs)
+        if 'processors' in cls.__dict__ and 'dispatch' not in cls.__dict__:
+            cls.dispatch = dispatch_table(cls.processors)
+
+    # Checked once per message sent or received.  See wampnado.trace.
+    tracer = tracer
+
+    # Checked once per message handled.  See wampnado.profiling.
+    profiler = profiler
+
+    # Pings the sessions added to it, and closes the dead ones.  See wampnado.keepalive.
+    keepalive = keepalive
+
+    # Whether the transport wants SplicedMessages along with their serialization, to compress their shared part once.
+    # See WebSocketTransport.write_message().
+    splices = False
+
+    # Whether the args and kwargs of the messages received are only decoded when they are read, so that those that are
+    # only forwarded are never decoded.  See PayloadMessage.
+    lazy = True
+
+    def set_processor(self, code, processor):
+        """
+        Overrides the processor of a message code for this connection only.  The shared dispatch table is copied the
+        first time this is called, and the copy is used from then on.
+        """
+        if 'dispatch' not in self.__dict__:
+            self.dispatch = list(type(self).dispatch)
+        self.dispatch[code] = processor
+
 
     def write_message(self, msg):
         """
-        Reads a message to the WebSocket in the format selected for it.
+        Writes a message to the WebSocket in the format selected for it.
         """
-        if self.protocol == JSON_PROTOCOL:
-            return super().write_message(msg.json)
-        elif self.protocol == BINARY_PROTOCOL:
-            return super().write_message(msg.msgpack, binary=True)
-        elif self.protocol == NONE_PROTOCOL:
+        if self.tracer.enabled:
+            self.tracer.trace(TX, self, msg)
+        messages_sent.inc(msg.code)
+
+        if self.protocol == NONE_PROTOCOL:
             return super().write_message(msg)
-        else:
+
+        serializer = SERIALIZERS.get(self.protocol)
+        if serializer is None:
             warn('unknown protocol ' + self.protocol)
+            return None
+
+        start = perf_counter()
+        data = serializer.encode(msg)
+        serialize_seconds.observe(perf_counter() - start, self.protocol)
+        bytes_sent.add(len(data), self.transport_name)
+        if self.splices and serializer.parts is not None and type(msg) is SplicedMessage:
+            return super().write_message(data, binary=serializer.binary, spliced=msg)
+        return super().write_message(data, binary=serializer.binary)
 
     def read_message(self, txt):
         """
         Reads a message in whatever format is selected for the WebSocket.
         """
-        if self.protocol == JSON_PROTOCOL:
-            return Message.from_text(txt)
-        elif self.protocol == BINARY_PROTOCOL:
-            return Message.from_bin(txt)
-        elif self.protocol == NONE_PROTOCOL:
+        if self.protocol == NONE_PROTOCOL:
             # If we're using NONE_PROTOCOL, txt is actually just the message.
-            return txt
+            msg = txt
         else:
-            warn('unknown protocol ' + self.protocol)
+            serializer = SERIALIZERS.get(self.protocol)
+            if serializer is None:
+                warn('unknown protocol ' + self.protocol)
+                return None
 
-    async def handle_message(self, msg):
-        Processor = self.processors.get(msg.code, UnhandledProcessor)
-        processor = Processor(msg, self)
+            start = perf_counter()
+            msg = serializer.decoder(self.lazy)(txt)
+            deserialize_seconds.observe(perf_counter() - start, self.protocol)
+            bytes_received.add(len(txt), self.transport_name)
 
-        #if self.connection and not self.connection.zombie:  # TODO: cover branch else
-        answer = processor.answer_message
-        if isawaitable(answer):
-            answer = await answer
-        if answer is not None:
-            print(type(self))
-            self.write_message(answer)
+        if self.tracer.enabled:
+            self.tracer.trace(RX, self, msg)
+        return msg
 
-        self.broadcast_messages(processor)
+    async def handle_message(self, msg):
+        """
+        Routes a message to its processor, and sends back the answer, if any.
+        """
+        messages_received.inc(msg.code)
+        try:
+            if self.profiler.enabled:
+                answer = self.profiler.run(self.dispatch[msg.code], msg, self)
+            else:
+                answer = self.dispatch[msg.code](msg, self)
+            if isawaitable(answer):
+                answer = await answer
+        except WAMPException as e:
+            message_errors.inc(msg.code)
+            answer = e.message()
 
-        if processor.must_close:
-            self.on_close(processor.close_code, processor.close_reason)
+        if answer is not None:
+            try:
+                self.write_message(answer)
+            except WAMPSimpleException as e:
+                # The answer could not be sent, most likely because it is longer than the peer accepts.
+                request_id = getattr(msg, 'request_id', None)
+                if request_id is None:
+                    raise
+                message_errors.inc(msg.code)
+                self.write_message(e.to_exception(msg.code, request_id).message())
 
     async def on_message(self, txt):
         """
         Handle incoming messages on the WebSocket. Each message will be parsed
-        and handled by a Processor, which can be (re)defined by the user
-        changing the value of 'processors' dict, available at
-        wampnado.customize module.
+        and handled by a processor, which can be (re)defined by the user
+        changing the value of the 'processors' dict.
         """
         try:
             msg = self.read_message(txt)
@@ -88,6 +151,29 @@ class WAMPAgent:
             warn('closed connection {} due to {}'.format(self.sessionid, e))
             self.on_close()
 
+    @property
+    def rtt(self):
+        """
+        The round trip time of the last keepalive ping, in seconds, or None.
+        """
+        return self.keepalive.rtt(self)
+
+    def on_pong(self, data=b''):
+        """
+        Called by the transport when a ping is answered.
+        """
+        self.keepalive.pong(self)
+
+    def on_close(self):
+        """
+        Called once the connection is closed.  Passed on to the transport, if it has an on_close() of its own, like
+        WebSockets do.  RawSocket transports don't.
+        """
+        self.keepalive.remove(self)
+        on_close = getattr(super(), 'on_close', None)
+        if on_close is not None:
+            on_close()
+
     def abort(self, handler, error_msg, details, reason=None):
         """
         Used to abort a connection while the user is trying to establish it.
@@ -5,17 +5,17 @@ from inspect import isawaitable
 from warnings import warn
 from datetime import datetime
 from asyncio import Future
-from copy import deepcopy
 
 from tornado.websocket import WebSocketClosedError
 
-from wampnado.identifier import create_global_id
+from wampnado.identifier import random_id
 from wampnado.realm import get_realm
 from wampnado.uri.error import WAMPSimpleException
 from wampnado.agent import WAMPAgent
+from wampnado.trace import debug_tracer
 from wampnado.transports.tcp.client import TCPConnectorClient, TCPSocketClientTransport
 from wampnado.messages import AbortMessage, Code, Message, SubscribeMessage, RPCRegisterMessage, CallMessage, WelcomeMessage, HelloMessage
-from wampnado.processors import AbortProcessor, ClientErrorProcessor, UnhandledProcessor, GoodbyeProcessor, WelcomeProcessor, pubsub, rpc
+from wampnado.processors import process_client_error, process_welcome, dispatch_table, pubsub, rpc
 from wampnado.serializer import JSON_PROTOCOL, BINARY_PROTOCOL, NONE_PROTOCOL
 from wampnado.features import client_features
 
@@ -39,11 +39,28 @@ class WAMPMetaClientHandler(WAMPAgent):
     A metaclass for client handlers.  Any client, regardless of the transport, is responsible for
     establishing a connection, which then creates an object for handling the connection.
     """
+    # Add the messages handlers that only the client responds to.  Like the dispatch table built from them, this is
+    # shared by every connection.  See WAMPAgent.set_processor() for per-connection overrides.
+    processors = {
+        **WAMPAgent.processors,
+        **{
+            Code.WELCOME: process_welcome,
+            Code.ERROR: process_client_error,
+            Code.REGISTERED: rpc.process_registered,
+            Code.INVOCATION: rpc.process_invocation,
+            Code.RESULT: rpc.process_result,
+            Code.SUBSCRIBED: pubsub.process_subscribed,
+            Code.PUBLISHED: pubsub.process_published,
+            Code.EVENT: pubsub.process_event,
+        }
+    }
+    dispatch = dispatch_table(processors)
+
     @classmethod
     def factory(cls, *args, connector_cls=TCPConnectorClient, connector_init_args=[], connector_init_kwargs={},
         client_cls=TCPSocketClientTransport, **kwargs):
         """
-        Makes a class to handle the specified transport.
+        Makes a class to handle the specified transport, and returns a connector making connections with it.
         """
         class Client(client_cls, cls):
             def __init__(self, stream, *args, **kwargs):
@@ -70,19 +87,6 @@ class WAMPMetaClientHandler(WAMPAgent):
         self.registrations = {}
         self.requests = {}
 
-        # Add the messages handlers that only the server responds to.
-        self.processors = {
-            **deepcopy(super().processors),
-            **{
-                Code.ERROR: ClientErrorProcessor,
-                Code.REGISTERED: rpc.RegisteredProcessor,
-                Code.INVOCATION: rpc.InvokeProcessor,
-                Code.SUBSCRIBED: pubsub.SubscribedProcessor,
-                Code.PUBLISHED: pubsub.PublishedProcessor,
-                Code.EVENT: pubsub.EventProcessor,
-            }
-        }
-
     def register_subscription(self, request_id, subscription_id):
         """
         Called when a SUBSCRIBED message is received.  Checks that the subscription was requested, and then adds it.
@@ -119,7 +123,7 @@ class WAMPMetaClientHandler(WAMPAgent):
         await self.requests[msg.request_id]
 
     async def call(self, uri_name, callback=None, *args, options={}, include_uri=False, **kwargs):
-        request_id = create_global_id()
+        request_id = random_id()
         msg = CallMessage(procedure=uri_name, request_id=request_id, options=options, args=args, kwargs=kwargs)
         self.requests[request_id]=Registration(uri_name, callback=callback, include_uri=include_uri)
         self.write_message(msg)
@@ -166,20 +170,6 @@ class WAMPMetaClientHandler(WAMPAgent):
         self.write_message(hello_message)
 
 
-
-
-    def broadcast_messages(self, processor):
-        """
-        """
-        for msg in processor.broadcast_messages:
-            uri = self.realm.get(msg.uri_name)
-
-            # Only publish if there is someone listening.
-            if uri is not None:
-                uri.publish(self, msg)
-
-
-
 class WAMPMetaClientHandlerDebug(WAMPMetaClientHandler):
     """
     A metaclass for handlers.  Call the factory (inside the parent class)
@@ -187,16 +177,15 @@ class WAMPMetaClientHandlerDebug(WAMPMetaClientHandler):
     that can be instantiated by Tornado's IOloop using that transport.
 
     WAMPMetaHandlerDebug.factory(WebSocketHandler)
+
+    Every message sent or received is traced to STDOUT by wampnado.trace.debug_tracer.  The messages are buffered
+    and written in batches from the IOLoop, rather than printed one at a time.
     """
-    def write_message(self, msg):
-        result = super().write_message(msg)
-        print('tx|' + str(self.realm_id) + '|: ' + msg.json)
-        return result
-
-    def read_message(self, txt):
-        message = super().read_message(txt)
-        print('rx|' + str(self.realm_id) + '|: ' + message.json)
-        return message
+    tracer = debug_tracer
+
+    def __init__(self, stream, *args, **kwargs):
+        super().__init__(stream, *args, **kwargs)
+        self.tracer.sink.start()
 
 
 
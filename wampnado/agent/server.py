@@ -3,14 +3,14 @@ Classes for WAMP router/servers.
 """
 
 from warnings import warn
-from copy import deepcopy
 
-from wampnado.identifier import create_global_id
+from wampnado.identifier import create_global_id, release_global_id
 from wampnado.realm import get_realm
 from wampnado.agent import WAMPAgent
+from wampnado.trace import debug_tracer
 from wampnado.transports import WebSocketTransport
 from wampnado.messages import AbortMessage, Code, Message
-from wampnado.processors import AbortProcessor, HelloProcessor, UnhandledProcessor, GoodbyeProcessor, pubsub, rpc
+from wampnado.processors import process_hello, dispatch_table, pubsub, rpc
 from wampnado.serializer import JSON_PROTOCOL, BINARY_PROTOCOL, NONE_PROTOCOL
 
 class WAMPMetaServerHandler(WAMPAgent):
@@ -24,50 +24,62 @@ class WAMPMetaServerHandler(WAMPAgent):
 
     WAMPMetaHandler.factory()
     """
+    # Add the messages handlers that only the server responds to.  Like the dispatch table built from them, this is
+    # shared by every connection.  See WAMPAgent.set_processor() for per-connection overrides.
+    processors = {
+        **WAMPAgent.processors,
+        **{
+            Code.HELLO: process_hello,
+            Code.SUBSCRIBE: pubsub.process_subscribe,
+            Code.PUBLISH: pubsub.process_publish,
+            Code.YIELD: rpc.process_yield,
+            Code.CALL: rpc.process_call,
+            Code.REGISTER: rpc.process_register,
+        }
+    }
+    dispatch = dispatch_table(processors)
+
+    # The serializer picked first when a WebSocket client offers it.  See WebSocketTransport.select_subprotocol().
+    preferred_protocol = BINARY_PROTOCOL
+
     @classmethod
-    def factory(cls, transport_cls=WebSocketTransport, transport_init_args=[], transport_init_kwargs={}):
+    def factory(cls, transport_cls=WebSocketTransport, transport_init_args=[], transport_init_kwargs={}, preferred_protocol=None):
         """
-        Makes a class to handle the specified transport.
+        Makes a class to handle the specified transport.  Its connections prefer preferred_protocol, if given, over the
+        preferred_protocol of cls.
         """
         class Server(cls, transport_cls):
             def __init__(self, *args, **kwargs):
-                super(cls, self).__init__(*args, **kwargs)
-                super(transport_cls, self).__init__(*args, *transport_init_args, **kwargs, **transport_init_kwargs)
+                transport_cls.__init__(self, *args, *transport_init_args, **kwargs, **transport_init_kwargs)
+                cls.__init__(self)
 
+        if preferred_protocol is not None:
+            Server.preferred_protocol = preferred_protocol
         return Server
 
 
-    def __init__(self, *args, preferred_protocol=BINARY_PROTOCOL, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.preferred_protocol = preferred_protocol
+    def __init__(self, preferred_protocol=None):
+        if preferred_protocol is not None:
+            self.preferred_protocol = preferred_protocol
         self.sessionid = create_global_id()
+        self.realm = None
         self.realm_id = 'unset'
         self.authid = None
         self.authrole = 'anonymous'
         self.authmethod = 'anonymous'
- 
-        # Add the messages handlers that only the server responds to.
-        self.processors = {
-            **deepcopy(super().processors),
-            **{
-                Code.HELLO: HelloProcessor,
-                Code.SUBSCRIBE: pubsub.SubscribeProcessor,
-                Code.PUBLISH: pubsub.PublishProcessor,
-                Code.YIELD: rpc.YieldProcessor,
-                Code.CALL: rpc.CallProcessor,
-                Code.REGISTER: rpc.RegisterProcessor,
-            }
-        }
 
     def on_close(self):
         """
         Overrides the base class to clean up our connections and registrations.
         """
-        self.realm.disconnect(self)
-        self.realm.deregister_handler(self.realm_id)
+        # The connection may close before it ever said HELLO.
+        if self.realm is not None:
+            self.realm.disconnect(self)
+            self.realm.deregister_handler(self.realm_id)
         
         # This is a meta-class, so we're assuming that we have a parent class, even if it isn't listed.
         super().on_close()
+        release_global_id(self.sessionid)
 
     def attach_realm(self, name, hello_message=None):
         """
@@ -76,21 +88,12 @@ class WAMPMetaServerHandler(WAMPAgent):
         """
         self.realm = get_realm(name)
         self.realm_id = self.realm.register_handler(self)
+        if self.keepalive.enabled:
+            self.keepalive.add(self)
 
         # Track the handshake information.
         self.hello_message=hello_message
 
-    def broadcast_messages(self, processor):
-        """
-        """
-        for msg in processor.broadcast_messages:
-            uri = self.realm.get(msg.uri_name)
-
-            # Only publish if there is someone listening.
-            if uri is not None:
-                uri.publish(self, msg)
-
-
 
 class WAMPMetaServerHandlerDebug(WAMPMetaServerHandler):
     """
@@ -99,13 +102,12 @@ class WAMPMetaServerHandlerDebug(WAMPMetaServerHandler):
     that can be instantiated by Tornado's IOloop using that transport.
 
     WAMPMetaHandlerDebug.factory(WebSocketHandler)
+
+    Every message sent or received is traced to STDOUT by wampnado.trace.debug_tracer.  The messages are buffered
+    and written in batches from the IOLoop, rather than printed one at a time.
     """
-    def write_message(self, msg):
-        result = super().write_message(msg)
-        print('tx|' + str(self.realm_id) + '|: ' + msg.json)
-        return result
-
-    def read_message(self, txt):
-        message = super().read_message(txt)
-        print('rx|' + str(self.realm_id) + '|: ' + message.json)
-        return message
+    tracer = debug_tracer
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tracer.sink.start()
@@ -0,0 +1,123 @@
+"""
+Benchmarks for wampnado: publish fan-out, CALL latency, connect/disconnect rate and memory per session, over
+WebSocket, RawSocket over TCP and RawSocket over a Unix domain socket, with JSON, MessagePack, and CBOR and UBJSON if
+they are installed, plus micro-benchmarks of message handling without any transport.
+
+    python -m wampnado.bench --quick --output results.json
+
+The results are written as JSON, one record per benchmark, transport and serializer, so that runs can be compared
+between releases.  A benchmark that fails is recorded with its error rather than stopping the run.
+"""
+import json
+import platform
+import sys
+from argparse import ArgumentParser
+from asyncio import wait_for
+from datetime import datetime
+from time import perf_counter
+
+from tornado import ioloop
+
+from wampnado.bench.client import CLIENTS, SERIALIZERS
+from wampnado.bench.router import BenchRouter, SubprocessRouter, BENCH_HOST, BENCH_WS_PORT, BENCH_RS_PORT, BENCH_UNIX_PATH
+from wampnado.bench.scenarios import NETWORK_BENCHMARKS, MICRO_BENCHMARKS, QUICK_PARAMETERS
+
+# How long a single network benchmark may run, in seconds.
+BENCHMARK_TIMEOUT = 120
+
+
+def run_micro(name, serializer, parameters):
+    result = {'benchmark': name, 'transport': None, 'serializer': serializer, 'parameters': parameters}
+    try:
+        result.update(MICRO_BENCHMARKS[name](serializer, **parameters))
+    except Exception as e:
+        result['error'] = repr(e)
+    return result
+
+
+async def run_network(name, router, transport, serializer, parameters, timeout=BENCHMARK_TIMEOUT):
+    result = {'benchmark': name, 'transport': transport, 'serializer': serializer, 'parameters': parameters}
+    try:
+        result.update(await wait_for(NETWORK_BENCHMARKS[name](router, transport, serializer, **parameters), timeout))
+    except Exception as e:
+        result['error'] = repr(e)
+    return result
+
+
+async def run_suite(benchmarks=None, transports=None, serializers=None, subprocess=False, quick=False,
+    timeout=BENCHMARK_TIMEOUT, host=BENCH_HOST, ws_port=BENCH_WS_PORT, rs_port=BENCH_RS_PORT, unix_path=BENCH_UNIX_PATH):
+    """
+    Runs the named benchmarks (all of them by default) over every combination of transports and serializers, and
+    returns the report.
+    """
+    benchmarks = benchmarks or list(MICRO_BENCHMARKS) + list(NETWORK_BENCHMARKS)
+    transports = transports or list(CLIENTS)
+    serializers = serializers or list(SERIALIZERS)
+
+    def parameters(name):
+        return dict(QUICK_PARAMETERS.get(name, {})) if quick else {}
+
+    results = []
+    start = perf_counter()
+
+    for name in benchmarks:
+        if name in MICRO_BENCHMARKS:
+            results.extend(run_micro(name, serializer, parameters(name)) for serializer in serializers)
+
+    network = [name for name in benchmarks if name in NETWORK_BENCHMARKS]
+    if network:
+        router = (SubprocessRouter if subprocess else BenchRouter)(host, ws_port, rs_port, unix_path)
+        await router.start()
+        try:
+            for name in network:
+                for transport in transports:
+                    for serializer in serializers:
+                        results.append(await run_network(name, router, transport, serializer, parameters(name), timeout))
+        finally:
+            await router.stop()
+
+    return {
+        'meta': {
+            'started': datetime.utcnow().isoformat() + 'Z',
+            'seconds': perf_counter() - start,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'router': 'subprocess' if subprocess else 'in-process',
+            'quick': quick,
+        },
+        'results': results,
+    }
+
+
+def parse_args(argv=None):
+    benchmarks = list(MICRO_BENCHMARKS) + list(NETWORK_BENCHMARKS)
+    argparser = ArgumentParser(description='Run the wampnado benchmarks.')
+    argparser.add_argument('-b', '--benchmark', action='append', choices=benchmarks, help='Benchmark to run.  May be repeated.  Defaults to all of them.')
+    argparser.add_argument('-t', '--transport', action='append', choices=list(CLIENTS), help='Transport to use.  May be repeated.  Defaults to all of them.')
+    argparser.add_argument('-s', '--serializer', action='append', choices=list(SERIALIZERS), help='Serializer to use.  May be repeated.  Defaults to all of them.')
+    argparser.add_argument('--subprocess', action='store_true', default=False, help='Run the router in a subprocess.')
+    argparser.add_argument('--quick', action='store_true', default=False, help='Use small parameters, for a quick run.')
+    argparser.add_argument('--timeout', type=float, default=BENCHMARK_TIMEOUT, help='Seconds a single network benchmark may run.')
+    argparser.add_argument('--host', default=BENCH_HOST)
+    argparser.add_argument('--ws-port', type=int, default=BENCH_WS_PORT)
+    argparser.add_argument('--rs-port', type=int, default=BENCH_RS_PORT)
+    argparser.add_argument('--unix-path', default=BENCH_UNIX_PATH, help='The Unix domain socket for RawSocket.')
+    argparser.add_argument('-o', '--output', help='File to write the results to.  Defaults to STDOUT.')
+    return argparser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = ioloop.IOLoop.current().run_sync(lambda: run_suite(
+        benchmarks=args.benchmark, transports=args.transport, serializers=args.serializer, subprocess=args.subprocess,
+        quick=args.quick, timeout=args.timeout, host=args.host, ws_port=args.ws_port, rs_port=args.rs_port,
+        unix_path=args.unix_path,
+    ))
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
@@ -0,0 +1,3 @@
+from wampnado.bench import main
+
+main()
@@ -0,0 +1,123 @@
+"""
+Load-generating clients.  They speak WAMP with the library's own message classes and serializers, but keep no state
+beyond the connection, so that the time spent in the client is as small and as predictable as possible.
+"""
+from tornado.tcpclient import TCPClient
+from tornado.websocket import websocket_connect
+
+from wampnado.messages import HelloMessage, GoodbyeMessage
+from wampnado.serializer import JSON_PROTOCOL, BINARY_PROTOCOL, CBOR_PROTOCOL, UBJSON_PROTOCOL, SERIALIZERS as PROTOCOL_SERIALIZERS
+from wampnado.transports import WEBSOCKET, RAWSOCKET
+from wampnado.transports.tcp.client import TCPSocketClientTransport, UnixConnectorClient
+
+RAWSOCKET_UNIX = 'rawsocket-unix'
+
+# The serializers, by the names used in benchmark results.  CBOR and UBJSON are only there if they are installed.
+SERIALIZERS = {
+    name: protocol
+    for (name, protocol) in (('json', JSON_PROTOCOL), ('msgpack', BINARY_PROTOCOL), ('cbor', CBOR_PROTOCOL), ('ubjson', UBJSON_PROTOCOL))
+    if protocol in PROTOCOL_SERIALIZERS
+}
+
+
+class BenchClient(object):
+    """
+    A connection to a BenchRouter.  Subclasses implement the transport.
+    """
+    def __init__(self, router, serializer='msgpack'):
+        self.router = router
+        self.serializer = serializer
+        self.protocol = SERIALIZERS[serializer]
+        self.codec = PROTOCOL_SERIALIZERS[self.protocol]
+        self.sessionid = None
+
+    async def join(self, realm):
+        """
+        Connects and opens a session on realm.  Returns the session id.
+        """
+        await self.connect()
+        self.send(HelloMessage(realm=realm, details={}))
+        welcome = await self.receive()
+        self.sessionid = welcome.session_id
+        return self.sessionid
+
+    async def leave(self):
+        """
+        Closes the session, then the connection.
+        """
+        self.send(GoodbyeMessage(reason='wamp.close.normal'))
+        await self.receive()
+        self.close()
+
+    async def request(self, msg):
+        """
+        Sends a message and returns the next one received.
+        """
+        self.send(msg)
+        return await self.receive()
+
+
+class WebSocketBenchClient(BenchClient):
+    transport = WEBSOCKET
+
+    async def connect(self):
+        self.connection = await websocket_connect(self.router.ws_url, subprotocols=[self.protocol])
+
+    def send(self, msg):
+        self.connection.write_message(self.codec.encode(msg), binary=self.codec.binary)
+
+    async def receive(self):
+        data = await self.connection.read_message()
+        if data is None:
+            raise ConnectionError('connection closed by the router')
+        return self.codec.decode(data)
+
+    def close(self):
+        self.connection.close()
+
+
+class RawSocketBenchClient(BenchClient):
+    transport = RAWSOCKET
+
+    async def connect(self):
+        stream = await TCPClient().connect(self.router.host, self.router.rs_port)
+        await self.handshake(TCPSocketClientTransport(stream))
+
+    async def handshake(self, connection):
+        self.connection = connection
+        if not await self.connection.handshake(self.protocol):
+            raise ConnectionError('RawSocket handshake failed')
+
+    def send(self, msg):
+        self.connection.write_message(msg)
+
+    async def receive(self):
+        while True:
+            # Pings and pongs are answered by the transport, and come back as None.
+            msg = await self.connection.read_message()
+            if msg is not None:
+                return msg
+
+    def close(self):
+        self.connection.close()
+
+
+class UnixRawSocketBenchClient(RawSocketBenchClient):
+    """
+    RawSocket over the router's Unix domain socket, to compare with RawSocket over TCP loopback.
+    """
+    transport = RAWSOCKET_UNIX
+
+    async def connect(self):
+        await self.handshake(await UnixConnectorClient(self.router.unix_path).connect())
+
+
+CLIENTS = {
+    WEBSOCKET: WebSocketBenchClient,
+    RAWSOCKET: RawSocketBenchClient,
+    RAWSOCKET_UNIX: UnixRawSocketBenchClient,
+}
+
+
+def bench_client(router, transport, serializer):
+    return CLIENTS[transport](router, serializer)
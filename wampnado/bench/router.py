@@ -0,0 +1,148 @@
+"""
+The router under test.  It is either run in the benchmarking process (BenchRouter) or in a subprocess of its own
+(SubprocessRouter), which keeps the cost of the clients out of its measurements and lets its memory be measured on
+its own.
+
+    python -m wampnado.bench.router --ws-port 18000 --rs-port 18001 --unix-path /tmp/wampnado-bench.sock
+"""
+import os
+import sys
+import tempfile
+from argparse import ArgumentParser
+from asyncio import sleep
+from subprocess import Popen
+from time import monotonic
+
+from tornado import ioloop
+from tornado.iostream import StreamClosedError
+from tornado.tcpclient import TCPClient
+
+from wampnado.transports.tcp.client import UnixConnectorClient
+
+from wampnado import ApplicationServer, ListenerParameters
+from wampnado.agent.server import WAMPMetaServerHandler
+from wampnado.transports import RAWSOCKET
+
+BENCH_HOST = '127.0.0.1'
+BENCH_WS_PORT = 18000
+BENCH_RS_PORT = 18001
+BENCH_WS_PATH = '/ws'
+BENCH_UNIX_PATH = os.path.join(tempfile.gettempdir(), 'wampnado-bench.sock')
+
+# How long to wait for a subprocess router to accept connections, in seconds.
+STARTUP_TIMEOUT = 10
+
+
+class BenchRouter(object):
+    """
+    A router listening for WebSocket connections on ws_port, and RawSocket connections on rs_port and on the Unix domain
+    socket at unix_path, in this process.
+    """
+    pid = None
+
+    def __init__(self, host=BENCH_HOST, ws_port=BENCH_WS_PORT, rs_port=BENCH_RS_PORT, unix_path=BENCH_UNIX_PATH, handler_class=WAMPMetaServerHandler):
+        self.host = host
+        self.ws_port = ws_port
+        self.rs_port = rs_port
+        self.unix_path = unix_path
+        self.handler_class = handler_class
+        self.server = None
+
+    @property
+    def ws_url(self):
+        return 'ws://{}:{}{}'.format(self.host, self.ws_port, BENCH_WS_PATH)
+
+    async def start(self):
+        self.server = ApplicationServer(
+            BENCH_WS_PATH,
+            ListenerParameters(port=self.ws_port, address=self.host),
+            ListenerParameters(port=self.rs_port, address=self.host, transport=RAWSOCKET, unix_path=self.unix_path),
+            handler_class=self.handler_class,
+        )
+        self.server.listen()
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.stop()
+            remove_socket(self.unix_path)
+
+
+class SubprocessRouter(BenchRouter):
+    """
+    A router run by `python -m wampnado.bench.router` in a subprocess.  start() returns once both ports and the Unix
+    domain socket accept connections.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.process = None
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process is not None else None
+
+    async def start(self):
+        self.process = Popen([
+            sys.executable, '-m', 'wampnado.bench.router',
+            '--host', self.host, '--ws-port', str(self.ws_port), '--rs-port', str(self.rs_port),
+            '--unix-path', self.unix_path,
+        ])
+        deadline = monotonic() + STARTUP_TIMEOUT
+        for port in (self.ws_port, self.rs_port, None):
+            while True:
+                try:
+                    if port is None:
+                        transport = await UnixConnectorClient(self.unix_path).connect()
+                        transport.close()
+                    else:
+                        stream = await TCPClient().connect(self.host, port)
+                        stream.close()
+                    break
+                except (OSError, StreamClosedError):
+                    if monotonic() > deadline or self.process.poll() is not None:
+                        raise RuntimeError('router subprocess did not start')
+                    await sleep(0.05)
+
+    async def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+            remove_socket(self.unix_path)
+
+
+def remove_socket(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def resident_memory(pid):
+    """
+    The resident set size of a process, in bytes, or None where /proc is not available.
+    """
+    try:
+        with open('/proc/{}/status'.format(pid)) as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+
+
+def main():
+    argparser = ArgumentParser(description='Run a router for wampnado.bench.')
+    argparser.add_argument('--host', default=BENCH_HOST)
+    argparser.add_argument('--ws-port', type=int, default=BENCH_WS_PORT)
+    argparser.add_argument('--rs-port', type=int, default=BENCH_RS_PORT)
+    argparser.add_argument('--unix-path', default=BENCH_UNIX_PATH)
+    args = argparser.parse_args()
+
+    router = BenchRouter(args.host, args.ws_port, args.rs_port, args.unix_path)
+    loop = ioloop.IOLoop.current()
+    loop.run_sync(router.start)
+    loop.start()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+"""
+The benchmarks.  Network benchmarks are coroutines taking the router, transport and serializer to use, micro-benchmarks
+are plain functions taking the serializer.  Both take their parameters as keyword arguments, and return a dict of
+measurements, which the runner merges with the parameters into a single result.
+"""
+import gc
+import tracemalloc
+from asyncio import gather
+from time import perf_counter
+from timeit import Timer
+
+from wampnado.agent.server import WAMPMetaServerHandler
+from wampnado.bench.client import bench_client, SERIALIZERS
+from wampnado.bench.router import resident_memory
+from wampnado.messages import Code, EventMessage, CallMessage, PublishMessage, SubscribeMessage, RPCRegisterMessage, YieldMessage
+from wampnado.metrics import LatencyHistogram
+from wampnado.serializer import SERIALIZERS as PROTOCOL_SERIALIZERS
+
+BENCH_REALM = 'bench'
+BENCH_TOPIC = 'bench.topic'
+BENCH_PROCEDURE = 'bench.echo'
+
+
+async def joined_clients(router, transport, serializer, count, realm=BENCH_REALM):
+    """
+    count clients joined to a realm of their own for transport and serializer, so that a run is not disturbed by the
+    sessions of the one before it, which the router may not have closed yet.
+    """
+    realm = '{}.{}.{}'.format(realm, transport, serializer)
+    clients = [bench_client(router, transport, serializer) for _ in range(count)]
+    await gather(*(client.join(realm) for client in clients))
+    return clients
+
+
+def close_all(clients):
+    for client in clients:
+        client.close()
+
+
+async def fanout(router, transport, serializer, subscribers=100, events=1000, payload=64):
+    """
+    One publisher, many subscribers to the same topic.  Measures how many events per second get published, and how
+    many deliveries per second the router makes, including the time for every subscriber to receive every event.
+    """
+    clients = await joined_clients(router, transport, serializer, subscribers + 1, realm=BENCH_REALM + '.fanout')
+    (publisher, subscribers_) = (clients[0], clients[1:])
+    try:
+        for (request_id, subscriber) in enumerate(subscribers_, 1):
+            await subscriber.request(SubscribeMessage(request_id=request_id, options={}, uri=BENCH_TOPIC))
+
+        args = ['x' * payload]
+
+        async def drain(subscriber):
+            for _ in range(events):
+                await subscriber.receive()
+
+        start = perf_counter()
+        receiving = gather(*(drain(subscriber) for subscriber in subscribers_))
+        for request_id in range(events):
+            publisher.send(PublishMessage(request_id=request_id + 1, options={}, uri_name=BENCH_TOPIC, args=args))
+        await receiving
+        elapsed = perf_counter() - start
+    finally:
+        close_all(clients)
+
+    return {
+        'seconds': elapsed,
+        'events_per_second': events / elapsed,
+        'deliveries_per_second': events * subscribers / elapsed,
+    }
+
+
+async def call_latency(router, transport, serializer, calls=2000, payload=64):
+    """
+    A caller making one CALL at a time to a procedure registered by another client, which YIELDs its arguments back.
+    Measures the round trip CALL -> INVOCATION -> YIELD -> RESULT as seen by the caller.
+    """
+    (caller, callee) = await joined_clients(router, transport, serializer, 2, realm=BENCH_REALM + '.rpc')
+    try:
+        await callee.request(RPCRegisterMessage(request_id=1, options={}, uri=BENCH_PROCEDURE))
+
+        async def serve():
+            for _ in range(calls):
+                invocation = await callee.receive()
+                callee.send(YieldMessage(request_id=invocation.request_id, options={}, args=invocation.args))
+
+        serving = gather(serve())
+        latency = LatencyHistogram()
+        args = ['x' * payload]
+        start = perf_counter()
+        for request_id in range(1, calls + 1):
+            sent = perf_counter()
+            await caller.request(CallMessage(request_id=request_id, options={}, procedure=BENCH_PROCEDURE, args=args))
+            latency.record(perf_counter() - sent)
+        elapsed = perf_counter() - start
+        await serving
+    finally:
+        close_all((caller, callee))
+
+    return {'seconds': elapsed, 'calls_per_second': calls / elapsed, 'latency': latency.stats}
+
+
+async def connect_rate(router, transport, serializer, connections=500, concurrency=10):
+    """
+    Clients connecting, joining a realm, saying GOODBYE and disconnecting, concurrency at a time.
+    """
+    async def worker(count):
+        for _ in range(count):
+            client = bench_client(router, transport, serializer)
+            await client.join(BENCH_REALM + '.connect')
+            await client.leave()
+
+    shares = [connections // concurrency + (1 if n < connections % concurrency else 0) for n in range(concurrency)]
+    start = perf_counter()
+    await gather(*(worker(share) for share in shares))
+    elapsed = perf_counter() - start
+
+    return {'seconds': elapsed, 'sessions_per_second': connections / elapsed}
+
+
+async def session_memory(router, transport, serializer, sessions=1000):
+    """
+    The memory the router holds per open session.  A subprocess router is measured by its resident set size.  An
+    in-process router is measured with tracemalloc, which then also counts the memory of the clients.
+    """
+    if router.pid is not None:
+        method = 'rss'
+        measure = lambda: resident_memory(router.pid)
+    else:
+        method = 'tracemalloc'
+        started = tracemalloc.is_tracing()
+        if not started:
+            tracemalloc.start()
+        measure = lambda: tracemalloc.get_traced_memory()[0]
+
+    try:
+        gc.collect()
+        before = measure()
+        clients = await joined_clients(router, transport, serializer, sessions, realm=BENCH_REALM + '.memory')
+        gc.collect()
+        after = measure()
+        close_all(clients)
+    finally:
+        if method == 'tracemalloc' and not started:
+            tracemalloc.stop()
+
+    if before is None or after is None:
+        return {'method': method, 'bytes_per_session': None}
+    return {'method': method, 'bytes_per_session': (after - before) / sessions}
+
+
+def best_of(statement, number, repeat=5):
+    """
+    The best time of a statement, in seconds per run.
+    """
+    return min(Timer(statement).repeat(repeat=repeat, number=number)) / number
+
+
+# The args and kwargs of the messages the serializers are compared on: a small event, a record like most RPCs carry, a
+# binary blob, which JSON has to base64, and a large list of records.
+PAYLOAD_SHAPES = {
+    'small': ([1, 'x'], {'k': 1}),
+    'record': ([{'id': 12345, 'name': 'sensor-12', 'value': 21.5, 'tags': ['a', 'b'], 'ok': True}], {}),
+    'binary': ([bytes(range(256)) * 4], {}),
+    'list': ([[{'id': i, 'name': 'item {}'.format(i), 'price': i * 1.5} for i in range(100)]], {}),
+}
+
+
+def messages(serializer, number=20000):
+    """
+    Building, encoding and decoding single messages, without any transport.  Encoding and decoding are measured for
+    an EVENT with each of PAYLOAD_SHAPES, along with its encoded size.
+    """
+    codec = PROTOCOL_SERIALIZERS[SERIALIZERS[serializer]]
+
+    results = {
+        'construct_event_seconds': best_of(lambda: EventMessage(subscription_id=1, publication_id=2, args=[1]), number),
+        'construct_call_seconds': best_of(lambda: CallMessage(request_id=1, procedure='bench.echo', args=[1]), number),
+    }
+    for (shape, (args, kwargs)) in PAYLOAD_SHAPES.items():
+        event = EventMessage(subscription_id=1, publication_id=2, details={}, args=args, kwargs=kwargs)
+        data = codec.encode(event)
+        # The large shapes get fewer runs, so that they take about as long as the small ones.
+        runs = max(1, number * 64 // max(64, len(data)))
+        results['encode_{}_seconds'.format(shape)] = best_of(lambda: codec.encode(event), runs)
+        results['decode_{}_seconds'.format(shape)] = best_of(lambda: codec.decode(data), runs)
+        results['{}_bytes'.format(shape)] = len(data)
+    return results
+
+
+class NullHandler(WAMPMetaServerHandler):
+    """
+    A server handler without a transport.  It serializes what it is sent, like a real one would, and drops it.
+    """
+    def __init__(self, serializer):
+        super().__init__()
+        self.serializer = serializer
+        self.codec = PROTOCOL_SERIALIZERS[SERIALIZERS[serializer]]
+        self.protocol = self.codec.protocol
+
+    def write_message(self, msg):
+        return self.codec.encode(msg)
+
+    def close(self, code=None, reason=None):
+        pass
+
+
+def dispatch(serializer, subscribers=100, number=2000):
+    """
+    Routing decoded messages through the server's dispatch table, without any transport: a CALL to a pseudo-RPC, and a
+    PUBLISH to a topic with subscribers subscribers.  Every message sent is still serialized.
+    """
+    realm_name = BENCH_REALM + '.dispatch'
+    handlers = [NullHandler(serializer) for _ in range(subscribers + 1)]
+    for handler in handlers:
+        handler.attach_realm(realm_name)
+    try:
+        for handler in handlers[1:]:
+            handler.realm.add_subscriber(BENCH_TOPIC, handler)
+
+        caller = handlers[0]
+        call = CallMessage(request_id=1, options={}, procedure='wamp.session.count')
+        publish = PublishMessage(request_id=1, options={}, uri_name=BENCH_TOPIC, args=[1, 'x'])
+        process_call = caller.dispatch[Code.CALL]
+        process_publish = caller.dispatch[Code.PUBLISH]
+
+        return {
+            'call_seconds': best_of(lambda: caller.write_message(process_call(call, caller)), number),
+            'publish_seconds': best_of(lambda: process_publish(publish, caller), max(1, number // subscribers)),
+        }
+    finally:
+        for handler in handlers:
+            handler.realm.disconnect(handler)
+            handler.realm.deregister_handler(handler.realm_id)
+
+
+def passthrough(serializer, payload=65536, subscribers=10, number=200):
+    """
+    Routing a PUBLISH whose args are a list of records of about payload bytes to subscribers subscribers, from its
+    serialization to the serialization of the EVENTs, without any transport: with the args decoded eagerly, and lazily,
+    which passes them through undecoded (see PayloadMessage).  Serializers without a lazy decoder decode them both
+    times.
+    """
+    realm_name = BENCH_REALM + '.passthrough'
+    handlers = [NullHandler(serializer) for _ in range(subscribers + 1)]
+    for handler in handlers:
+        handler.attach_realm(realm_name)
+    try:
+        for handler in handlers[1:]:
+            handler.realm.add_subscriber(BENCH_TOPIC, handler)
+
+        publisher = handlers[0]
+        codec = publisher.codec
+        records = [{'id': i, 'name': 'item {}'.format(i), 'price': i * 1.5} for i in range(payload // 40)]
+        data = codec.encode(PublishMessage(request_id=1, options={}, uri_name=BENCH_TOPIC, args=[records]))
+        process_publish = publisher.dispatch[Code.PUBLISH]
+        decode = codec.decoder(lazy=True)
+
+        return {
+            'publish_bytes': len(data),
+            'eager_seconds': best_of(lambda: process_publish(codec.decode(data), publisher), number),
+            'lazy_seconds': best_of(lambda: process_publish(decode(data), publisher), number),
+        }
+    finally:
+        for handler in handlers:
+            handler.realm.disconnect(handler)
+            handler.realm.deregister_handler(handler.realm_id)
+
+
+NETWORK_BENCHMARKS = {
+    'fanout': fanout,
+    'call_latency': call_latency,
+    'connect_rate': connect_rate,
+    'session_memory': session_memory,
+}
+
+MICRO_BENCHMARKS = {
+    'messages': messages,
+    'dispatch': dispatch,
+    'passthrough': passthrough,
+}
+
+# Smaller parameters, for a quick run.
+QUICK_PARAMETERS = {
+    'fanout': {'subscribers': 10, 'events': 200},
+    'call_latency': {'calls': 200},
+    'connect_rate': {'connections': 50},
+    'session_memory': {'sessions': 100},
+    'messages': {'number': 2000},
+    'dispatch': {'subscribers': 10, 'number': 200},
+    'passthrough': {'number': 20},
+}
@@ -83,8 +83,8 @@ server_features = Options(
         broker=Options(
             features=Options(
                 #publisher_identification=True,
-                #publisher_exclusion=True,
-                #subscriber_blackwhite_listing=True,
+                publisher_exclusion=True,
+                subscriber_blackwhite_listing=True,
             )
         ),
         dealer=Options(
@@ -34,24 +34,35 @@ import random
 MIN_ID = 0
 MAX_ID = 2 ** 53
 
-existing_ids = []
+existing_ids = set()
 
 def create_global_id():
     """
-    Return a global scope ID, which is not in existing_ids list provided.
-    This function also appends new ID to original existing_ids list.
+    Return a global scope ID, which is not in existing_ids set provided.
+    This function also adds the new ID to the original existing_ids set.
 
     According to WAMP specification:
     "IDs in the global scope MUST be drawn randomly from a uniform distribution
     over the complete range [0, 2^53]"
     """
-    new_id = None
-    while new_id not in existing_ids:
-        candidate_id = random.randint(MIN_ID, MAX_ID)
-        if candidate_id not in existing_ids:
-            new_id = candidate_id
-            existing_ids.append(new_id)
+    new_id = random.randint(MIN_ID, MAX_ID)
+    while new_id in existing_ids:
+        new_id = random.randint(MIN_ID, MAX_ID)
+    existing_ids.add(new_id)
     return new_id
 
 
+def random_id():
+    """
+    Return a global scope ID for something short-lived that is never looked up by it, like a publication or a request
+    the router makes itself.  It is not added to existing_ids, so it needs no release: a collision among 2^53 values
+    would be harmless, and tracking them would grow existing_ids with every publication.
+    """
+    return random.randint(MIN_ID, MAX_ID)
+
 
+def release_global_id(old_id):
+    """
+    Return an ID to the pool once nothing refers to it anymore, so that existing_ids doesn't grow forever.
+    """
+    existing_ids.discard(old_id)
@@ -0,0 +1,175 @@
+"""
+Keepalive pings and dead peer detection.
+
+A KeepaliveScheduler pings every session it was given once per interval, over WebSocket or RawSocket, and measures the
+round trip time of the pong.  A session that misses max_missed pongs in a row is closed, and leaves its realm through
+the normal on_close cleanup, so that half-open connections don't stay in the session tables and the subscribers of
+every topic forever.
+
+Sessions are spread over a timer wheel of slots slots, one of which is handled per tick of a single PeriodicCallback,
+so the cost of a tick is proportional to the number of sessions divided by slots, whatever the number of sessions.
+
+    keepalive.start(interval=30, max_missed=3)
+"""
+from time import monotonic
+from warnings import warn
+
+from tornado.ioloop import PeriodicCallback
+from tornado.iostream import StreamClosedError
+from tornado.websocket import WebSocketClosedError
+
+from wampnado.metrics import Counter, Gauge, Histogram
+
+KEEPALIVE_INTERVAL = 30     # seconds
+KEEPALIVE_MAX_MISSED = 3
+WHEEL_SLOTS = 64
+
+# Upper bounds, in seconds, of the buckets for round trip times.
+RTT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+keepalive_sessions = Gauge('wampnado_keepalive_sessions', 'Sessions being pinged.')
+keepalive_rtt = Histogram('wampnado_keepalive_rtt_seconds', 'Round trip time of keepalive pings.', buckets=RTT_BUCKETS)
+keepalive_missed = Counter('wampnado_keepalive_missed_pongs_total', 'Keepalive pings not answered within the interval.')
+keepalive_reclaimed = Counter('wampnado_keepalive_reclaimed_total', 'Sessions closed for missing too many pongs.')
+
+
+class KeepaliveState(object):
+    """
+    The keepalive bookkeeping of one session.  sent is when the unanswered ping was sent, or None if it was answered.
+    """
+    __slots__ = ('slot', 'sent', 'missed', 'rtt')
+
+    def __init__(self, slot):
+        self.slot = slot
+        self.sent = None
+        self.missed = 0
+        self.rtt = None
+
+
+class KeepaliveScheduler(object):
+    """
+    Pings sessions from a timer wheel.  Agents add themselves with add() once attached to a realm, if the scheduler
+    is enabled, and remove themselves in on_close().  Pongs are reported with pong().
+    """
+    def __init__(self, interval=KEEPALIVE_INTERVAL, max_missed=KEEPALIVE_MAX_MISSED, slots=WHEEL_SLOTS):
+        self.interval = interval
+        self.max_missed = max_missed
+        self.wheel = [set() for _ in range(slots)]
+        self.cursor = 0
+        self.peers = {}
+        self.reclaimed = 0
+        self.periodic = None
+
+    @property
+    def enabled(self):
+        return self.periodic is not None
+
+    def start(self, interval=None, max_missed=None):
+        """
+        Starts pinging.  Must be called from the thread running the IOLoop.
+        """
+        if interval is not None:
+            self.interval = interval
+        if max_missed is not None:
+            self.max_missed = max_missed
+        if self.periodic is not None:
+            self.periodic.stop()
+        self.periodic = PeriodicCallback(self.tick, self.interval * 1000 / len(self.wheel))
+        self.periodic.start()
+
+    def stop(self):
+        """
+        Stops pinging, and forgets every session.
+        """
+        if self.periodic is not None:
+            self.periodic.stop()
+            self.periodic = None
+        for slot in self.wheel:
+            slot.clear()
+        self.peers.clear()
+        keepalive_sessions.set(0)
+
+    def add(self, handler):
+        """
+        Starts pinging handler.  It goes in the slot handled last, so its first ping comes about an interval from now.
+        """
+        if handler in self.peers:
+            return
+        slot = (self.cursor - 1) % len(self.wheel)
+        self.peers[handler] = KeepaliveState(slot)
+        self.wheel[slot].add(handler)
+        keepalive_sessions.set(len(self.peers))
+
+    def remove(self, handler):
+        state = self.peers.pop(handler, None)
+        if state is not None:
+            self.wheel[state.slot].discard(handler)
+            keepalive_sessions.set(len(self.peers))
+
+    def tick(self):
+        """
+        Runs on the IOLoop.  Pings the sessions of the next slot, after closing those that missed too many pongs.
+        """
+        slot = self.wheel[self.cursor]
+        self.cursor = (self.cursor + 1) % len(self.wheel)
+        now = monotonic()
+
+        for handler in tuple(slot):
+            state = self.peers[handler]
+            if state.sent is not None:
+                state.missed += 1
+                keepalive_missed.inc()
+                if state.missed >= self.max_missed:
+                    self.reclaim(handler)
+                    continue
+
+            state.sent = now
+            try:
+                handler.ping()
+            except (WebSocketClosedError, StreamClosedError):
+                self.reclaim(handler)
+
+    def pong(self, handler):
+        """
+        Called when handler gets a pong.  Pongs nobody asked for are ignored.
+        """
+        state = self.peers.get(handler)
+        if state is None or state.sent is None:
+            return
+        state.rtt = monotonic() - state.sent
+        state.sent = None
+        state.missed = 0
+        keepalive_rtt.observe(state.rtt)
+
+    def rtt(self, handler):
+        """
+        The round trip time of the last ping answered by handler, in seconds, or None.
+        """
+        state = self.peers.get(handler)
+        return state.rtt if state is not None else None
+
+    def reclaim(self, handler):
+        """
+        Closes a dead peer.  The transport then calls on_close(), which takes it out of its realm.
+        """
+        self.remove(handler)
+        self.reclaimed += 1
+        keepalive_reclaimed.inc()
+        warn('closing session {}: no answer to {} pings'.format(getattr(handler, 'sessionid', None), self.max_missed))
+        try:
+            handler.close()
+        except (WebSocketClosedError, StreamClosedError):
+            pass
+
+    def report(self):
+        return {
+            'enabled': self.enabled,
+            'interval': self.interval,
+            'max_missed': self.max_missed,
+            'sessions': len(self.peers),
+            'reclaimed': self.reclaimed,
+        }
+
+
+# The scheduler every agent adds itself to.  Started by whoever wants it.
+keepalive = KeepaliveScheduler()
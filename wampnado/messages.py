@@ -6,59 +6,121 @@ https://github.com/tavendo/WAMP/blob/master/spec/basic.md
 """
 import json
 import msgpack
+import re
 import uuid
-from copy import deepcopy
 
 from enum import IntEnum, Enum
 from io import BytesIO
-from base64 import b64encode, standard_b64decode
+from binascii import a2b_base64, b2a_base64
 
-from wampnado.identifier import create_global_id
+from wampnado.identifier import create_global_id, random_id
 from wampnado.features import server_features, Options
 
 PUBLISHER_NODE_ID = uuid.uuid4()
 
+# JSON has no binary type, so WAMP sends binary as a string holding its base64, prefixed with \0.  JSON always escapes
+# \0, so such a string always starts like this in JSON text, and a text without it holds no binary.
+JSON_BINARY_PREFIX = '"\\u0000'
+JSON_BINARY_PREFIX_BYTES = JSON_BINARY_PREFIX.encode()
+
+BINARY_TYPES = (bytes, bytearray, memoryview)
+
+# The types that can be neither binary nor hold any.
+SCALAR_TYPES = frozenset((int, float, bool, type(None)))
+
+
+def b64_string(data):
+    """
+    The WAMP JSON string for binary data: its base64, prefixed with \0.
+    """
+    return '\0' + b2a_base64(data, newline=False).decode('ascii')
+
+
 def decode_b64(s):
     """
-    Finds all the binary objects in the struct, and recursively converts them to base64 prepended by \0, per the WAMP standard.
+    Finds all the strings of base64 prepended by \0 in the struct, and recursively converts them back to binary, per the
+    WAMP standard.  Lists and dicts are changed in place, and tuples become lists.
     """
-    if isinstance(s, dict):
-        ret = {}
-        for k,v in s.items():
-            ret[k] = decode_b64(v)
-        return ret
-    elif isinstance(s, list) or isinstance(s, tuple):
-        ret = []
-        for v in s:
-            ret.append(decode_b64(v))
-        return ret
-    elif isinstance(s, str) and s.beginswith('\0'):
-        return standard_b64decode(s[1:])
-    else:
-        return s
-    
+    if isinstance(s, str):
+        # a2b_base64() takes the str as it is, and the slice is the only copy of a large blob.
+        return a2b_base64(s[1:]) if s[:1] == '\0' else s
+    elif isinstance(s, list):
+        for (i, v) in enumerate(s):
+            if type(v) not in SCALAR_TYPES:
+                s[i] = decode_b64(v)
+    elif isinstance(s, dict):
+        for (k, v) in s.items():
+            if type(v) not in SCALAR_TYPES:
+                s[k] = decode_b64(v)
+    elif isinstance(s, tuple):
+        return [decode_b64(v) for v in s]
+    return s
+
 
 def encode_bin_as_b64(s):
     """
-    Finds all the binary objects in the struct, and recursively converts them to base64 prepended by \0, per the WAMP standard.
+    Finds all the binary objects in the struct, and recursively converts them to base64 prepended by \0, per the WAMP
+    standard.  Lists and dicts holding no binary are returned as they are, the others are copied.
     """
-    if isinstance(s, dict):
-        ret = {}
-        for k,v in s.items():
-            ret[k] = encode_bin_as_b64(v)
-        return ret
-    elif isinstance(s, list) or isinstance(s, tuple):
-        ret = []
-        for v in s:
-            ret.append(encode_bin_as_b64(v))
-        return ret
-    elif isinstance(s, bytes):
-        return '\0{}'.format(b64encode(s).decode('ascii'))
+    if isinstance(s, BINARY_TYPES):
+        return b64_string(s)
     elif isinstance(s, Enum):
         return encode_bin_as_b64(s.value)
+    elif isinstance(s, dict):
+        ret = s
+        for (k, v) in s.items():
+            if type(v) not in SCALAR_TYPES:
+                e = encode_bin_as_b64(v)
+                if e is not v:
+                    if ret is s:
+                        ret = dict(s)
+                    ret[k] = e
+        return ret
+    elif isinstance(s, (list, tuple)):
+        ret = s
+        for (i, v) in enumerate(s):
+            if type(v) not in SCALAR_TYPES:
+                e = encode_bin_as_b64(v)
+                if e is not v:
+                    if ret is s:
+                        ret = list(s)
+                    ret[i] = e
+        return ret
     else:
         return s
-    
+
+
+def json_default(obj):
+    """
+    Serializes what json does not know about: binary per the WAMP standard, and enums by their value.
+    """
+    if isinstance(obj, BINARY_TYPES):
+        return b64_string(obj)
+    elif isinstance(obj, Enum):
+        return obj.value
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(obj).__name__))
+
+
+# Encodes in a single pass, in C, calling json_default() only for binary and enums.
+JSON_ENCODER = json.JSONEncoder(default=json_default)
+
+
+def json_dumps(value):
+    """
+    Serializes value to JSON, with binary as base64 prepended by \0.
+    """
+    return JSON_ENCODER.encode(value)
+
+
+def json_loads(text):
+    """
+    Deserializes JSON text or bytes, turning base64 prepended by \0 back into binary.  The value is only searched for
+    it if the text holds any.
+    """
+    value = json.loads(text)
+    if (JSON_BINARY_PREFIX if isinstance(text, str) else JSON_BINARY_PREFIX_BYTES) in text:
+        value = decode_b64(value)
+    return value
 
 
 class Code(IntEnum):
@@ -92,6 +154,30 @@ class Code(IntEnum):
     YIELD = 70
 
 
+# Messages shorter than this, in bytes or characters, are decoded in full even when lazy decoding is asked for.  Decoding
+# their fields one by one costs more than decoding them at once, and more than their arguments would cost to encode.
+# Lazy JSON still decodes the arguments, to check them, so it only pays off on longer messages than MSGPack does.
+LAZY_MIN_LENGTH = 256
+LAZY_MIN_JSON_LENGTH = 512
+
+JSON_DECODER = json.JSONDecoder()
+JSON_SPACE = re.compile(r'[ \t\n\r]*')
+
+# The first bytes of the MSGPack encodings of an array and of a map.
+MSGPACK_ARRAY_HEADERS = frozenset(range(0x90, 0xa0)) | {0xdc, 0xdd}
+MSGPACK_MAP_HEADERS = frozenset(range(0x80, 0x90)) | {0xde, 0xdf}
+
+
+def next_json_element(text, index):
+    """
+    Decodes the element of a JSON array that follows the '[' or ',' at index.  Returns it, and the index of the ','
+    or ']' after it.
+    """
+    index = JSON_SPACE.match(text, index + 1).end()
+    (element, index) = JSON_DECODER.raw_decode(text, index)
+    return (element, JSON_SPACE.match(text, index).end())
+
+
 class BroadcastMessage(object):
     """
     This is a message that a procedure may want delivered.
@@ -113,7 +199,7 @@ class BroadcastMessage(object):
             "uri_name": self.uri_name,
             "event_message": self.event_message.json,
         }
-        return json.dumps(encode_bin_as_b64(info_struct))
+        return json_dumps(info_struct)
 
     @property
     def msgpack(self):
@@ -156,17 +242,192 @@ class BroadcastMessage(object):
         return msg
 
 
+class PayloadError(ValueError):
+    """
+    The arguments of a message received undecoded turned out not to decode.
+    """
+
+
+class SerializedTail(object):
+    """
+    The trailing elements of a message (details, args, kwargs...), serialized once per protocol and then
+    reused for every message that ends with them.
+
+    A tail made by received() starts out as the serialization it was received in, and its elements are only decoded
+    when they are asked for, or when it is sent in another protocol.
+
+    Unless cached, nothing is kept but what the tail was made with: decoded elements, other serializations and
+    compressed forms are made again whenever they are needed.
+    """
+    cached = True
+
+    def __init__(self, *elements):
+        self._elements = list(elements)
+        self._json = None
+        self._msgpack = None
+
+        # The number of elements of a received tail, if known without decoding it.
+        self._count = None
+
+        # The compressed forms of the elements, by protocol and compression settings.  See wampnado.transports.compression.
+        self.deflated = {}
+
+    @classmethod
+    def payload(cls, *elements, args=None, kwargs=None):
+        """
+        The tail of a message ending with Arguments|list and ArgumentsKw|dict, which are left out when they are empty,
+        like PayloadMessage.value does.
+        """
+        if kwargs:
+            return cls(*elements, args or [], kwargs)
+        elif args:
+            return cls(*elements, args)
+        return cls(*elements)
+
+    @classmethod
+    def received(cls, json=None, msgpack=None, count=None, elements=None):
+        """
+        A tail as received: either the JSON text of its elements, comma-separated, or the concatenated MSGPack
+        encodings of its count elements.  The elements may be given too, if they were decoded already.
+        """
+        tail = cls()
+        tail._elements = elements
+        tail._json = json
+        tail._msgpack = msgpack
+        tail._count = count
+        return tail
+
+    def stripped(self):
+        """
+        An uncached copy holding a single serialization of the elements: the one at hand, MSGPack if both are.
+        """
+        if self._msgpack is None and self._json is not None:
+            tail = type(self).received(json=self._json, count=self._count)
+        else:
+            tail = type(self).received(msgpack=self.msgpack, count=len(self))
+        tail.cached = False
+        return tail
+
+    @property
+    def elements(self):
+        elements = self._elements
+        if elements is None:
+            try:
+                if self._msgpack is not None:
+                    unpacker = msgpack.Unpacker(raw=False)
+                    unpacker.feed(self._msgpack)
+                    elements = list(unpacker)
+                else:
+                    elements = json_loads('[' + self._json + ']')
+            except (ValueError, TypeError) as e:
+                raise PayloadError('the arguments could not be decoded: {}'.format(e)) from e
+            if self.cached:
+                self._elements = elements
+        return elements
+
+    def __len__(self):
+        if self._elements is None and self._count is not None:
+            return self._count
+        return len(self.elements)
+
+    @property
+    def empty(self):
+        if self._elements is None:
+            return not (self._json or self._msgpack)
+        return not self._elements
+
+    @property
+    def size(self):
+        """
+        The length of the tail serialized, in MSGPack unless it was received in JSON and never sent in MSGPack.
+        """
+        if self._msgpack is None and self._json is not None:
+            return len(self._json)
+        return len(self.msgpack)
+
+    @property
+    def json(self):
+        """
+        The JSON text of the elements, comma-separated but without the enclosing brackets.
+        """
+        text = self._json
+        if text is None:
+            text = ','.join(json_dumps(element) for element in self.elements)
+            if self.cached:
+                self._json = text
+        return text
+
+    @property
+    def msgpack(self):
+        """
+        The concatenated MSGPack encodings of the elements, without an array header.
+        """
+        data = self._msgpack
+        if data is None:
+            data = b''.join(msgpack.packb(element, use_bin_type=True) for element in self.elements)
+            if self.cached:
+                self._msgpack = data
+        return data
+
+
+class SplicedMessage(object):
+    """
+    A message made of a few leading elements that vary per recipient, followed by a SerializedTail that
+    is shared between recipients.  Only the leading elements are serialized when it is sent.
+    """
+    def __init__(self, code, head, tail):
+        self.code = code
+        self.head = list(head)
+        self.tail = tail
+
+    @property
+    def value(self):
+        return [self.code] + self.head + self.tail.elements
+
+    @property
+    def json(self):
+        return ''.join(self.json_parts())
+
+    @property
+    def msgpack(self):
+        return b''.join(self.msgpack_parts())
+
+    def json_parts(self):
+        """
+        The JSON text of the message, as the part serialized for this message and the part shared with others.
+        """
+        head = json_dumps([self.code.value] + self.head)
+        if self.tail.empty:
+            return (head, '')
+        return (head[:-1] + ',', self.tail.json + ']')
+
+    def msgpack_parts(self):
+        """
+        The MSGPack encoding of the message, as the part serialized for this message and the part shared with others.
+        """
+        # WAMP messages never have more than 15 elements, so the array header is always a single fixarray byte.
+        head = msgpack.packb([self.code.value] + self.head, use_bin_type=True)
+        return (bytes((0x90 | (1 + len(self.head) + len(self.tail)),)) + head[1:], self.tail.msgpack)
+
+
 class Message(object):
     """
     Represent any WAMP message.
+
+    Messages are compact __slots__ records holding each field once.  Each class lists its fields, in wire order after
+    the code, in `fields`.  The wire `value` list is only built when it is asked for, which is mostly at serialization
+    time.  Messages that may end with Arguments|list and ArgumentsKw|dict derive from PayloadMessage.
     """
-    details = {}
+    __slots__ = ('code',)
 
-    def __init__(self, code, *data, **kdata):
-        self.code = code
-        self.value = [code] + list(data)
-        self.args = kdata.get("args", [])
-        self.kwargs = kdata.get("kwargs", {})
+    fields = ()
+
+    @property
+    def value(self):
+        """
+        The message as the list that goes on the wire.
+        """
+        return [self.code] + [getattr(self, field) for field in self.fields]
 
     @property
     def id(self):
@@ -174,8 +435,8 @@ class Message(object):
         For all kinds of messages (except ERROR) that have [Request|id], it is
         in the second position of the array.
         """
-        if (len(self.value) > 1) and isinstance(self.value[1], int):
-            return self.value[1]
+        if self.fields and isinstance(getattr(self, self.fields[0]), int):
+            return getattr(self, self.fields[0])
         return -1
 
     @property
@@ -183,19 +444,14 @@ class Message(object):
         """
         Create a JSON representation of this message.
         """
-        message_value = deepcopy(self.value)
-        return json.dumps(encode_bin_as_b64(message_value))
+        return json_dumps(self.value)
 
     @property
     def msgpack(self):
         """
         Create a MSGPack representation for this message.
         """
-        message_value = deepcopy(self.value)
-        for index, item in enumerate(message_value):
-            if isinstance(item, Code):
-                message_value[index] = item.value
-        return msgpack.packb(message_value, use_bin_type=True)
+        return msgpack.packb(self.value, use_bin_type=True)
 
     def error(self, text, info=None):
         """
@@ -212,31 +468,217 @@ class Message(object):
         """
         Decode text to JSON and return a Message object accordingly.
         """
-        raw = decode_b64(json.loads(text))
-        raw[0] = Code(raw[0])  # make it an object of type Code
-        return cls(*raw)
+        return cls.from_value(json_loads(text))
 
     @classmethod
     def from_bin(cls, bin):
         """
         Decode binary blob to a message and return a Message object accordingly.
         """
-        print(bin)
-        raw = msgpack.unpackb(bin, raw=False)
-        raw[0] = Code(raw[0])  # make it an object of type Code
+        return cls.from_value(msgpack.unpackb(bin, raw=False))
+
+    @classmethod
+    def from_text_lazy(cls, text):
+        """
+        Like from_text(), but the arguments of the messages in LAZY_CODES are kept as received, see PayloadMessage.
+        They are still decoded, to check them, but never encoded again for JSON.  Short messages, and anything
+        unexpected, such as arguments that are not a list and a dict followed by the end of the message, are left to
+        from_text().
+        """
+        if len(text) < LAZY_MIN_JSON_LENGTH:
+            return cls.from_text(text)
+        if isinstance(text, bytes):
+            text = text.decode()
+        index = JSON_SPACE.match(text).end()
+        if text[index:index + 1] != '[':
+            return cls.from_text(text)
+
+        (code, index) = next_json_element(text, index)
+        if code not in LAZY_CODES:
+            return cls.from_text(text)
+
+        msg_cls = CODE_TO_CLASS[code]
+        raw = [code]
+        for _ in msg_cls.fields:
+            if text[index:index + 1] != ',':
+                return cls.from_text(text)
+            (element, index) = next_json_element(text, index)
+            raw.append(element)
+
+        start = index + 1
+        elements = []
+        for element_type in (list, dict):
+            if text[index:index + 1] != ',':
+                break
+            (element, index) = next_json_element(text, index)
+            if type(element) is not element_type:
+                return cls.from_text(text)
+            elements.append(element)
+
+        if not elements or text[index:index + 1] != ']' or JSON_SPACE.match(text, index + 1).end() != len(text):
+            return cls.from_text(text)
+        payload = text[start:index]
+        if JSON_BINARY_PREFIX in payload:
+            decode_b64(elements)
+        return msg_cls.from_header(decode_b64(raw), SerializedTail.received(json=payload, count=len(elements), elements=elements))
+
+    @classmethod
+    def from_bin_lazy(cls, bin):
+        """
+        Like from_bin(), but only the fields before the arguments of the messages in LAZY_CODES are decoded, see
+        PayloadMessage.  The arguments are skipped over, to check that they are an array and a map followed by the
+        end of the message.  Short messages, and anything unexpected, are left to from_bin().
+        """
+        if len(bin) < LAZY_MIN_LENGTH:
+            return cls.from_bin(bin)
+        unpacker = msgpack.Unpacker(raw=False)
+        unpacker.feed(bin)
+        length = unpacker.read_array_header()
+        code = unpacker.unpack()
+        if code not in LAZY_CODES or length <= 1 + len(CODE_TO_CLASS[code].fields):
+            return cls.from_bin(bin)
+
+        msg_cls = CODE_TO_CLASS[code]
+        raw = [code] + [unpacker.unpack() for _ in msg_cls.fields]
+        count = length - len(raw)
+        if count > 2:
+            return cls.from_bin(bin)
+
+        start = unpacker.tell()
+        try:
+            for headers in (MSGPACK_ARRAY_HEADERS, MSGPACK_MAP_HEADERS)[:count]:
+                if bin[unpacker.tell()] not in headers:
+                    return cls.from_bin(bin)
+                unpacker.skip()
+        except (IndexError, msgpack.OutOfData):
+            return cls.from_bin(bin)
+        if unpacker.tell() != len(bin):
+            return cls.from_bin(bin)
+        return msg_cls.from_header(raw, SerializedTail.received(msgpack=bin[start:], count=count))
+
+    @classmethod
+    def from_value(cls, raw):
+        """
+        Build a message from its decoded list.  Called on Message itself, this builds the class matching the message
+        code (see CODE_TO_CLASS), so that the message only has to be built once.  The elements are used as they are,
+        positionally, without being copied.
+        """
+        code = raw[0] = Code(raw[0])  # make it an object of type Code
+        if cls is Message:
+            cls = CODE_TO_CLASS[code]
         return cls(*raw)
 
-    def _update_args_and_kargs(self):
+
+class PayloadMessage(Message):
+    """
+    A message that may end with Arguments|list and ArgumentsKw|dict.  They are only put on the wire when they are
+    not empty.
+
+    A message decoded by from_text_lazy() or from_bin_lazy() keeps them as received, in a SerializedTail, and only
+    decodes them when args or kwargs are read, by a processor or a callback.  payload_from() hands them on as they
+    are, and they are spliced back after the other fields when the message is sent in the protocol they were received
+    in, so that forwarding a PUBLISH, CALL or YIELD costs the same whatever the size of its arguments.
+    """
+    __slots__ = ('_args', '_kwargs', '_payload')
+
+    @property
+    def args(self):
+        if self._args is None:
+            self.unpack_payload()
+        return self._args
+
+    @args.setter
+    def args(self, args):
+        self.drop_payload()
+        self._args = args
+
+    @property
+    def kwargs(self):
+        if self._kwargs is None:
+            self.unpack_payload()
+        return self._kwargs
+
+    @kwargs.setter
+    def kwargs(self, kwargs):
+        self.drop_payload()
+        self._kwargs = kwargs
+
+    @property
+    def payload(self):
+        """
+        The Arguments|list and ArgumentsKw|dict of the message, as a SerializedTail.
+        """
+        if self._payload is not None:
+            return self._payload
+        return SerializedTail.payload(args=self._args, kwargs=self._kwargs)
+
+    @classmethod
+    def from_header(cls, raw, payload):
+        """
+        Builds a message from its decoded list, without the arguments, and the arguments as a received SerializedTail.
+        """
+        msg = cls.from_value(raw)
+        msg._args = msg._kwargs = None
+        msg._payload = payload
+        return msg
+
+    def payload_from(self, msg):
+        """
+        Gives this message the arguments of another PayloadMessage, still undecoded if they were.  Returns this message.
+        """
+        (self._args, self._kwargs, self._payload) = (msg._args, msg._kwargs, msg._payload)
+        return self
+
+    @property
+    def undecoded(self):
+        """
+        Whether the arguments were received and are still undecoded.
+        """
+        return self._args is None and self._payload is not None
+
+    def unpack_payload(self):
+        elements = self._payload.elements
+        self._args = elements[0] if len(elements) > 0 else []
+        self._kwargs = elements[1] if len(elements) > 1 else {}
+
+    def drop_payload(self):
         """
-        Append args and kwargs to message value, according to their existance
-        or not.
+        Forgets the arguments as received, decoding them first if needed, so that they can be changed.
         """
+        if getattr(self, '_payload', None) is not None and self._args is None:
+            self.unpack_payload()
+        self._payload = None
+
+    @property
+    def value(self):
+        value = [self.code] + [getattr(self, field) for field in self.fields]
         if self.kwargs:
-            self.value.append(self.args)
-            self.value.append(self.kwargs)
-        else:
-            if self.args:
-                self.value.append(self.args)
+            value.append(self.args)
+            value.append(self.kwargs)
+        elif self.args:
+            value.append(self.args)
+        return value
+
+    @property
+    def json(self):
+        if self._payload is None:
+            return super().json
+        return SplicedMessage(self.code, [getattr(self, field) for field in self.fields], self._payload).json
+
+    @property
+    def msgpack(self):
+        if self._payload is None:
+            return super().msgpack
+        return SplicedMessage(self.code, [getattr(self, field) for field in self.fields], self._payload).msgpack
+
+
+def as_options(options):
+    """
+    Returns options as an Options, only converting it if it isn't one already.
+    """
+    if isinstance(options, Options):
+        return options
+    return Options(**(options or {}))
 
 
 class HelloMessage(Message):
@@ -246,12 +688,13 @@ class HelloMessage(Message):
 
     https://github.com/tavendo/WAMP/blob/master/spec/basic.md#hello
     """
+    __slots__ = ('realm', 'details')
+    fields = __slots__
 
     def __init__(self, code=Code.HELLO, realm="", details=None):
         self.code = code
         self.realm = realm
         self.details = details if details else {}
-        self.value = [self.code, self.realm, self.details]
 
 
 class AbortMessage(Message):
@@ -261,13 +704,14 @@ class AbortMessage(Message):
 
     https://github.com/tavendo/WAMP/blob/master/spec/basic.md#abort
     """
+    __slots__ = ('details', 'reason')
+    fields = __slots__
 
     def __init__(self, code=Code.ABORT, details=None, reason=None):
         assert reason is not None, "AbortMessage must have a reason"
         self.code = code
         self.details = details or {}
         self.reason = reason
-        self.value = [self.code, self.details, self.reason]
 
 
 class WelcomeMessage(Message):
@@ -279,12 +723,13 @@ class WelcomeMessage(Message):
 
     https://github.com/tavendo/WAMP/blob/master/spec/basic.md#welcome
     """
+    __slots__ = ('session_id', 'details')
+    fields = __slots__
 
     def __init__(self, code=Code.WELCOME, session_id=None, details=None):
         self.code = code
         self.session_id = session_id or create_global_id()
         self.details = details or server_features
-        self.value = [self.code, self.session_id, self.details]
 
 
 class GoodbyeMessage(Message):
@@ -292,15 +737,16 @@ class GoodbyeMessage(Message):
     Both the Server and the Client may abort the opening of a WAMP session
     [ABORT, Details|dict, Reason|uri]
     """
+    __slots__ = ('details', 'reason')
+    fields = __slots__
 
     def __init__(self, code=Code.GOODBYE, details=None, reason=None):
         self.code = code
         self.details = details or {}
         self.reason = reason or ""
-        self.value = [self.code, self.details, self.reason]
 
 
-class ResultMessage(Message):
+class ResultMessage(PayloadMessage):
     """
     Result of a call as returned by Dealer to Caller.
 
@@ -308,6 +754,8 @@ class ResultMessage(Message):
     [RESULT, CALL.Request|id, Details|dict, YIELD.Arguments|list]
     [RESULT, CALL.Request|id, Details|dict, YIELD.Arguments|list, YIELD.ArgumentsKw|dict]
     """
+    __slots__ = ('request_id', 'details')
+    fields = __slots__
 
     def __init__(self, code=Code.RESULT, request_id=None, details=None, args=None, kwargs=None):
         assert request_id is not None, "ResultMessage must have request_id"
@@ -316,15 +764,9 @@ class ResultMessage(Message):
         self.details = details or {}
         self.args = args or []
         self.kwargs = kwargs or {}
-        self.value = [
-            self.code,
-            self.request_id,
-            self.details
-        ]
-        self._update_args_and_kargs()
 
 
-class CallMessage(Message):
+class CallMessage(PayloadMessage):
     """
     Call as originally issued by the Caller to the Dealer.
 
@@ -332,23 +774,19 @@ class CallMessage(Message):
     [CALL, Request|id, Options|dict, Procedure|uri, Arguments|list]
     [CALL, Request|id, Options|dict, Procedure|uri, Arguments|list, ArgumentsKw|dict]
     """
+    __slots__ = ('request_id', 'options', 'procedure')
+    fields = __slots__
 
-    def __init__(self, code=Code.CALL, request_id=None, options={}, procedure=None, args=[], kwargs={}):
+    def __init__(self, code=Code.CALL, request_id=None, options=None, procedure=None, args=None, kwargs=None):
         assert request_id is not None, "CallMessage must have request_id"
         assert procedure is not None, "CallMessage must have procedure"
         self.code = code
         self.request_id = request_id
         self.procedure = procedure
-        self.options = Options(**options)
-        self.args = args
-        self.kwargs = kwargs
-        self.value = [
-            self.code,
-            self.request_id,
-            self.options,
-            self.procedure,
-        ]
-        self._update_args_and_kargs()
+        self.options = as_options(options)
+        self.args = args or []
+        self.kwargs = kwargs or {}
+
 
 class InterruptMessage(Message):
     """
@@ -356,19 +794,17 @@ class InterruptMessage(Message):
 
     [INTERRUPT, INVOCATION.Request|id, Options|dict]
     """
-    def __init__(self, code=Code.INTERRUPT, request_id=None, options={}):
+    __slots__ = ('request_id', 'options')
+    fields = __slots__
+
+    def __init__(self, code=Code.INTERRUPT, request_id=None, options=None):
         assert request_id is not None, "InterruptMessage must have request_id"
+        self.code = code
         self.request_id = request_id
-        self.options = Options(**options)
-        self.value = [
-            self.code,
-            self.request_id,
-            self.options,
-        ]
+        self.options = as_options(options)
 
-    
 
-class InvocationMessage(Message):
+class InvocationMessage(PayloadMessage):
     """
     Used by the dealer to request an RPC from a client.  The client should respond with a YIELD message if successful.
 
@@ -376,28 +812,23 @@ class InvocationMessage(Message):
     [INVOCATION, Request|id, REGISTERED.Registration|id, Details|dict, CALL.Arguments|list]
     [INVOCATION, Request|id, REGISTERED.Registration|id, Details|dict, CALL.Arguments|list, CALL.ArgumentsKw|dict]
     """
+    __slots__ = ('request_id', 'registration_id', 'details')
+    fields = __slots__
 
-    def __init__(self, code=Code.INVOCATION, request_id=None, registration_id=None, details={}, args=None, kwargs=None):
+    def __init__(self, code=Code.INVOCATION, request_id=None, registration_id=None, details=None, args=None, kwargs=None):
         if request_id is None:
-            request_id = create_global_id()
+            request_id = random_id()
         assert request_id is not None, "InvocationMessage must have request_id"
         assert registration_id is not None, "InvocationMessage must have registration_id"
         self.code = code
         self.request_id = request_id
-        self.registration_id = registration_id or {}
-        self.details = details
-        self.args = args
-        self.kwargs = kwargs
-        self.value = [
-            self.code,
-            self.request_id,
-            self.registration_id,
-            self.details,
-        ]
-        self._update_args_and_kargs()
+        self.registration_id = registration_id
+        self.details = details if details is not None else {}
+        self.args = args or []
+        self.kwargs = kwargs or {}
 
 
-class YieldMessage(Message):
+class YieldMessage(PayloadMessage):
     """
     Used by the dealer to deliver the result of an RPC to the requesting client.  The client should respond with a YIELD message if successful.
 
@@ -405,23 +836,19 @@ class YieldMessage(Message):
     [YIELD, INVOCATION.Request|id, Options|dict, Arguments|list]
     [YIELD, INVOCATION.Request|id, Options|dict, Arguments|list, ArgumentsKw|dict]
     """
+    __slots__ = ('request_id', 'options')
+    fields = __slots__
 
     def __init__(self, code=Code.YIELD, request_id=None, options=None, args=None, kwargs=None):
         assert request_id is not None, "YieldMessage must have request_id"
         self.code = code
-        self.options = Options(**options)
+        self.options = as_options(options)
         self.request_id = request_id
-        self.args = args
-        self.kwargs = kwargs
-        self.value = [
-            self.code,
-            self.request_id,
-            self.options,
-        ]
-        self._update_args_and_kargs()
+        self.args = args or []
+        self.kwargs = kwargs or {}
 
 
-class ErrorMessage(Message):
+class ErrorMessage(PayloadMessage):
     """
     Error reply sent by a Peer as an error response to different kinds of
     requests.
@@ -432,6 +859,8 @@ class ErrorMessage(Message):
     [ERROR, REQUEST.Type|int, REQUEST.Request|id, Details|dict, Error|uri,
         Arguments|list, ArgumentsKw|dict]
     """
+    __slots__ = ('request_code', 'request_id', 'details', 'uri')
+    fields = __slots__
 
     def __init__(self, code=Code.ERROR, request_code=None, request_id=None, details=None, uri=None, args=None, kwargs=None):
         assert request_code is not None, "ErrorMessage must have request_code"
@@ -444,14 +873,6 @@ class ErrorMessage(Message):
         self.uri = uri
         self.args = args or []
         self.kwargs = kwargs or {}
-        self.value = [
-            self.code,
-            self.request_code,
-            self.request_id,
-            self.details,
-            self.uri
-        ]
-        self._update_args_and_kargs()
 
 
 class SubscribeMessage(Message):
@@ -460,15 +881,16 @@ class SubscribeMessage(Message):
     a SUBSCRIBE message:
     [SUBSCRIBE, Request|id, Options|dict, uri|uri]
     """
+    __slots__ = ('request_id', 'options', 'uri')
+    fields = __slots__
 
     def __init__(self, code=Code.SUBSCRIBE, request_id=None, options=None, uri=None):
         assert request_id is not None, "SubscribeMessage must have request_id"
         assert uri is not None, "SubscribeMessage must have uri"
         self.code = code
         self.request_id = request_id
-        self.options = Options(**options)
+        self.options = as_options(options)
         self.uri = uri
-        self.value = [self.code, self.request_id, self.options, self.uri]
 
 
 class SubscribedMessage(Message):
@@ -477,14 +899,15 @@ class SubscribedMessage(Message):
     sending a SUBSCRIBED message to the Subscriber:
     [SUBSCRIBED, SUBSCRIBE.Request|id, Subscription|id]
     """
+    __slots__ = ('request_id', 'subscription_id')
+    fields = __slots__
+
     def __init__(self, code=Code.SUBSCRIBED, request_id=None, subscription_id=None):
         assert request_id is not None, "SubscribedMessage must have request_id"
         assert subscription_id is not None, "SubscribedMessage must have subscription_id"
         self.code = code
         self.request_id = request_id
         self.subscription_id = subscription_id
-        self.value = [self.code, self.request_id, self.subscription_id]
-
 
 
 class RPCRegisterMessage(Message):
@@ -493,15 +916,16 @@ class RPCRegisterMessage(Message):
     a REGISTER message:
     [REGISTER, Request|id, Options|dict, uri|uri]
     """
+    __slots__ = ('request_id', 'options', 'uri')
+    fields = __slots__
 
     def __init__(self, code=Code.REGISTER, request_id=None, options=None, uri=None):
         assert request_id is not None, "RegisterMessage must have request_id"
         assert uri is not None, "RegisterMessage must have uri"
         self.code = code
         self.request_id = request_id
-        self.options = Options(**options)
+        self.options = as_options(options)
         self.uri = uri
-        self.value = [self.code, self.request_id, self.options, self.uri]
 
 
 class RPCRegisteredMessage(Message):
@@ -510,6 +934,9 @@ class RPCRegisteredMessage(Message):
     sending a REGISTERED message to the Registerer:
     [REGISTERED, REGISTER.Request|id, Registration|id]
     """
+    __slots__ = ('request_id', 'registration_id')
+    fields = __slots__
+
     def __init__(self, code=Code.REGISTERED, request_id=None, registration_id=None):
         if registration_id is None:
             registration_id = create_global_id()
@@ -518,12 +945,9 @@ class RPCRegisteredMessage(Message):
         self.code = code
         self.request_id = request_id
         self.registration_id = registration_id
-        #self.uri = uri
-        self.value = [self.code, self.request_id, self.registration_id]
 
 
-
-class PublishMessage(Message):
+class PublishMessage(PayloadMessage):
     """
     Sent by a Publisher to a Broker to publish an event.
 
@@ -531,17 +955,18 @@ class PublishMessage(Message):
     [PUBLISH, Request|id, Options|dict, uri|uri, Arguments|list]
     [PUBLISH, Request|id, Options|dict, uri|uri, Arguments|list, ArgumentsKw|dict]
     """
-    def __init__(self, code=Code.PUBLISH, request_id=None, options={}, uri_name=None, args=None, kwargs=None):
+    __slots__ = ('request_id', 'options', 'uri_name')
+    fields = __slots__
+
+    def __init__(self, code=Code.PUBLISH, request_id=None, options=None, uri_name=None, args=None, kwargs=None):
         assert request_id is not None, "PublishMessage must have request_id"
         assert uri_name is not None, "PublishMessage must have uri"
         self.code = code
         self.request_id = request_id
-        self.options = Options(**options)
+        self.options = as_options(options)
         self.uri_name = uri_name
         self.args = args or []
         self.kwargs = kwargs or {}
-        self.value = [self.code, self.request_id, self.options, self.uri_name]
-        self._update_args_and_kargs()
 
 
 class PublishedMessage(Message):
@@ -550,16 +975,18 @@ class PublishedMessage(Message):
 
     [PUBLISHED, PUBLISH.Request|id, Publication|id]
     """
+    __slots__ = ('request_id', 'publication_id')
+    fields = __slots__
+
     def __init__(self, code=Code.PUBLISHED, request_id=None, publication_id=None):
         assert request_id is not None, "PublishedMessage must have request_id"
         assert publication_id is not None, "PublishedMessage must have publication_id"
         self.code = code
         self.request_id = request_id
         self.publication_id = publication_id
-        self.value = [self.code, self.request_id, self.publication_id]
 
 
-class EventMessage(Message):
+class EventMessage(PayloadMessage):
     """
     Event dispatched by Broker to Subscribers for subscription the event was matching.
 
@@ -571,25 +998,17 @@ class EventMessage(Message):
     subscription_id will be omitted (it can only be resolved in the
     subscriber.)
     """
+    __slots__ = ('subscription_id', 'publication_id', 'details')
+    fields = __slots__
+
     def __init__(self, code=Code.EVENT, subscription_id=None, publication_id=None, details=None, args=None, kwargs=None):
         assert publication_id is not None, "EventMessage must have publication_id"
         self.code = code
-        self._subscription_id = subscription_id
+        self.subscription_id = subscription_id
         self.publication_id = publication_id
         self.details = details or {}
         self.args = args or []
         self.kwargs = kwargs or {}
-        self.value = [self.code, self.subscription_id, self.publication_id, self.details]
-        self._update_args_and_kargs()
-
-    @property
-    def subscription_id(self):
-        return self._subscription_id
-
-    @subscription_id.setter
-    def subscription_id(self, id_):
-        self._subscription_id = id_
-        self.value[1] = id_
 
 
 class UnsubscribeMessage(Message):
@@ -597,13 +1016,15 @@ class UnsubscribeMessage(Message):
     Unsubscribe request sent by a Subscriber to a Broker to unsubscribe a subscription.
     [UNSUBSCRIBE, Request|id, SUBSCRIBED.Subscription|id]
     """
+    __slots__ = ('request_id', 'subscription_id')
+    fields = __slots__
+
     def __init__(self, code=Code.UNSUBSCRIBE, request_id=None, subscription_id=None):
         assert request_id is not None, "UnsubscribeMessage must have request_id"
         assert subscription_id is not None, "UnsubscribeMessage must have subscription_id"
         self.code = code
         self.request_id = request_id
         self.subscription_id = subscription_id
-        self.value = [self.code, self.request_id, self.subscription_id]
 
 
 class UnsubscribedMessage(Message):
@@ -611,11 +1032,13 @@ class UnsubscribedMessage(Message):
     Acknowledge sent by a Broker to a Subscriber to acknowledge unsubscription.
     [UNSUBSCRIBED, UNSUBSCRIBE.Request|id]
     """
+    __slots__ = ('request_id',)
+    fields = __slots__
+
     def __init__(self, code=Code.UNSUBSCRIBED, request_id=None):
         assert request_id is not None, "UnsubscribedMessage must have request_id"
         self.code = code
         self.request_id = request_id
-        self.value = [self.code, self.request_id]
 
 
 CODE_TO_CLASS = {
@@ -647,6 +1070,9 @@ CODE_TO_CLASS = {
     Code.YIELD: YieldMessage,                   # 70
 }
 
+# The messages that may end with Arguments|list and ArgumentsKw|dict, which lazy decoding leaves undecoded.
+LAZY_CODES = frozenset(code for (code, msg_cls) in CODE_TO_CLASS.items() if issubclass(msg_cls, PayloadMessage))
+
 ERROR_PRONE_CODES = [Code.CALL, Code.SUBSCRIBE, Code.UNSUBSCRIBE, Code.PUBLISH]
 
 
@@ -661,8 +1087,6 @@ def build_error_message(in_message, uri, description):
     """
     msg = Message.from_text(in_message)
     if msg.code in ERROR_PRONE_CODES:
-        MsgClass = CODE_TO_CLASS[msg.code]
-        msg = MsgClass.from_text(in_message)
         answer = ErrorMessage(
             request_code=msg.code,
             request_id=msg.request_id,
@@ -0,0 +1,342 @@
+"""
+Router metrics, in the style of Prometheus.
+
+Metrics are plain in-process counters, gauges and histograms.  Updating one is a dict lookup and an addition, so they
+are always on.  Label values are kept as they are given (often Code members) and only turned into text when the
+metrics are rendered, by MetricsHandler, in the Prometheus text exposition format.
+
+Gauges for things that already exist elsewhere, like the number of pending calls, are computed when the metrics are
+rendered rather than kept up to date.  See Gauge.set_function().
+"""
+from bisect import bisect_left
+from enum import Enum
+from math import inf
+
+from tornado.web import RequestHandler
+
+# Upper bounds, in seconds, of the buckets for the serialization histograms.
+SERIALIZATION_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 1e-2)
+
+# Upper bounds of the buckets for the number of deliveries per publication.
+FANOUT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def label_text(value):
+    """
+    Renders a label value.  Message codes are rendered by name.
+    """
+    if isinstance(value, Enum):
+        return value.name
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def label_set(names, values, extra=()):
+    pairs = ['{}="{}"'.format(name, label_text(value)) for (name, value) in zip(names, values)]
+    pairs.extend('{}="{}"'.format(name, label_text(value)) for (name, value) in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def number_text(value):
+    if value == inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric(object):
+    """
+    The base class of all metrics.  values maps tuples of label values to the value of the metric for them.
+    """
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=(), registry=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        (registry if registry is not None else default_registry).add(self)
+
+    def samples(self):
+        """
+        Yields (suffix, label values, extra labels, value) for every sample of the metric.
+        """
+        for (labels, value) in self.values.items():
+            yield ('', labels, (), value)
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.kind)]
+        for (suffix, labels, extra, value) in self.samples():
+            lines.append('{}{}{} {}'.format(self.name, suffix, label_set(self.labels, labels, extra), number_text(value)))
+        return '\n'.join(lines)
+
+    def clear(self):
+        self.values.clear()
+
+
+class Counter(Metric):
+    """
+    A value that only goes up.  inc() takes the label values positionally:
+
+        messages_received.inc(Code.PUBLISH)
+    """
+    kind = 'counter'
+
+    def inc(self, *labels):
+        self.values[labels] = self.values.get(labels, 0) + 1
+
+    def add(self, amount, *labels):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        return self.values.get(labels, 0)
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down.  It is either set directly, or computed by a function when it is rendered.  The
+    function returns an iterable of (label values, value) pairs.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=(), registry=None):
+        super().__init__(name, help, labels, registry)
+        self.function = None
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+    def inc(self, *labels):
+        self.values[labels] = self.values.get(labels, 0) + 1
+
+    def dec(self, *labels):
+        self.values[labels] = self.values.get(labels, 0) - 1
+
+    def set_function(self, function):
+        self.function = function
+
+    def samples(self):
+        if self.function is not None:
+            for (labels, value) in self.function():
+                yield ('', tuple(labels), (), value)
+        yield from super().samples()
+
+
+class Histogram(Metric):
+    """
+    Counts observations in buckets with fixed upper bounds.  Like Prometheus histograms, the rendered buckets are
+    cumulative, and come with the sum and count of all observations.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=SERIALIZATION_BUCKETS, registry=None):
+        super().__init__(name, help, labels, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        state = self.values.get(labels)
+        if state is None:
+            # Bucket counts, with one more for values above the last bound, then the sum of the values.
+            state = self.values[labels] = [0] * (len(self.buckets) + 2)
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def count(self, *labels):
+        state = self.values.get(labels)
+        return sum(state[:-1]) if state is not None else 0
+
+    def samples(self):
+        for (labels, state) in self.values.items():
+            cumulative = 0
+            for (bound, count) in zip(self.buckets + (inf,), state):
+                cumulative += count
+                yield ('_bucket', labels, (('le', number_text(bound)),), cumulative)
+            yield ('_sum', labels, (), state[-1])
+            yield ('_count', labels, (), cumulative)
+
+
+class LatencyHistogram(object):
+    """
+    An HDR-style histogram of durations in seconds.  Durations are recorded in whole microseconds, in log-linear
+    buckets: every power of two is split into 2**(precision_bits - 1) linear sub-buckets, so a value is known to within
+    one part in 2**(precision_bits - 1) (under 2% with the default of 7 bits), however large it is.  Only the buckets
+    that have been hit are stored.
+    """
+    __slots__ = ('precision_bits', 'counts', 'count', 'sum', 'min', 'max')
+
+    def __init__(self, precision_bits=7):
+        self.precision_bits = precision_bits
+        self.counts = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def bucket(self, microseconds):
+        """
+        The index of the bucket holding a value in microseconds.  Values below 2**precision_bits have a bucket each.
+        """
+        exponent = microseconds.bit_length() - self.precision_bits
+        if exponent <= 0:
+            return microseconds
+        half = 1 << (self.precision_bits - 1)
+        return (exponent + 1) * half + (microseconds >> exponent) - half
+
+    def bucket_value(self, index):
+        """
+        The highest value, in microseconds, that is counted in a bucket.
+        """
+        full = 1 << self.precision_bits
+        if index < full:
+            return index
+        half = full >> 1
+        exponent = index // half - 1
+        return ((index % half + half + 1) << exponent) - 1
+
+    def record(self, seconds):
+        microseconds = int(seconds * 1e6)
+        index = self.bucket(microseconds)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.sum += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent):
+        """
+        The value, in seconds, below which percent of the recorded values fall.  None if nothing was recorded.
+        """
+        if not self.count:
+            return None
+        rank = max(1, -(-self.count * percent // 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.bucket_value(index) / 1e6, self.max)
+        return self.max
+
+    def reset(self):
+        self.counts.clear()
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    @property
+    def stats(self):
+        """
+        The summary used by the meta-API, in seconds.
+        """
+        return {
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'p999': self.percentile(99.9),
+        }
+
+
+class Summary(Metric):
+    """
+    Quantiles computed when the metrics are rendered, like Gauge functions.  The function returns an iterable of
+    (label values, LatencyHistogram) pairs.
+    """
+    kind = 'summary'
+
+    quantiles = (0.5, 0.9, 0.99, 0.999)
+
+    def __init__(self, name, help, labels=(), registry=None):
+        super().__init__(name, help, labels, registry)
+        self.function = None
+
+    def set_function(self, function):
+        self.function = function
+
+    def samples(self):
+        if self.function is None:
+            return
+        for (labels, histogram) in self.function():
+            if not histogram.count:
+                continue
+            labels = tuple(labels)
+            for quantile in self.quantiles:
+                yield ('', labels, (('quantile', quantile),), histogram.percentile(quantile * 100))
+            yield ('_sum', labels, (), histogram.sum)
+            yield ('_count', labels, (), histogram.count)
+
+
+class MetricsRegistry(object):
+    """
+    The metrics rendered together by a MetricsHandler.
+    """
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError('metric {} already registered'.format(metric.name))
+        self.metrics[metric.name] = metric
+
+    def get(self, name):
+        return self.metrics.get(name)
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self.metrics.values()) + '\n'
+
+    def clear(self):
+        for metric in self.metrics.values():
+            metric.clear()
+
+
+default_registry = MetricsRegistry()
+
+
+class MetricsHandler(RequestHandler):
+    """
+    Serves a MetricsRegistry in the Prometheus text format.  Add it to a tornado web.Application:
+
+        (r'/metrics', MetricsHandler)
+        (r'/metrics', MetricsHandler, {'registry': my_registry})
+    """
+    def initialize(self, registry=None):
+        self.registry = registry if registry is not None else default_registry
+
+    def get(self):
+        self.set_header('Content-Type', CONTENT_TYPE)
+        self.write(self.registry.render())
+
+
+# The router's own metrics.
+
+messages_received = Counter('wampnado_messages_received_total', 'Messages received, by message type.', ('code',))
+messages_sent = Counter('wampnado_messages_sent_total', 'Messages sent, by message type.', ('code',))
+message_errors = Counter('wampnado_message_errors_total', 'Messages answered with an ERROR, by message type.', ('code',))
+
+bytes_received = Counter('wampnado_bytes_received_total', 'Serialized message bytes received, by transport.', ('transport',))
+bytes_sent = Counter('wampnado_bytes_sent_total', 'Serialized message bytes sent, by transport.', ('transport',))
+oversized_messages = Counter('wampnado_oversized_messages_total', 'RawSocket messages over the negotiated maximum length, by direction (rx or tx).', ('direction',))
+sessions_opened = Counter('wampnado_sessions_opened_total', 'Connections opened, by transport and negotiated serializer.', ('transport', 'protocol'))
+serialize_seconds = Histogram('wampnado_serialize_seconds', 'Time spent serializing outgoing messages.', ('protocol',))
+deserialize_seconds = Histogram('wampnado_deserialize_seconds', 'Time spent deserializing incoming messages.', ('protocol',))
+
+publications = Counter('wampnado_publications_total', 'Events published.')
+publish_fanout = Histogram('wampnado_publish_fanout', 'Subscribers each event was delivered to.', buckets=FANOUT_BUCKETS)
+
+invocations = Counter('wampnado_invocations_total', 'Calls invoked, by kind of procedure (remote or pseudo).', ('kind',))
+yields = Counter('wampnado_yields_total', 'YIELDs received, by outcome (result, progress, error or not_pending).', ('outcome',))
+pending_calls = Gauge('wampnado_pending_calls', 'Calls invoked and not answered yet.')
+call_latency = Summary('wampnado_call_latency_seconds', 'Time from CALL to final RESULT, by realm and procedure.', ('realm', 'procedure'))
+
+realm_sessions = Gauge('wampnado_realm_sessions', 'Sessions attached to each realm.', ('realm',))
+realm_subscriptions = Gauge('wampnado_realm_subscriptions', 'Subscriptions in each realm.', ('realm',))
+realm_registrations = Gauge('wampnado_realm_registrations', 'Registrations in each realm.', ('realm',))
+realm_write_buffer_bytes = Gauge('wampnado_realm_write_buffer_bytes', 'Bytes waiting to be written to the sessions of each realm.', ('realm',))
+realm_write_buffer_max_bytes = Gauge('wampnado_realm_write_buffer_max_bytes', 'The largest number of bytes waiting to be written to a single session of each realm.', ('realm',))
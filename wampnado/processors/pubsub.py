@@ -1,87 +1,83 @@
 """ WAMP-PubSub processors.
 """
-from tornado import gen
+from tornado import ioloop
 
-from wampnado.identifier import create_global_id
-from wampnado.messages import ErrorMessage, EventMessage, PublishMessage, PublishedMessage, SubscribeMessage, SubscribedMessage, BroadcastMessage
-from wampnado.processors import Processor
+from wampnado.identifier import random_id
+from wampnado.messages import PublishedMessage, SubscribedMessage
 from wampnado.auth import default_roles
 from wampnado.uri.error import WAMPSimpleException
 
 default_roles.register('subscribe')
 default_roles.register('publish')
 
-class SubscribeProcessor(Processor):
+
+def process_subscribe(message, handler):
     """
-    Responsible for dealing SUBSCRIBE messages.
+    Responsible for dealing SUBSCRIBE messages.  Answers with a SUBSCRIBED message.
     """
-    def process(self):
-        """
-        Return SUBSCRIBE message based on the input HELLO message.
-        """
-        received_message = SubscribeMessage(*self.message.value)
-
-        self.handler.realm.roles.authorize('subscribe', self.handler, received_message.code, received_message.request_id)
-
-        try:
-            subscription_id = self.handler.realm.add_subscriber(
-                received_message.uri,
-                self.handler,
-            )
-        except WAMPSimpleException as e:
-            raise e.to_exception(received_message.code, received_message.request_id)
-
-        return SubscribedMessage(
-            request_id=received_message.request_id,
-            subscription_id=subscription_id
+    handler.realm.roles.authorize('subscribe', handler, message.code, message.request_id)
+
+    try:
+        subscription_id = handler.realm.add_subscriber(
+            message.uri,
+            handler,
         )
+    except WAMPSimpleException as e:
+        raise e.to_exception(message.code, message.request_id)
+
+    # Retained events are replayed once the SUBSCRIBED message has gone out, so that they arrive after it.
+    if message.options.get_retained:
+        topic = handler.realm.uris[message.uri]
+        ioloop.IOLoop.current().add_callback(topic.replay, handler, subscription_id)
 
-class SubscribedProcessor(Processor):
+    return SubscribedMessage(
+        request_id=message.request_id,
+        subscription_id=subscription_id
+    )
+
+
+def process_subscribed(message, handler):
     """
     Responsible for dealing SUBSCRIBED messages.
     """
-    def process(self):
-        """
-        Return SUBSCRIBE message based on the input HELLO message.
-        """
-        received_message = SubscribedMessage(*self.message.value)
-        self.handler.add_subscriber(received_message.request_id, received_message.subscription_id)
-        return None
+    handler.register_subscription(message.request_id, message.subscription_id)
+    return None
 
-class PublishProcessor(Processor):
+
+def process_publish(message, handler):
     """
-    Responsible for dealing PUBLISH messages received by the server.
+    Responsible for dealing PUBLISH messages received by the server.  Answers with a PUBLISHED message if the
+    acknowledge option is set.
     """
-    def process(self):
-        """
-        Return PUBLISHED message based on the PUBLISH message received.
-        """
-        received_message = PublishMessage(*self.message.value)
-        uri = self.handler.realm.get(received_message.uri_name, msg=received_message)
+    try:
+        uri = handler.realm.get(message.uri_name, noraise=True)
+    except WAMPSimpleException as e:
+        raise e.to_exception(message.code, message.request_id)
+
+    # The arguments are only decoded if they are needed for the error.
+    if not handler.realm.roles.authorize('publish', handler, noraise=True):
+        raise handler.realm.errors.not_authorized.to_simple_exception(args=(message.code, message.request_id, *message.args), kwargs=message.kwargs)
+
+    # It is possible, and not an error, that nobody is subscribed.
+    if uri is None:
+        if message.options.acknowledge:
+            return PublishedMessage(request_id=message.request_id, publication_id=random_id())
+        return None
 
-        self.handler.realm.roles.authorize('publish', self.handler, received_message.code, received_message.request_id, *received_message.args, **received_message.kwargs)
+    # This will return the PublishedMessage if the appropriate option is set.
+    return uri.publish(handler, message)
 
-        # This will return the PublishedMessage if the appropriate option is set.
-        return uri.publish(self.handler, received_message)
-        
 
-class PublishedProcessor(Processor):
+def process_published(message, handler):
     """
     Responsible for dealing PUBLISHED messages received by the client.
     """
-    def process(self):
-        """
-        """
-        received_message = PublishedMessage(*self.message.value)
-        if hasattr(self.handler, 'on_published'):
-            self.handler.on_published(received_message.request_id, received_message.publication_id)
-
-class EventProcessor(Processor):
+    if hasattr(handler, 'on_published'):
+        handler.on_published(message.request_id, message.publication_id)
+
+
+def process_event(message, handler):
     """
     Handles pubsub events
     """
-    def process(self):
-        """
-        """
-        received_message = EventMessage(*self.message.value)
-        self.handler.event(received_message)
+    handler.event(message.subscription_id, *message.args, **message.kwargs)
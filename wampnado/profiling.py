@@ -0,0 +1,175 @@
+"""
+Opt-in profiling of message handling.
+
+While enabled, every sample_every-th message handled by an agent is timed (wall clock and CPU time of the handling
+thread) and, if memory profiling was asked for, measured with tracemalloc.  The measurements are aggregated per message
+code and processor.  While disabled, which is the default, an agent only checks profiler.enabled once per message.
+
+The report can be had from profiler.report(), from the wampnado.profile.get meta-procedure, or written to STDERR (or
+a file) on a signal, see install_signal_handler().
+"""
+import json
+import signal
+import tracemalloc
+from sys import stderr
+from time import perf_counter, thread_time
+
+# The number of allocation sites in a report.
+TOP_ALLOCATIONS = 10
+
+
+class ProfileStats(object):
+    """
+    The aggregated measurements of one processor handling one message code.
+    """
+    __slots__ = ('count', 'wall', 'cpu', 'max_wall', 'allocated', 'max_allocated')
+
+    def __init__(self):
+        self.count = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.max_wall = 0.0
+        self.allocated = 0
+        self.max_allocated = 0
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'wall': self.wall,
+            'cpu': self.cpu,
+            'mean_wall': self.wall / self.count if self.count else None,
+            'mean_cpu': self.cpu / self.count if self.count else None,
+            'max_wall': self.max_wall,
+            'allocated': self.allocated,
+            'max_allocated': self.max_allocated,
+        }
+
+
+class Profiler(object):
+    """
+    Aggregates the cost of handling messages per (code, processor).  Agents are expected to check enabled before
+    calling run(), like they do for the tracer.
+
+    allocated is the net memory allocated while the processor ran, and is only measured when the profiler was enabled
+    with memory=True.  For coroutine processors, only the part that runs before their first await is measured.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self.sample_every = 1
+        self.messages = 0
+        self.stats = {}
+
+        # Whether tracemalloc was started by enable(), and should be stopped by disable().
+        self.started_tracemalloc = False
+
+    def enable(self, memory=False, sample_every=1, frames=1):
+        """
+        Starts profiling.  With memory, tracemalloc is started, keeping frames frames per allocation.  Only one message
+        in sample_every is measured.
+        """
+        self.sample_every = max(1, sample_every)
+        self.memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self.started_tracemalloc = True
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        self.memory = False
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+            self.started_tracemalloc = False
+
+    def reset(self):
+        self.messages = 0
+        self.stats.clear()
+
+    def run(self, processor, msg, handler):
+        """
+        Calls processor(msg, handler), measuring it if this message is sampled.
+        """
+        self.messages += 1
+        if self.messages % self.sample_every:
+            return processor(msg, handler)
+
+        memory = self.memory and tracemalloc.is_tracing()
+        if memory:
+            allocated = tracemalloc.get_traced_memory()[0]
+        wall = perf_counter()
+        cpu = thread_time()
+        try:
+            return processor(msg, handler)
+        finally:
+            cpu = thread_time() - cpu
+            wall = perf_counter() - wall
+            if memory:
+                allocated = tracemalloc.get_traced_memory()[0] - allocated
+
+            key = (msg.code, getattr(processor, '__qualname__', repr(processor)))
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = ProfileStats()
+            stats.count += 1
+            stats.wall += wall
+            stats.cpu += cpu
+            stats.max_wall = max(stats.max_wall, wall)
+            if memory:
+                stats.allocated += allocated
+                stats.max_allocated = max(stats.max_allocated, allocated)
+
+    def allocations(self, top=TOP_ALLOCATIONS):
+        """
+        The source lines holding the most memory, from a tracemalloc snapshot.  Empty if memory is not being traced.
+        """
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        return [
+            {'location': str(statistic.traceback[0]), 'size': statistic.size, 'count': statistic.count}
+            for statistic in snapshot.statistics('lineno')[:top]
+        ]
+
+    def report(self, top=TOP_ALLOCATIONS):
+        """
+        Everything measured so far, costliest CPU first.
+        """
+        entries = sorted(self.stats.items(), key=lambda item: item[1].cpu, reverse=True)
+        return {
+            'enabled': self.enabled,
+            'memory': self.memory,
+            'sample_every': self.sample_every,
+            'messages': self.messages,
+            'processors': [
+                dict(code=code.name, processor=processor, **stats.to_dict())
+                for ((code, processor), stats) in entries
+            ],
+            'allocations': self.allocations(top),
+        }
+
+    def dump(self, stream=stderr):
+        json.dump(self.report(), stream, indent=2)
+        stream.write('\n')
+        stream.flush()
+
+
+# Shared by all agents that don't have a profiler of their own.
+profiler = Profiler()
+
+
+def install_signal_handler(signum=signal.SIGUSR2, path=None, profiler=profiler):
+    """
+    Dumps the report of profiler to STDERR, or to the file at path, whenever the process gets signal signum.
+    """
+    def dump(signum, frame):
+        if path is None:
+            profiler.dump()
+        else:
+            with open(path, 'w') as stream:
+                profiler.dump(stream)
+
+    signal.signal(signum, dump)
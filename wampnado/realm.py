@@ -1,13 +1,54 @@
 """
 Realm management.
 """
+import sys
+from time import monotonic
+from types import FunctionType, MethodType, ModuleType
+
+from tornado import ioloop
+
+from wampnado.uri import URIType, ExecutionMode
 from wampnado.uri.manager import URIManager
+from wampnado.uri.error import standard_errors
 from wampnado.identifier import create_global_id
 from wampnado.features import Options
 from wampnado.session import SessionTable
 from wampnado.auth import default_roles
+from wampnado.profiling import profiler
+from wampnado.watchdog import watchdog
+from wampnado.keepalive import keepalive
+from wampnado.metrics import call_latency, realm_sessions, realm_subscriptions, realm_registrations, realm_write_buffer_bytes, realm_write_buffer_max_bytes
+
+# How long, in seconds, a realm is kept after its last session leaves, in case someone joins it again.
+REALM_IDLE_TIMEOUT = 30
 
-realms = {}
+
+def deep_getsizeof(obj, seen=None):
+    """
+    Approximates the memory held by obj and everything it owns.  Handlers, functions, methods, classes and modules are
+    owned elsewhere, so they are counted as references only.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type, FunctionType, MethodType, ModuleType)) or hasattr(obj, 'write_message'):
+        return size
+
+    if isinstance(obj, dict):
+        size += sum(deep_getsizeof(k, seen) + deep_getsizeof(v, seen) for (k, v) in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_getsizeof(item, seen) for item in obj)
+
+    if hasattr(obj, '__dict__'):
+        size += deep_getsizeof(vars(obj), seen)
+    for slot in getattr(type(obj), '__slots__', ()):
+        if hasattr(obj, slot):
+            size += deep_getsizeof(getattr(obj, slot), seen)
+    return size
 
 
 class Realm(URIManager):
@@ -15,45 +56,292 @@ class Realm(URIManager):
     Represents a realm in WAMP parlance.  Connections within a realm can see and communicate with each other, those outside it cannot.
     A Realm is basically a URIManager with session information added in.
     """
-    def __init__(self, name):
+
+    # The pseudo-RPCs implementing the WAMP meta-API, plus the wampnado.* extensions to it, and the methods implementing
+    # them.  Like any pseudo-RPC, each returns the list of positional results.
+    meta_procedures = {
+        'wamp.session.count': 'session_count',
+        'wamp.session.list': 'session_list',
+        'wamp.session.get': 'session_get',
+        'wamp.subscription.list': 'subscription_list',
+        'wamp.subscription.lookup': 'subscription_lookup',
+        'wamp.subscription.match': 'subscription_match',
+        'wamp.subscription.get': 'subscription_get',
+        'wamp.subscription.list_subscribers': 'subscription_list_subscribers',
+        'wamp.subscription.count_subscribers': 'subscription_count_subscribers',
+        'wamp.subscription.get_events': 'subscription_get_events',
+        'wamp.registration.list': 'registration_list',
+        'wamp.registration.lookup': 'registration_lookup',
+        'wamp.registration.match': 'registration_match',
+        'wamp.registration.get': 'registration_get',
+        'wamp.registration.list_callees': 'registration_list_callees',
+        'wamp.registration.count_callees': 'registration_count_callees',
+        'wampnado.registration.get_latency': 'registration_get_latency',
+        'wampnado.profile.get': 'profile_get',
+        'wampnado.watchdog.get': 'watchdog_get',
+        'wampnado.keepalive.get': 'keepalive_get',
+    }
+
+    def __init__(self, name, registry=None, persistent=False, pool_sizes=None):
+        """
+        registry is the RealmRegistry the realm belongs to, if any.  A persistent realm is never reclaimed, even when it
+        has no sessions, which is useful for realms that the application populates itself.  pool_sizes maps the THREAD and
+        PROCESS execution modes to the number of workers of the realm's pools.
+        """
         super().__init__()
         self.name = name
+        self.registry = registry
+        self.persistent = persistent
+        for (mode, size) in (pool_sizes or {}).items():
+            self.set_pool_size(ExecutionMode(mode), size)
         self.sessions = SessionTable()
 
+        # When the last session left, or None if there are sessions.
+        self.idle_since = None
+
         self.roles = default_roles.copy()
 
-        # This is a bunch of functions implementing the pseudo-RPCs for session management.
-        def count_func():
-            return self.sessions.count 
-        def list_func():
-            return self.sessions.list
+        self.rpcs = Options(**{
+            uri_name.replace('.', '_'): self.create_procedure(uri_name, getattr(self, method))[0]
+            for (uri_name, method) in self.meta_procedures.items()
+        })
 
-        self.rpcs = Options(
-            wamp_session_count=self.create_procedure('wamp.session.count', count_func)[0],
-            wamp_session_list=self.create_procedure('wamp.session.list', list_func)[0],
-        )
+        # The meta-API reads the realm's tables, which only the IOLoop may do, and is cheap anyway.
+        for procedure in self.rpcs.values():
+            procedure.mode = ExecutionMode.INLINE
 
     def register_handler(self, handler):
         """
         Add the handler to the realm.
         """
-        return self.sessions.register(handler)
+        sessionid = self.sessions.register(handler)
+        self.idle_since = None
+        self.meta_event('wamp.session.on_join', self.sessions.details(sessionid))
+        return sessionid
 
     def deregister_handler(self, id):
         """
-        Remove the handler from the realm.  If the handler is the only one in the realm, the realm itself will be cleaned up.
+        Remove the handler from the realm.  If the handler is the only one in the realm, the realm itself will be cleaned
+        up once it has been idle for long enough.
+        """
+        handler = self.sessions.deregister(id)
+        if handler is not None:
+            self.meta_event('wamp.session.on_leave', id, handler.authid, handler.authrole)
+        if self.sessions.count == 0 and self.idle_since is None:
+            self.idle_since = monotonic()
+            if self.registry is not None:
+                self.registry.release(self)
+
+    def close(self):
+        """
+        Discards everything in the realm.  Called when the realm is reclaimed.
+        """
+        self.clear()
+        self.sessions.clear()
+        self.sessions.authroles.clear()
+        self.shutdown_executors()
+
+    def write_buffer_sizes(self):
+        """
+        The number of bytes waiting to be written to each session of the realm.
+        """
+        return [getattr(handler, 'write_buffer_size', 0) for handler in self.sessions.values()]
+
+    def memory_usage(self):
+        """
+        Approximates the memory held by this realm, in bytes.  Sessions are counted as references, since they are owned
+        by their transports, and the standard errors are shared by all realms.
+        """
+        seen = {id(self.errors), id(self.registry)}
+        return deep_getsizeof(self, seen)
+
+    def session_count(self, filter_authroles=None):
+        return [self.sessions.count_filtered(filter_authroles)]
+
+    def session_list(self, filter_authroles=None):
+        return [self.sessions.list_filtered(filter_authroles)]
+
+    def session_get(self, session_id):
+        details = self.sessions.details(session_id)
+        if details is None:
+            raise self.errors.no_such_session.to_simple_exception('not found', session_id=session_id)
+        return [details]
+
+    def subscription_list(self):
+        return [{'exact': list(self.topics.keys()), 'prefix': [], 'wildcard': []}]
+
+    def subscription_lookup(self, topic_uri, options=None):
+        topic = self.topics.get(self.registration_for(topic_uri, URIType.TOPIC))
+        return [topic.registration_id if topic is not None else None]
+
+    def subscription_match(self, topic_uri):
+        topic = self.topics.get(self.registration_for(topic_uri, URIType.TOPIC))
+        return [[topic.registration_id] if topic is not None else None]
+
+    def subscription_get(self, subscription_id):
+        return [self.subscription_details(self.get_subscription(subscription_id))]
+
+    def subscription_list_subscribers(self, subscription_id):
+        return [list(self.get_subscription(subscription_id).sessions.keys())]
+
+    def subscription_count_subscribers(self, subscription_id):
+        return [len(self.get_subscription(subscription_id).sessions)]
+
+    def subscription_get_events(self, subscription_id, limit=None):
+        return [self.get_events(subscription_id, limit)]
+
+    def registration_list(self):
+        return [{'exact': list(self.procedures.keys()), 'prefix': [], 'wildcard': []}]
+
+    def registration_lookup(self, procedure_uri, options=None):
+        procedure = self.procedures.get(self.registration_for(procedure_uri, URIType.PROCEDURE))
+        return [procedure.registration_id if procedure is not None else None]
+
+    def registration_match(self, procedure_uri):
+        return self.registration_lookup(procedure_uri)
+
+    def registration_get(self, registration_id):
+        return [self.registration_details(self.get_registration(registration_id))]
+
+    def registration_list_callees(self, registration_id):
+        return [self.get_registration(registration_id).callees]
+
+    def registration_count_callees(self, registration_id):
+        return [len(self.get_registration(registration_id).callees)]
+
+    def registration_get_latency(self, registration_id=None):
+        """
+        The CALL to RESULT latency of a registration, in seconds: count, min, max, mean, p50, p90, p99 and p999.  Without
+        a registration id, a dict of the latencies of every procedure that has been called, by uri.
         """
-        self.sessions.deregister(id)
-        if self.sessions.count == 0:
-            del realms[self.name]
+        if registration_id is not None:
+            return [self.get_registration(registration_id).latency.stats]
+        return [{procedure.name: procedure.latency.stats for procedure in self.procedures.values() if procedure.latency.count}]
+
+    def profile_get(self, top=None):
+        """
+        The report of the message handling profiler.  It covers the whole router, not just this realm.
+        """
+        return [profiler.report() if top is None else profiler.report(top)]
+
+    def watchdog_get(self):
+        """
+        The IOLoop lag and the recent stalls seen by the watchdog, with what was blocking the IOLoop.
+        """
+        return [watchdog.report()]
+
+    def keepalive_get(self):
+        """
+        The settings of the keepalive pings, the number of sessions pinged, and how many were closed as dead.
+        """
+        return [keepalive.report()]
+
+    def registration_for(self, uri_name, uri_type):
+        """
+        Returns the registration id of the named uri if it exists and is of the given type, otherwise None.
+        """
+        uri = self.uris.get(uri_name)
+        if uri is not None and uri.uri_type == uri_type:
+            return uri.registration_id
+
+
+class RealmRegistry(dict):
+    """
+    The realms of a router, by name.  Realms are created on demand, and reclaimed once they have had no sessions for
+    idle_timeout seconds (immediately if it is 0, never if it is None).  If max_realms is set, creating more realms than
+    that fails with wamp.error.no_such_realm.  New realms get pool_sizes, see Realm.
+    """
+    def __init__(self, idle_timeout=REALM_IDLE_TIMEOUT, max_realms=None, realm_cls=Realm, pool_sizes=None):
+        super().__init__()
+        self.idle_timeout = idle_timeout
+        self.max_realms = max_realms
+        self.realm_cls = realm_cls
+        self.pool_sizes = pool_sizes
+
+        self.created = 0
+        self.reclaimed = 0
+        self.rejected = 0
+
+    def get_realm(self, name, persistent=False):
+        """
+        If the realm exists, return it.  If it does not exist, create it, then return it.
+        """
+        realm = self.get(name)
+        if realm is None:
+            if self.max_realms is not None and len(self) >= self.max_realms:
+                self.rejected += 1
+                raise standard_errors.no_such_realm.to_simple_exception('realm limit reached', realm=name)
+            realm = self[name] = self.realm_cls(name, registry=self, persistent=persistent, pool_sizes=self.pool_sizes)
+            self.created += 1
+        return realm
+
+    def release(self, realm):
+        """
+        Called when the last session leaves a realm.  Schedules it to be reclaimed if it is still idle after idle_timeout.
+        """
+        if realm.persistent or self.idle_timeout is None:
+            return
+        if self.idle_timeout == 0:
+            self.reclaim(realm.name)
+        else:
+            ioloop.IOLoop.current().call_later(self.idle_timeout, self.reclaim, realm.name)
+
+    def reclaim(self, name):
+        """
+        Discards the named realm if it has been idle for at least idle_timeout.  Returns whether it was discarded.
+        """
+        realm = self.get(name)
+        if realm is None or realm.persistent or realm.idle_since is None:
+            return False
+        if self.idle_timeout and monotonic() - realm.idle_since < self.idle_timeout:
+            return False
+
+        del self[name]
+        realm.close()
+        self.reclaimed += 1
+        return True
+
+    def report(self, memory=True):
+        """
+        Statistics about the realms.  With memory=True, includes the approximate memory used by each realm, which walks
+        every realm and is not cheap.
+        """
+        report = Options(
+            realms=len(self),
+            created=self.created,
+            reclaimed=self.reclaimed,
+            rejected=self.rejected,
+            idle=sum(1 for realm in self.values() if realm.idle_since is not None),
+        )
+        if memory:
+            report.memory = {name: realm.memory_usage() for (name, realm) in self.items()}
+        return report
+
+
+realms = RealmRegistry()
 
 
 def get_realm(name):
     """
     If the realm exists, return it.  If it does not exist, create it, then return it.
     """
-    if not name in realms:
-        realms[name] = Realm(name)
+    return realms.get_realm(name)
+
+
+def realm_metric(measure):
+    """
+    Makes a Gauge function that computes measure(realm) for every realm when the metrics are rendered.
+    """
+    return lambda: [((realm.name,), measure(realm)) for realm in list(realms.values())]
+
 
-    return realms[name]
+call_latency.set_function(lambda: [
+    ((realm.name, procedure.name), procedure.latency)
+    for realm in list(realms.values()) for procedure in list(realm.procedures.values())
+])
+realm_sessions.set_function(realm_metric(lambda realm: realm.sessions.count))
+realm_subscriptions.set_function(realm_metric(lambda realm: len(realm.subscriptions)))
+realm_registrations.set_function(realm_metric(lambda realm: len(realm.procedures)))
+realm_write_buffer_bytes.set_function(realm_metric(lambda realm: sum(realm.write_buffer_sizes())))
+realm_write_buffer_max_bytes.set_function(realm_metric(lambda realm: max(realm.write_buffer_sizes(), default=0)))
 
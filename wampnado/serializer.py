@@ -1,8 +1,136 @@
 """
 Simple handlers for serializers.
+
+Every serializer a router can talk is registered in SERIALIZERS, by WebSocket subprotocol, and in RAWSOCKET_SERIALIZERS,
+by RawSocket serializer code.  JSON and MessagePack are always there.  CBOR and UBJSON are there if cbor2 and py-ubjson,
+respectively, are installed.
 """
+from collections.abc import Mapping
+
+from wampnado.messages import Message
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    import ubjson
+except ImportError:
+    ubjson = None
 
 BINARY_PROTOCOL = 'wamp.2.msgpack'
 JSON_PROTOCOL = 'wamp.2.json'
+CBOR_PROTOCOL = 'wamp.2.cbor'
+UBJSON_PROTOCOL = 'wamp.2.ubjson'
 NONE_PROTOCOL = ''
 
+# The serializers a router picks first when a client offers several, best first.  The binary ones are cheaper to
+# encode and decode, and shorter on the wire.
+SERIALIZER_PREFERENCE = (BINARY_PROTOCOL, CBOR_PROTOCOL, UBJSON_PROTOCOL, JSON_PROTOCOL)
+
+
+class Serializer(object):
+    """
+    A WAMP serializer.  protocol is its WebSocket subprotocol, code its RawSocket serializer code, and binary whether
+    it goes in binary WebSocket frames.  encode() turns a message (a Message or a SplicedMessage) into a str or bytes,
+    and decode() turns a str or bytes back into a Message.
+
+    parts, if given, splits a SplicedMessage into the bytes serialized for it alone and those shared with the other
+    messages ending with the same SerializedTail.  See wampnado.transports.compression.
+
+    lazy, if given, is a decode() that leaves the args and kwargs of messages undecoded until they are read.  See
+    PayloadMessage.
+    """
+    def __init__(self, protocol, code, binary, encode, decode, parts=None, lazy=None):
+        self.protocol = protocol
+        self.code = code
+        self.binary = binary
+        self.encode = encode
+        self.decode = decode
+        self.parts = parts
+        self.lazy = lazy
+
+    def decoder(self, lazy=False):
+        """
+        The function to decode messages with, which is lazy if it is asked for and there is one.
+        """
+        if lazy and self.lazy is not None:
+            return self.lazy
+        return self.decode
+
+    def __repr__(self):
+        return 'Serializer({!r})'.format(self.protocol)
+
+
+def json_parts(msg):
+    (head, tail) = msg.json_parts()
+    return (head.encode(), tail.encode())
+
+
+SERIALIZERS = {}
+RAWSOCKET_SERIALIZERS = {}
+
+
+def register_serializer(serializer):
+    """
+    Makes serializer available to every transport.  A serializer registered later replaces the one it has the
+    protocol or the RawSocket code of.
+    """
+    SERIALIZERS[serializer.protocol] = serializer
+    RAWSOCKET_SERIALIZERS[serializer.code] = serializer
+
+
+register_serializer(Serializer(JSON_PROTOCOL, 1, False, lambda msg: msg.json, Message.from_text, json_parts, Message.from_text_lazy))
+register_serializer(Serializer(BINARY_PROTOCOL, 2, True, lambda msg: msg.msgpack, Message.from_bin, lambda msg: msg.msgpack_parts(), Message.from_bin_lazy))
+
+if cbor2 is not None:
+    register_serializer(Serializer(CBOR_PROTOCOL, 3, True, lambda msg: cbor2.dumps(msg.value), lambda data: Message.from_value(cbor2.loads(data))))
+
+if ubjson is not None:
+    register_serializer(Serializer(UBJSON_PROTOCOL, 4, True, lambda msg: ubjson.dumpb(msg.value), lambda data: Message.from_value(ubjson.loadb(data))))
+
+
+class RegisteredProtocols(Mapping):
+    """
+    The supported_protocols of a transport that supports every registered serializer, including those registered after
+    it was made.
+    """
+    def __getitem__(self, protocol):
+        if protocol in SERIALIZERS:
+            return True
+        raise KeyError(protocol)
+
+    def __iter__(self):
+        return iter(SERIALIZERS)
+
+    def __len__(self):
+        return len(SERIALIZERS)
+
+
+def supported_protocols():
+    """
+    The supported_protocols of a transport that supports every registered serializer, now and later.
+    """
+    return RegisteredProtocols()
+
+
+def select_protocol(offered, supported, preference=SERIALIZER_PREFERENCE):
+    """
+    The protocol of offered ranked first in preference among those supported (a mapping of protocol to bool), or None
+    if there is none.  Unknown protocols are ignored.  Supported protocols missing from preference rank after those in
+    it, in the order they were offered.
+    """
+    ranks = {}
+    for (rank, protocol) in enumerate(preference):
+        # A protocol listed twice keeps its first, best, rank.
+        if supported.get(protocol):
+            ranks.setdefault(protocol, rank)
+    (best, best_rank) = (None, None)
+    for protocol in offered:
+        rank = ranks.get(protocol)
+        if rank is None and supported.get(protocol):
+            rank = len(preference)
+        if rank is not None and (best is None or rank < best_rank):
+            (best, best_rank) = (protocol, rank)
+    return best
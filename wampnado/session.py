@@ -10,6 +10,12 @@ class SessionTable(dict):
     Connections manager.
     """
 
+    def __init__(self):
+        super().__init__()
+
+        # authrole -> sessionids, kept up to date on register/deregister so that filtered counts don't need a scan.
+        self.authroles = {}
+
     @property
     def dict(self):
         """
@@ -19,18 +25,54 @@ class SessionTable(dict):
 
     @property
     def count(self):
-        return [len(self.keys())]
+        return len(self)
 
     @property
     def list(self):
         return list(self.keys())
 
+    def count_filtered(self, authroles=None):
+        """
+        The number of sessions, optionally only those having one of the given authroles.
+        """
+        if authroles is None:
+            return len(self)
+        return sum(len(self.authroles.get(authrole, ())) for authrole in authroles)
+
+    def list_filtered(self, authroles=None):
+        """
+        The sessionids, optionally only those having one of the given authroles.
+        """
+        if authroles is None:
+            return list(self.keys())
+        return [sessionid for authrole in authroles for sessionid in self.authroles.get(authrole, ())]
+
+    def details(self, sessionid):
+        """
+        The description of a session used by the meta-API, or None if there is no such session.
+        """
+        handler = self.get(sessionid)
+        if handler is None:
+            return None
+        return {
+            'session': sessionid,
+            'authid': handler.authid,
+            'authrole': handler.authrole,
+            'authmethod': getattr(handler, 'authmethod', None),
+            'transport': {'protocol': getattr(handler, 'protocol', None), 'rtt': getattr(handler, 'rtt', None)},
+        }
+
     def register(self, handler):
         self[handler.sessionid] = handler
+        self.authroles.setdefault(handler.authrole, set()).add(handler.sessionid)
         return handler.sessionid
 
     def deregister(self, sessionid):
         if sessionid in self:
-            return self.pop(sessionid)
-
-
+            handler = self.pop(sessionid)
+            sessions = self.authroles.get(handler.authrole)
+            if sessions is not None:
+                sessions.discard(sessionid)
+                if not sessions:
+                    del self.authroles[handler.authrole]
+            return handler
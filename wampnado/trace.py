@@ -0,0 +1,186 @@
+"""
+Message tracing.
+
+Every agent has a tracer, which is checked once per message sent or received.  While it is disabled (the default),
+that check is all that tracing costs.  When it is enabled, the messages that pass its realm, session and code filters
+are appended to a bounded ring buffer, and are only formatted when the buffer is read or drained.
+"""
+import atexit
+import json
+from collections import deque
+from sys import stdout
+from time import time
+
+from tornado.ioloop import PeriodicCallback
+
+from wampnado.messages import Code, encode_bin_as_b64
+
+TRACE_BUFFER_SIZE = 4096
+TRACE_DRAIN_INTERVAL = 0.1  # seconds
+
+RX = 'rx'
+TX = 'tx'
+
+
+class TraceRecord(object):
+    """
+    A single traced message.  The message itself is kept, and only formatted when the record is.
+    """
+    __slots__ = ('timestamp', 'direction', 'realm', 'sessionid', 'code', 'message')
+
+    def __init__(self, direction, realm, sessionid, code, message):
+        self.timestamp = time()
+        self.direction = direction
+        self.realm = realm
+        self.sessionid = sessionid
+        self.code = code
+        self.message = message
+
+    @property
+    def text(self):
+        """
+        The message as JSON, whatever serializer it was sent or received with.
+        """
+        try:
+            return self.message.json
+        except (AttributeError, TypeError, ValueError):
+            return json.dumps(encode_bin_as_b64(getattr(self.message, 'value', self.message)), default=repr)
+
+    def to_dict(self):
+        return {
+            'timestamp': self.timestamp,
+            'direction': self.direction,
+            'realm': self.realm,
+            'session': self.sessionid,
+            'code': self.code,
+            'message': self.text,
+        }
+
+    def __str__(self):
+        return '{}|{}|{}|: {}'.format(self.direction, self.realm, self.sessionid, self.text)
+
+
+class RingBufferSink(object):
+    """
+    Keeps the last size trace records.  Appending never blocks and never grows the buffer; once it is full, the oldest
+    records are dropped and counted in dropped.
+
+    If a stream is given, start() periodically drains the buffer to it from the IOLoop, so that a slow stream delays
+    one batch of writes rather than every message.
+    """
+    def __init__(self, size=TRACE_BUFFER_SIZE, stream=None, interval=TRACE_DRAIN_INTERVAL):
+        self.records = deque(maxlen=size)
+        self.stream = stream
+        self.interval = interval
+        self.dropped = 0
+        self.periodic = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def append(self, record):
+        if len(self.records) == self.records.maxlen:
+            self.dropped += 1
+        self.records.append(record)
+
+    def drain(self):
+        """
+        Removes and returns all the buffered records, oldest first.
+        """
+        records = []
+        while self.records:
+            records.append(self.records.popleft())
+        return records
+
+    def flush(self):
+        """
+        Drains the buffer to the stream.
+        """
+        records = self.drain()
+        if records and self.stream is not None:
+            self.stream.write(''.join(str(record) + '\n' for record in records))
+            self.stream.flush()
+
+    def start(self):
+        """
+        Starts draining to the stream on the current IOLoop.  Does nothing if there is no stream, or if it is already
+        started.  Whatever is left in the buffer is flushed when the interpreter exits.
+        """
+        if self.stream is not None and self.periodic is None:
+            self.periodic = PeriodicCallback(self.flush, self.interval * 1000)
+            self.periodic.start()
+            atexit.register(self.flush)
+
+    def stop(self):
+        if self.periodic is not None:
+            self.periodic.stop()
+            self.periodic = None
+        self.flush()
+
+
+class Tracer(object):
+    """
+    Records the messages sent and received by agents.  Callers are expected to check enabled before calling trace(),
+    so that a disabled tracer costs a single attribute lookup:
+
+        if self.tracer.enabled:
+            self.tracer.trace(TX, self, msg)
+
+    realms, sessions and codes restrict tracing to the given realm names, session ids and message codes.  None means
+    no restriction.
+    """
+    def __init__(self, enabled=False, sink=None, realms=None, sessions=None, codes=None):
+        self.enabled = enabled
+        self.sink = sink if sink is not None else RingBufferSink()
+        self.set_filters(realms=realms, sessions=sessions, codes=codes)
+
+    def set_filters(self, realms=None, sessions=None, codes=None):
+        """
+        Replaces all the filters.
+        """
+        self.realms = set(realms) if realms is not None else None
+        self.sessions = set(sessions) if sessions is not None else None
+        self.codes = set(Code(code) for code in codes) if codes is not None else None
+
+    def enable(self, **filters):
+        """
+        Enables tracing.  If any filters are given, they replace the current ones.
+        """
+        if filters:
+            self.set_filters(**filters)
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def trace(self, direction, handler, message):
+        """
+        Records a message sent (TX) or received (RX) by handler, if it passes the filters.
+        """
+        code = getattr(message, 'code', None)
+        if self.codes is not None and code not in self.codes:
+            return
+
+        sessionid = getattr(handler, 'sessionid', None)
+        if self.sessions is not None and sessionid not in self.sessions:
+            return
+
+        realm = getattr(handler, 'realm', None)
+        realm = getattr(realm, 'name', None)
+        if self.realms is not None and realm not in self.realms:
+            return
+
+        self.sink.append(TraceRecord(direction, realm, sessionid, code, message))
+
+    def records(self):
+        """
+        Drains and returns the buffered records.
+        """
+        return self.sink.drain()
+
+
+# Shared by all agents that don't have a tracer of their own.  Disabled until enable() is called on it.
+tracer = Tracer()
+
+# Used by the Debug handlers, which trace every message to STDOUT.
+debug_tracer = Tracer(enabled=True, sink=RingBufferSink(stream=stdout))
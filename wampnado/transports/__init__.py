@@ -3,9 +3,24 @@ Pre-packaged transports.
 """
 from datetime import datetime
 
-from tornado.websocket import WebSocketHandler
+from tornado.escape import utf8
+from tornado.iostream import StreamClosedError
+from tornado.websocket import WebSocketHandler, WebSocketClosedError
 
-from wampnado.serializer import JSON_PROTOCOL, BINARY_PROTOCOL, NONE_PROTOCOL
+from wampnado.serializer import JSON_PROTOCOL, NONE_PROTOCOL, SERIALIZERS, SERIALIZER_PREFERENCE, select_protocol, supported_protocols
+from wampnado.metrics import sessions_opened
+from wampnado.transports.compression import parse_extensions, format_extensions
+
+# The kinds of listener ApplicationServer can serve.  Also the transport labels used by wampnado.metrics.
+WEBSOCKET = 'websocket'
+RAWSOCKET = 'rawsocket'
+
+def stream_buffer_size(stream):
+    """
+    The number of bytes waiting to be written to a tornado IOStream.
+    """
+    buffer = getattr(stream, '_write_buffer', None)
+    return len(buffer) if buffer is not None else 0
 
 
 class Transport:
@@ -29,25 +44,94 @@ class WebSocketTransport(WebSocketHandler, Transport):
     """
     The wrapper for using a Tornado WebSocket.  It can be passed into Tornado as a handler.
     """
-    supported_protocols = {
-        JSON_PROTOCOL: True,
-        BINARY_PROTOCOL: True,
-    }
+    supported_protocols = supported_protocols()
+
+    # The transport label used by wampnado.metrics.
+    transport_name = WEBSOCKET
+
+    # The subprotocols the server selects first when a client offers several, best first.
+    protocol_preference = SERIALIZER_PREFERENCE
+
+    # The permessage-deflate settings, a wampnado.transports.compression.DeflateOptions, or None for no compression.
+    compression = None
+
+    # The window bits the server compresses with, once permessage-deflate has been negotiated.
+    deflate_window_bits = None
+
+    @property
+    def write_buffer_size(self):
+        """
+        The number of bytes waiting to be written to the peer.
+        """
+        if self.ws_connection is None or self.ws_connection.stream is None:
+            return 0
+        return stream_buffer_size(self.ws_connection.stream)
+
+    def get_compression_options(self):
+        if self.compression is None:
+            return None
+        return self.compression.compression_options()
+
+    async def get(self, *args, **kwargs):
+        """
+        Negotiates the server's side of permessage-deflate before tornado accepts the connection.
+        """
+        if self.compression is not None:
+            offer = self.request.headers.get('Sec-WebSocket-Extensions')
+            if offer:
+                (header, self.deflate_window_bits) = self.compression.negotiate(offer)
+                self.request.headers['Sec-WebSocket-Extensions'] = header
+                # Tells WAMPAgent.write_message() to pass SplicedMessages on, to be compressed once.
+                self.splices = self.deflate_window_bits is not None and self.compression.shared
+        await super().get(*args, **kwargs)
+
+    def set_header(self, name, value):
+        if name == 'Sec-WebSocket-Extensions' and self.deflate_window_bits is not None:
+            value = format_extensions(parse_extensions(value))
+        super().set_header(name, value)
+
+    def write_message(self, message, binary=False, spliced=None):
+        """
+        Sends message, compressed if permessage-deflate was negotiated and it is at least compression.threshold long.
+        spliced is the SplicedMessage it was serialized from, if any, whose shared part is then only compressed once.
+        """
+        if self.deflate_window_bits is None:
+            return super().write_message(message, binary=binary)
+
+        message = utf8(message)
+        if len(message) < self.compression.threshold:
+            return self.write_frame(message, binary, compressed=False)
+        if spliced is not None and self.compression.shared:
+            return self.write_frame(self.compression.deflate_spliced(spliced, SERIALIZERS[self.protocol], self.deflate_window_bits), binary, compressed=True)
+        return super().write_message(message, binary=binary)
+
+    def write_frame(self, payload, binary, compressed):
+        """
+        Writes a single data frame, bypassing tornado's compressor, like tornado's own write_message() does.
+        """
+        connection = self.ws_connection
+        if connection is None or connection.is_closing():
+            raise WebSocketClosedError()
+        try:
+            return connection._write_frame(True, 0x2 if binary else 0x1, payload, flags=connection.RSV1 if compressed else 0)
+        except StreamClosedError:
+            raise WebSocketClosedError()
 
     def select_subprotocol(self, subprotocols):
         """
-        Select WAMP 2 subprocotol
+        Selects the WAMP 2 subprotocol ranked first by the server among those offered, the handler's
+        preferred_protocol first if it has one.  Offers of unknown subprotocols are ignored.  If none is supported,
+        none is selected, and the session talks JSON, which all WAMP implementations should support.
         """
-        current_protocol = JSON_PROTOCOL    # All WAMP implementations should support json, so we default to that.
-        for protocol in subprotocols:
-            if self.supported_protocols[protocol]:
-                current_protocol = protocol
-                if protocol == self.preferred_protocol:
-                    self.protocol = protocol
-                    return protocol
+        preference = self.protocol_preference
+        preferred = getattr(self, 'preferred_protocol', None)
+        if preferred is not None:
+            preference = (preferred,) + preference
 
-        self.protocol = current_protocol
-        return current_protocol
+        protocol = select_protocol(subprotocols, self.supported_protocols, preference)
+        self.protocol = protocol or JSON_PROTOCOL
+        sessions_opened.inc(self.transport_name, self.protocol)
+        return protocol
 
 
 
@@ -67,3 +151,8 @@ class LocalTransport(Transport):
     supported_protocols = {
         NONE_PROTOCOL: True
     }
+
+    transport_name = 'local'
+
+    # Nothing is ever buffered, since messages are passed by reference.
+    write_buffer_size = 0
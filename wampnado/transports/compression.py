@@ -0,0 +1,114 @@
+"""
+permessage-deflate (RFC 7692) for WebSocketTransport.
+
+Tornado does the negotiation and compresses whole messages.  On top of that, DeflateOptions lets the server choose its
+own window size, sends messages shorter than threshold uncompressed (which RFC 7692 allows, frame by frame), and,
+with shared, compresses the shared part of a SplicedMessage once for all of its recipients.
+
+Compressing once needs every message to be compressed on its own, so shared makes the server announce
+server_no_context_takeover.  The per-recipient head of the message is then compressed and sync-flushed, and followed by
+the compressed tail, which makes a valid deflate stream since the tail refers to nothing before it.
+"""
+import zlib
+
+DEFLATE_LEVEL = 6
+DEFLATE_MEM_LEVEL = 8
+DEFLATE_WINDOW_BITS = 15
+DEFLATE_THRESHOLD = 256     # bytes
+
+# The end of a sync-flushed deflate stream, which RFC 7692 leaves off the wire.
+SYNC_FLUSH_TAIL = b'\x00\x00\xff\xff'
+
+EXTENSION = 'permessage-deflate'
+
+
+def parse_extensions(header):
+    """
+    Parses a Sec-WebSocket-Extensions header into a list of (name, parameters).  Parameters without a value are None.
+    """
+    extensions = []
+    for extension in header.split(','):
+        (name, *parameters) = [part.strip() for part in extension.split(';')]
+        params = {}
+        for parameter in parameters:
+            (key, _, value) = parameter.partition('=')
+            params[key.strip()] = value.strip().strip('"') or None
+        extensions.append((name, params))
+    return extensions
+
+
+def format_extensions(extensions):
+    """
+    The reverse of parse_extensions().  Parameters whose value is None are written without one.
+    """
+    return ', '.join(
+        '; '.join([name] + [key if value is None else '{}={}'.format(key, value) for (key, value) in params.items()])
+        for (name, params) in extensions
+    )
+
+
+class DeflateOptions(object):
+    """
+    The compression settings of a WebSocket listener.  level and mem_level are those of zlib.compressobj().
+    window_bits is the largest window the server compresses with, from 9 to 15, which a client may lower further.
+    """
+    def __init__(self, level=DEFLATE_LEVEL, mem_level=DEFLATE_MEM_LEVEL, window_bits=DEFLATE_WINDOW_BITS,
+        threshold=DEFLATE_THRESHOLD, shared=False):
+        if not 9 <= window_bits <= 15:
+            raise ValueError('window_bits must be between 9 and 15, not {}'.format(window_bits))
+        self.level = level
+        self.mem_level = mem_level
+        self.window_bits = window_bits
+        self.threshold = threshold
+        self.shared = shared
+
+    def compression_options(self):
+        """
+        The options for tornado's WebSocketHandler.get_compression_options().
+        """
+        return {'compression_level': self.level, 'mem_level': self.mem_level}
+
+    def negotiate(self, header):
+        """
+        Rewrites the first permessage-deflate offer of a Sec-WebSocket-Extensions header into the parameters the server
+        accepts, which tornado then echoes back.  Returns the new header and the negotiated server window bits, or the
+        header untouched and None if there is no offer.
+
+        Tornado ignores parameters without a value, so server_no_context_takeover is given an empty one here, and
+        written back without it by WebSocketTransport.set_header().
+        """
+        extensions = parse_extensions(header)
+        for (name, params) in extensions:
+            if name == EXTENSION:
+                window_bits = min(int(params.get('server_max_window_bits') or 15), self.window_bits)
+                if window_bits < 15:
+                    params['server_max_window_bits'] = str(window_bits)
+                if self.shared:
+                    params['server_no_context_takeover'] = ''
+                return (format_extensions(extensions), window_bits)
+        return (header, None)
+
+    def deflate(self, data, window_bits, final=True):
+        """
+        Compresses data on its own.  Unless final, the sync flush marker is kept, so that more can follow.
+        """
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -window_bits, self.mem_level)
+        data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        return data[:-len(SYNC_FLUSH_TAIL)] if final else data
+
+    def deflate_spliced(self, msg, serializer, window_bits):
+        """
+        Compresses a SplicedMessage with a Serializer that has parts, reusing the compressed tail if another recipient
+        already had it compressed with the same settings.
+        """
+        (head, tail) = serializer.parts(msg)
+        if not tail:
+            return self.deflate(head, window_bits)
+
+        key = (serializer.protocol, self.level, self.mem_level, window_bits)
+        deflated = msg.tail.deflated.get(key)
+        if deflated is None:
+            deflated = self.deflate(tail, window_bits)
+            if msg.tail.cached:
+                msg.tail.deflated[key] = deflated
+        return self.deflate(head, window_bits, final=False) + deflated
@@ -2,11 +2,22 @@
 Methods common to all TCP transports.
 """
 from enum import Enum
-from warnings import warn
-from datetime import datetime
+from time import perf_counter
 
-from wampnado.serializer import JSON_PROTOCOL, BINARY_PROTOCOL, NONE_PROTOCOL
-from wampnado.messages import Message
+from tornado.escape import utf8
+from tornado.iostream import StreamClosedError
+
+from wampnado.serializer import JSON_PROTOCOL, SERIALIZERS, supported_protocols
+from wampnado.metrics import messages_sent, bytes_received, bytes_sent, serialize_seconds, deserialize_seconds, oversized_messages
+from wampnado.transports import stream_buffer_size, RAWSOCKET
+from wampnado.trace import RX, TX
+from wampnado.uri.error import standard_errors
+
+# The largest message length a RawSocket handshake can announce.
+MAX_LENGTH = 2**24
+
+# How much of an oversized message is read at a time when it is discarded.
+DISCARD_CHUNK_SIZE = 64 * 1024
 
 class HandshakeError(Enum):
     NoError=0
@@ -35,69 +46,132 @@ class EncodedMessage(bytearray):
         self.insert(3, length & 0xff)
         self.extend(payload)
 
+def length_exponent(length):
+    """
+    The handshake nibble announcing the largest power of two, from 2**9 to 2**24, that is no larger than length.
+    """
+    return min(15, max(0, length.bit_length() - 10))
+
+
 class TCPSocketPeer:
     """
     Contains the side-agnostic bits of the socket communication.
     """
-    supported_protocols = {
-        JSON_PROTOCOL: True,
-        BINARY_PROTOCOL: True,
-    }
+    supported_protocols = supported_protocols()
+
+    # The transport label used by wampnado.metrics.
+    transport_name = RAWSOCKET
+
+    # The longest message this side accepts, as announced in the handshake (rounded down to a power of two).  A longer
+    # message fails the connection, as the RawSocket spec requires, unless discard_oversized is set, in which case it
+    # is read in chunks and thrown away.  Either way, it is never buffered whole.
+    max_receive_length = MAX_LENGTH
+    discard_oversized = False
 
     def __init__(self, stream):
         self.protocol = JSON_PROTOCOL
         self.stream = stream
         self.max_length = 0 # Until negotiated otherwise
 
-    def pong(self):
+    @property
+    def receive_length_exponent(self):
+        return length_exponent(self.max_receive_length)
+
+    @property
+    def write_buffer_size(self):
         """
-        Respond to a ping.
+        The number of bytes waiting to be written to the peer.
         """
-        self.stream.write(b'\x02\0\0\0')
+        return stream_buffer_size(self.stream)
 
-    def ping(self):
+    def close(self, code=None, reason=None):
         """
-        Send a ping.
+        Close the connection.  RawSocket has no close codes, so code and reason are only there for compatibility with WebSockets.
         """
-        self.stream.write(b'\x01\0\0\0')
+        self.stream.close()
+
+    def pong(self, data=b''):
+        """
+        Respond to a ping, echoing its payload.
+        """
+        self.stream.write(EncodedMessage(MessageType.Pong, data))
+
+    def ping(self, data=b''):
+        """
+        Send a ping.  The answer is passed to on_pong(), if the peer has one, like WebSocket pings are.
+        """
+        self.stream.write(EncodedMessage(MessageType.Ping, data))
 
     def write_message(self, msg, **kwargs):
         """
         Takes a WAMP message, puts the correct header around it, and sends it to the client iff it is within the negotiated max_length using the negotiated serializer.
+        Otherwise, raises a simple wamp.error.payload_size_exceeded exception, so that whoever caused the message can be
+        sent an ERROR instead.
         """
-        if self.protocol == JSON_PROTOCOL:
-            serialized_msg = msg.json.encode()
-        elif self.protocol == BINARY_PROTOCOL:
-            serialized_msg = msg.msgpack
+        # These methods come before the agent's in the MRO of a RawSocket handler, so they trace for it.
+        tracer = getattr(self, 'tracer', None)
+        if tracer is not None and tracer.enabled:
+            tracer.trace(TX, self, msg)
+        messages_sent.inc(msg.code)
+        start = perf_counter()
+        serialized_msg = utf8(SERIALIZERS[self.protocol].encode(msg))
+        serialize_seconds.observe(perf_counter() - start, self.protocol)
 
         if len(serialized_msg) > self.max_length:
-            warn('Message of length {} exceeded negotiated max length {}.'.format(len(serialized_msg), self.max_length))
-            return False
+            oversized_messages.inc(TX)
+            raise standard_errors.payload_size_exceeded.to_simple_exception(
+                'Message of length {} exceeds the negotiated max length {}.'.format(len(serialized_msg), self.max_length),
+            )
 
         full_msg = EncodedMessage(MessageType.Regular, serialized_msg)
+        bytes_sent.add(len(serialized_msg), self.transport_name)
 
         self.stream.write(full_msg)
 
+    async def discard(self, length):
+        """
+        Reads and drops length bytes, a chunk at a time.
+        """
+        while length > 0:
+            length -= len(await self.stream.read_bytes(min(length, DISCARD_CHUNK_SIZE), partial=True))
+
     async def read_message(self):
-        msg_type = MessageType((await self.stream.read_bytes(1))[0])
+        """
+        Reads the next frame.  Returns the message it holds, or None for pings, pongs and discarded frames.
+        """
+        header = await self.stream.read_bytes(4)
+        length = (header[1] << 16) + (header[2] << 8) + header[3]
+        try:
+            msg_type = MessageType(header[0])
+        except ValueError:
+            # Its payload could be anything, so there is no telling where the next frame starts.
+            self.stream.close()
+            raise StreamClosedError(ValueError('unknown message type {}'.format(header[0])))
+
+        if length > self.max_receive_length:
+            oversized_messages.inc(RX)
+            if not self.discard_oversized:
+                self.stream.close()
+                raise StreamClosedError(ValueError('message of length {} exceeds max length {}'.format(length, self.max_receive_length)))
+            await self.discard(length)
+            return None
+
+        data = await self.stream.read_bytes(length) if length else b''
 
         if msg_type == MessageType.Regular:
-            length_bytes = await self.stream.read_bytes(3)
-            length = (length_bytes[0] << 16) + (length_bytes[1] << 8) + length_bytes[2]
-
-            data = await self.stream.read_bytes(length)
-            if self.protocol == JSON_PROTOCOL:
-                msg = Message.from_text(data)
-            elif self.protocol == BINARY_PROTOCOL:
-                msg = Message.from_bin(data)
-            else:
-                warn('unknown protocol ' + self.protocol)
-
+            bytes_received.add(length, self.transport_name)
+            start = perf_counter()
+            msg = SERIALIZERS[self.protocol].decoder(getattr(self, 'lazy', False))(data)
+            deserialize_seconds.observe(perf_counter() - start, self.protocol)
+
+            tracer = getattr(self, 'tracer', None)
+            if tracer is not None and tracer.enabled:
+                tracer.trace(RX, self, msg)
             return msg
             
         elif msg_type == MessageType.Ping:
-            self.pong()
+            self.pong(data)
         elif msg_type == MessageType.Pong:
-            warn('{} got ping response'.format(datetime.now()))
-        else:
-            warn('got unknown message type {}' + msg_type.value)
+            on_pong = getattr(self, 'on_pong', None)
+            if on_pong is not None:
+                on_pong(data)
@@ -1,9 +1,10 @@
+import socket
 from warnings import warn
 
-from tornado.iostream import StreamClosedError
+from tornado.iostream import IOStream, StreamClosedError
 from tornado.tcpclient import TCPClient
 
-from wampnado.serializer import JSON_PROTOCOL, BINARY_PROTOCOL, NONE_PROTOCOL
+from wampnado.serializer import BINARY_PROTOCOL, SERIALIZERS
 from wampnado.transports import Transport
 from wampnado.transports.tcp import TCPSocketPeer, HandshakeError
 
@@ -17,7 +18,7 @@ class TCPSocketClientTransport(TCPSocketPeer):
 
         N0-N1: 0x7f - A magic number to idenitfy the beginning of the WAMP protocol
         N2: The maximum message length the client will accept.  Values are 2**(n+9)
-        N3: Serializer selector.  0 - undefined, 1 - JSON, 2 - MessagePack, 3-15 Reserved
+        N3: Serializer selector.  0 - undefined, 1 - JSON, 2 - MessagePack, 3 - CBOR, 4 - UBJSON, 5-15 Reserved
         N4-N7: Reserved, must be 0.
 
         The response is also 8 nibbles:
@@ -25,12 +26,11 @@ class TCPSocketClientTransport(TCPSocketPeer):
         N2: 
         """
 
-        if serializer == JSON_PROTOCOL:
-            serializer_code = 1
-        elif serializer == BINARY_PROTOCOL:
-            serializer_code = 2
+        if serializer not in SERIALIZERS:
+            raise ValueError('unknown serializer {}'.format(serializer))
+        serializer_code = SERIALIZERS[serializer].code
 
-        await self.stream.write(b''.join([b'\x7f', bytes([0xf0 + serializer_code]), b'\0\0']))
+        await self.stream.write(b''.join([b'\x7f', bytes([(self.receive_length_exponent << 4) + serializer_code]), b'\0\0']))
 
         error = HandshakeError.NoError
 
@@ -48,10 +48,8 @@ class TCPSocketClientTransport(TCPSocketPeer):
         else:
             self.max_length = 2**(9 + length_part)
 
-        if serializer_code == 1:
-            self.protocol = JSON_PROTOCOL
-        elif serializer_code == 2:
-            self.protocol = BINARY_PROTOCOL
+        if serializer_echo_code == serializer_code:
+            self.protocol = serializer
         else:
             error = HandshakeError.SerializerUnsupported
 
@@ -66,14 +64,22 @@ class TCPSocketClientTransport(TCPSocketPeer):
     async def run(self):
         success = await self.handshake()
         if success:
-            while True:
-                try:
+            try:
+                while True:
                     msg = await self.read_message()
-                    await self.handle_message(msg)
-                except StreamClosedError:
-                    break
+                    # Pings, pongs and discarded frames come back as None, like on the server.
+                    if msg is not None:
+                        await self.handle_message(msg)
+            except StreamClosedError:
+                pass
+            except Exception as e:
+                # Like on the server, what can't be read or handled fails the connection.
+                warn('closed connection due to {!r}'.format(e))
+            finally:
+                self.stream.close()
         else:
             warn('handshake failed.')
+            self.stream.close()
 
 
 
@@ -92,3 +98,16 @@ class TCPConnectorClient(TCPClient):
         stream = await super().connect(self.host, self.port)
         return self.transport_cls(stream)
 
+
+class UnixConnectorClient(object):
+    """
+    Like TCPConnectorClient, but connects to a router listening on a Unix domain socket at path.
+    """
+    def __init__(self, path, transport_cls=TCPSocketClientTransport):
+        self.path = path
+        self.transport_cls = transport_cls
+
+    async def connect(self):
+        stream = IOStream(socket.socket(socket.AF_UNIX, socket.SOCK_STREAM))
+        await stream.connect(self.path)
+        return self.transport_cls(stream)
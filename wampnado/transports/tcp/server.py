@@ -1,7 +1,11 @@
+from warnings import warn
+
 from tornado.tcpserver import TCPServer
 from tornado.iostream import StreamClosedError
+from tornado.netutil import bind_unix_socket
 
-from wampnado.serializer import JSON_PROTOCOL, BINARY_PROTOCOL, NONE_PROTOCOL
+from wampnado.serializer import RAWSOCKET_SERIALIZERS
+from wampnado.metrics import sessions_opened
 
 from wampnado.transports import Transport
 from wampnado.transports.tcp import TCPSocketPeer, HandshakeError
@@ -12,8 +16,20 @@ class TCPSocketServerTransport(TCPSocketPeer, Transport):
     """
 
     def __init__(self, stream):
-        super(TCPSocketPeer, self).__init__(stream)
-        super(Transport, self).__init__()
+        TCPSocketPeer.__init__(self, stream)
+
+    @classmethod
+    def factory(cls, handler_cls):
+        """
+        Makes a class handling RawSocket connections with handler_cls, like WAMPMetaServerHandler.factory() does for
+        WebSockets.  The transport comes first, since it writes and reads whole messages rather than serialized ones.
+        """
+        class StreamHandler(cls, handler_cls):
+            def __init__(self, stream):
+                cls.__init__(self, stream)
+                handler_cls.__init__(self)
+
+        return StreamHandler
 
     async def handshake(self):
         """
@@ -23,7 +39,7 @@ class TCPSocketServerTransport(TCPSocketPeer, Transport):
 
         N0-N1: 0x7f - A magic number to idenitfy the beginning of the WAMP protocol
         N2: The maximum message length the client will accept.  Values are 2**(n+9)
-        N3: Serializer selector.  0 - undefined, 1 - JSON, 2 - MessagePack, 3-15 Reserved
+        N3: Serializer selector.  0 - undefined, 1 - JSON, 2 - MessagePack, 3 - CBOR, 4 - UBJSON, 5-15 Reserved
         N4-N7: Reserved, must be 0.
 
         The response is also 8 nibbles:
@@ -41,10 +57,9 @@ class TCPSocketServerTransport(TCPSocketPeer, Transport):
 
         serializer_code = selector[0] & 0xf
 
-        if serializer_code == 1:
-            self.protocol = JSON_PROTOCOL
-        elif serializer_code == 2:
-            self.protocol = BINARY_PROTOCOL
+        serializer = RAWSOCKET_SERIALIZERS.get(serializer_code)
+        if serializer is not None and self.supported_protocols.get(serializer.protocol):
+            self.protocol = serializer.protocol
         else:
             error = HandshakeError.SerializerUnsupported
 
@@ -52,44 +67,70 @@ class TCPSocketServerTransport(TCPSocketPeer, Transport):
             error = HandshakeError.UnknownOption
 
         if error == HandshakeError.NoError:
-            await self.stream.write(b''.join([b'\x7f', bytes([0xf0 + serializer_code]), b'\0\0']))
+            await self.stream.write(b''.join([b'\x7f', bytes([(self.receive_length_exponent << 4) + serializer_code]), b'\0\0']))
+            sessions_opened.inc(self.transport_name, self.protocol)
             return True
         else:
             await self.stream.write(b''.join([b'\x7f', bytes([error.value << 4]), b'\0\0']))
             return False
 
     async def run(self):
-        success = await self.handshake()
+        try:
+            success = await self.handshake()
+        except StreamClosedError:
+            return
+
         if success:
-            while True:
-                try:
+            try:
+                while True:
                     msg = await self.read_message()
-                    await self.handle_message(msg)
-
-                except StreamClosedError:
-                    break
+                    # Pings and pongs are answered by the transport, and come back as None.
+                    if msg is not None:
+                        await self.handle_message(msg)
+            except StreamClosedError:
+                pass
+            except Exception as e:
+                # A peer sending what can't be read or handled fails the connection, rather than leaving it open with
+                # nobody reading it.
+                warn('closed connection {} due to {!r}'.format(self.sessionid, e))
+            finally:
+                self.stream.close()
+                self.on_close()
+        else:
+            self.stream.close()
 
 
 class TCPSocketListener(TCPServer):
     """
-    The transport for WAMP over a regular TCP socket.
+    The transport for WAMP over a regular TCP socket, or a Unix domain socket.  Both can be served by the same
+    listener:
+
+    listener = TCPSocketListener(WAMPMetaServerHandler)
+    listener.listen(8081)
+    listener.listen_unix('/run/wampnado.sock')
 
     Note that although it works as a transport from the perspective of things calling it from the outside, within WAMP the TCPSocketServer class is the true transport.
     """
-    def __init__(self, sc):
+    def __init__(self, sc, ssl_options=None, max_message_length=None, discard_oversized=False):
         """
-        Pass the class for the handler that you want to use.
+        Pass the class for the handler that you want to use.  The class handling the connections is built from it here,
+        once for the listener.  max_message_length is the longest message accepted from clients, see
+        TCPSocketPeer.max_receive_length.
         """
         self.SpawnClass = sc
-        super().__init__()
+        self.StreamHandler = TCPSocketServerTransport.factory(sc)
+        if max_message_length is not None:
+            self.StreamHandler.max_receive_length = max_message_length
+        self.StreamHandler.discard_oversized = discard_oversized
+        super().__init__(ssl_options=ssl_options)
 
+    def listen_unix(self, path, mode=0o600, backlog=128):
+        """
+        Starts accepting connections on a Unix domain socket at path, which is replaced if it already exists.  The
+        RawSocket handshake and framing are the same as over TCP, without the cost of the TCP/IP stack.
+        """
+        self.add_socket(bind_unix_socket(path, mode=mode, backlog=backlog))
 
     async def handle_stream(self, stream, address):
-        SC = self.SpawnClass
-        class StreamHandler(TCPSocketServerTransport, SC):
-            def __init__(self, stream):
-                super(SC, self).__init__()
-                super(TCPSocketServerTransport, self).__init__(stream)
-
-        server = StreamHandler(stream)
+        server = self.StreamHandler(stream)
         await server.run()
@@ -2,6 +2,7 @@
 Used to handle PubSub uris publishers and subscribers
 """
 from enum import Enum
+from datetime import datetime
 import tornadis
 
 from wampnado.messages import BroadcastMessage, PUBLISHER_NODE_ID
@@ -25,14 +26,33 @@ class URIType(Enum):
     PROCEDURE = 1
     ERROR = 2
     
+class ExecutionMode(Enum):
+    """
+    Where the callback of a pseudo-RPC runs.
+    INLINE: on the IOLoop, answering the CALL right away.
+    COROUTINE: as a task on the IOLoop.  The callback returns an awaitable.
+    THREAD: in the thread pool of the realm.
+    PROCESS: in the process pool of the realm.  The callback, its arguments and its result must be picklable.
+    All but INLINE answer the CALL from the IOLoop once the result is ready.
+    """
+    INLINE = 'inline'
+    COROUTINE = 'coroutine'
+    THREAD = 'thread'
+    PROCESS = 'process'
+
+
 class URI(object):
     """
     Represent a URI.  This should probably be mostly used through the subclasses.
     """
+    # The URIManager holding this uri, set when it is added to one.  Errors are shared between managers, and never have one.
+    manager = None
+
     def __init__(self, name, uri_type):
         self.registration_id=create_global_id()
         self.name = name
         self.uri_type = uri_type
+        self.created = datetime.utcnow()
 
     def __str__(self):
         return self.name
@@ -3,7 +3,22 @@ A module to regularize the errors that WAMP can issue.
 """
 
 from wampnado.uri import URI, URIType
-from wampnado.messages import ErrorMessage
+from wampnado.messages import Code, SerializedTail, SplicedMessage
+from wampnado.features import Options
+
+# How many distinct pre-serialized ERROR messages each Error keeps.  Errors carrying ids are rarely sent twice, so the
+# cache is simply emptied when it fills up.
+TEMPLATE_CACHE_SIZE = 64
+
+
+def template_key(value):
+    """
+    A cache key for value that also tells apart the values that are equal but serialized differently, like True, 1 and
+    1.0.  Unhashable values make a TypeError when the key is looked up.
+    """
+    if isinstance(value, tuple):
+        return (tuple, tuple(template_key(v) for v in value))
+    return (type(value), value)
 
 
 class WAMPException(Exception):
@@ -59,6 +74,9 @@ class Error(URI):
     def __init__(self, name):
         super().__init__(name, URIType.ERROR)
 
+        # Pre-serialized trailing elements of the ERROR messages for this error, by (details, args, kwargs).
+        self.templates = {}
+
     # Errors don't have connections, so this is always empty.  Provided to for compatibility with Topics and Procedures.
     connections = {}
 
@@ -71,7 +89,39 @@ class Error(URI):
         return True
 
     def message(self, request_code, request_id, *args, details={}, **kwargs):
-        return ErrorMessage(uri=self.name, request_code=request_code, request_id=request_id, details=details, args=args, kwargs=kwargs)
+        """
+        Returns the ERROR message answering the given request.  Only the request code and id are serialized per message,
+        the rest comes from a template shared by every identical error.
+        """
+        return SplicedMessage(Code.ERROR, [Code(request_code), request_id], self.template(details, args, kwargs))
+
+    def template(self, details, args, kwargs):
+        """
+        Returns the SerializedTail (Details, Error, Arguments, ArgumentsKw) of an ERROR message, reusing a cached one
+        when the same error was sent before.
+        """
+        try:
+            key = (template_key(tuple(sorted(details.items()))), template_key(tuple(args)), template_key(tuple(sorted(kwargs.items()))))
+            template = self.templates.get(key)
+        except TypeError:
+            # Something unhashable, so it can't be cached.
+            key = None
+            template = None
+
+        if template is None:
+            if kwargs:
+                template = SerializedTail(details, self.name, list(args), kwargs)
+            elif args:
+                template = SerializedTail(details, self.name, list(args))
+            else:
+                template = SerializedTail(details, self.name)
+
+            if key is not None:
+                if len(self.templates) >= TEMPLATE_CACHE_SIZE:
+                    self.templates.clear()
+                self.templates[key] = template
+
+        return template
 
     def to_exception(self, request_code, request_id, *args, **kwargs):
         """
@@ -92,3 +142,56 @@ class Error(URI):
         Raises the error and sends it to the given handler.  This is used when some activity is initiated by one handler, and sent to another.
         """
         handler.write_message(self.message(request_code, request_id, *args, **kwargs))
+
+
+# All the Errors created in this process, by uri.  See intern_error().
+interned_errors = {}
+
+
+def intern_error(name):
+    """
+    Returns the Error for the given uri, creating it the first time only.  Errors are immutable, so a single instance
+    (and its cache of pre-serialized messages) serves every realm.
+    """
+    error = interned_errors.get(name)
+    if error is None:
+        error = interned_errors[name] = Error(name)
+    return error
+
+
+# The errors defined by the WAMP standard, plus a few of our own.  Errors are stateless, so there is a single table shared by
+# every realm, instead of each realm creating (and registering) its own copies.
+standard_errors = Options(
+    # The first two of these aren't technically errors, but just messages used in closing a connection.  But close enough.
+    close_realm=intern_error('wamp.close.close_realm'),
+    goodbye_and_out=intern_error('wamp.close.goodbye_and_out'),
+
+    # These are the errors that are required and standardized by WAMP Protocol standard
+    invalid_uri=intern_error('wamp.error.invalid_uri'),
+    no_such_procedure=intern_error('wamp.error.no_such_procedure'),
+    procedure_already_exists=intern_error('wamp.error.procedure_already_exists'),
+    no_such_registration=intern_error('wamp.error.no_such_registration'),
+    no_such_subscription=intern_error('wamp.error.no_such_subscription'),
+    invalid_argument=intern_error('wamp.error.invalid_argument'),
+    system_shutdown=intern_error('wamp.close.system_shutdown'),
+    protocol_violation=intern_error('wamp.error.protocol_violation'),
+    not_authorized=intern_error('wamp.error.not_authorized'),
+    authorization_failed=intern_error('wamp.error.authorization_failed'),
+    no_such_realm=intern_error('wamp.error.no_such_realm'),
+    no_such_role=intern_error('wamp.error.no_such_role'),
+    no_such_session=intern_error('wamp.error.no_such_session'),
+    cancelled=intern_error('wamp.error.canceled'),
+    option_not_allowed=intern_error('wamp.error.option_not_allowed'),
+    no_eligible_callee=intern_error('wamp.error.no_eligible_callee'),
+    option_disallowed__disclose_me=intern_error('wamp.error.option_disallowed.disclose_me'),
+    network_failure=intern_error('wamp.error.network_failure'),
+    payload_size_exceeded=intern_error('wamp.error.payload_size_exceeded'),
+
+    # These aren't part of the WAMP standard, but I use them, so here they are.
+    not_pending=intern_error('wamp.error.not_pending'),    # Sent if we get a YIELD message but there is no call pending.
+    unsupported=intern_error('wamp.error.unsupported'),    # Sent when we get a message that we don't recognize.
+    general_error=intern_error('wamp.error.general_error'),    # Sent when we get a message that we don't recognize.
+)
+
+# The same errors, by uri.
+standard_error_uris = {error.name: error for error in standard_errors.values()}
@@ -0,0 +1,162 @@
+"""
+Retained event history for Topics.
+
+A Topic with history enabled keeps its most recent events, so that new subscribers can get the current state
+without waiting for the next publication.  Events are kept pre-serialized, so replaying them costs about as much
+as forwarding them did in the first place.
+"""
+from collections import deque
+from time import time
+
+from wampnado.features import Options
+from wampnado.messages import Code, SplicedMessage
+
+# The default upper bound on the memory held by all the event histories of a single realm.
+REALM_HISTORY_BYTES = 16 * 2**20
+
+
+class HistoryBudget(object):
+    """
+    Bounds the memory held by all the event histories of a realm.  When it is exhausted, the topic being appended
+    to evicts its own oldest events until the realm is back within budget.
+    """
+    def __init__(self, max_bytes=REALM_HISTORY_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+
+    @property
+    def exceeded(self):
+        return self.max_bytes is not None and self.bytes > self.max_bytes
+
+    @property
+    def stats(self):
+        return Options(bytes=self.bytes, max_bytes=self.max_bytes, evictions=self.evictions)
+
+
+class HistoryEntry(object):
+    """
+    A single retained event.  tail is a stripped copy of the SerializedTail of its args and kwargs, which is shared by
+    every replay.  It keeps a single serialization and caches nothing, so size is all the memory it holds: replays in
+    the other protocol, and wamp.subscription.get_events, decode it every time.
+    """
+    __slots__ = ('publication_id', 'timestamp', 'tail', 'size')
+
+    # Sent with every replayed event, so that subscribers can tell them from live ones.
+    details = {'retained': True}
+
+    def __init__(self, publication_id, payload):
+        self.publication_id = publication_id
+        self.timestamp = time()
+        self.tail = payload.stripped()
+        self.size = self.tail.size
+
+    @property
+    def args(self):
+        elements = self.tail.elements
+        return elements[0] if elements else []
+
+    @property
+    def kwargs(self):
+        elements = self.tail.elements
+        return elements[1] if len(elements) > 1 else {}
+
+    def event_message(self, subscription_id):
+        """
+        Returns an EVENT message for the given subscription.
+        """
+        return SplicedMessage(Code.EVENT, [subscription_id, self.publication_id, self.details], self.tail)
+
+    def to_dict(self, subscription_id):
+        """
+        The representation used by the wamp.subscription.get_events meta-procedure.
+        """
+        return {
+            'timestamp': self.timestamp,
+            'subscription': subscription_id,
+            'publication': self.publication_id,
+            'details': self.details,
+            'args': self.args,
+            'kwargs': self.kwargs,
+        }
+
+
+class EventHistory(object):
+    """
+    A ring buffer of the last events published to a topic.  It is bounded by number of events (max_events), by
+    age in seconds (max_age), by the memory used by the topic (max_bytes), and by the HistoryBudget of the realm.
+    """
+    def __init__(self, max_events=None, max_age=None, max_bytes=None, budget=None):
+        self.max_events = max_events
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.budget = budget if budget is not None else HistoryBudget(max_bytes=None)
+
+        self.entries = deque()
+        self.bytes = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def append(self, publication_id, payload):
+        """
+        Retains an event, given the SerializedTail of its args and kwargs, evicting older ones as needed to stay within
+        bounds.
+        """
+        entry = HistoryEntry(publication_id, payload)
+        self.entries.append(entry)
+        self.bytes += entry.size
+        self.budget.bytes += entry.size
+
+        while self.entries and (
+            (self.max_events is not None and len(self.entries) > self.max_events)
+            or (self.max_bytes is not None and self.bytes > self.max_bytes)
+            or self.budget.exceeded
+        ):
+            self.evict()
+
+        self.expire()
+
+    def evict(self):
+        """
+        Drops the oldest event.
+        """
+        entry = self.entries.popleft()
+        self.bytes -= entry.size
+        self.budget.bytes -= entry.size
+        self.evictions += 1
+        self.budget.evictions += 1
+
+    def expire(self):
+        """
+        Drops the events that are older than max_age.  This is done lazily, on append and read, rather than on a timer.
+        """
+        if self.max_age is None:
+            return
+
+        cutoff = time() - self.max_age
+        while self.entries and self.entries[0].timestamp < cutoff:
+            self.evict()
+
+    def clear(self):
+        """
+        Drops all events, returning their memory to the realm's budget.
+        """
+        self.budget.bytes -= self.bytes
+        self.bytes = 0
+        self.entries.clear()
+
+    def events(self, limit=None):
+        """
+        Returns the retained events, oldest first.  If limit is given, only the newest limit events are returned.
+        """
+        self.expire()
+        entries = list(self.entries)
+        if limit is not None:
+            entries = entries[-limit:] if limit > 0 else []
+        return entries
+
+    @property
+    def stats(self):
+        return Options(events=len(self.entries), bytes=self.bytes, evictions=self.evictions)
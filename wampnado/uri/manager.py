@@ -1,16 +1,20 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from threading import RLock
 
 from wampnado import processors
-from wampnado.uri import URIType
+from wampnado.uri import URIType, ExecutionMode
 from wampnado.uri.topic import Topic
 from wampnado.uri.procedure import Procedure
-from wampnado.uri.error import Error
-from wampnado.identifier import create_global_id
+from wampnado.uri.error import intern_error, standard_errors, standard_error_uris
+from wampnado.uri.history import HistoryBudget
+from wampnado.identifier import release_global_id, random_id
 from wampnado.features import Options
 from wampnado.messages import PublishMessage
 
 from re import compile
 
+URI_PATTERN = compile(r"^([0-9a-z_]+\.)*([0-9a-z_]+)$")
+
 class URIManager:
     """
     Manages all existing uris to which handlers can potentially
@@ -24,38 +28,31 @@ class URIManager:
         # A table of the URIs.
         self.uris = {}
 
-        self.uri_pattern = compile(r"^([0-9a-z_]+\.)*([0-9a-z_]+)$")
-
-        # Reserve all the standard errors.
-        self.errors = Options(
-            # The first two of these aren't technically errors, but just messages used in closing a connection.  But close enough.
-            close_realm=self.create_error('wamp.close.close_realm')[0],
-            goodbye_and_out=self.create_error('wamp.close.goodbye_and_out')[0],
-
-            # These are the errors that are required and standardized by WAMP Protocol standard
-            invalid_uri=self.create_error('wamp.error.invalid_uri')[0],
-            no_such_procedure=self.create_error('wamp.error.no_such_procedure')[0],
-            procedure_already_exists=self.create_error('wamp.error.procedure_already_exists')[0],
-            no_such_registration=self.create_error('wamp.error.no_such_registration')[0],
-            no_such_subscription=self.create_error('wamp.error.no_such_subscription')[0],
-            invalid_argument=self.create_error('wamp.error.invalid_argument')[0],
-            system_shutdown=self.create_error('wamp.close.system_shutdown')[0],
-            protocol_violation=self.create_error('wamp.error.protocol_violation')[0],
-            not_authorized=self.create_error('wamp.error.not_authorized')[0],
-            authorization_failed=self.create_error('wamp.error.authorization_failed')[0],
-            no_such_realm=self.create_error('wamp.error.no_such_realm')[0],
-            no_such_role=self.create_error('wamp.error.no_such_role')[0],
-            cancelled=self.create_error('wamp.error.canceled')[0],
-            option_not_allowed=self.create_error('wamp.error.option_not_allowed')[0],
-            no_eligible_callee=self.create_error('wamp.error.no_eligible_callee')[0],
-            option_disallowed__disclose_me=self.create_error('wamp.error.option_disallowed.disclose_me')[0],
-            network_failure=self.create_error('wamp.error.network_failure')[0],
-
-            # These aren't part of the WAMP standard, but I use them, so here they are.
-            not_pending=self.create_error('wamp.error.not_pending')[0],    # Sent if we get a YIELD message but there is no call pending.
-            unsupported=self.create_error('wamp.error.unsupported')[0],    # Sent when we get a message that we don't recognize.
-            general_error=self.create_error('wamp.error.general_error')[0],    # Sent when we get a message that we don't recognize.
-        )
+        # Indexes kept up to date as URIs and subscriptions come and go, so that the meta-API never has to scan self.uris.
+        # registration id -> Topic, registration id -> Procedure, and subscriber subscription id -> Topic respectively.
+        self.topics = {}
+        self.procedures = {}
+        self.subscriptions = {}
+
+        # sessionid -> names of the URIs the session subscribed to, provided or reserved, so that a leaving session only
+        # visits those.  It may name URIs the session has since left, or that are gone, but never misses one.
+        self.session_uris = {}
+
+        self.uri_pattern = URI_PATTERN
+
+        # Bounds the memory of the event histories of all the topics in this manager.
+        self.history_budget = HistoryBudget()
+
+        # The standard errors are stateless, so every manager shares the same ones.  See wampnado.uri.error.
+        self.errors = standard_errors
+
+        # Where the callbacks of pseudo-RPCs that don't ask for an ExecutionMode, and of pseudo-subscribers, are run.
+        # Pseudo-subscribers only honour THREAD; otherwise, they run inline.
+        self.default_mode = ExecutionMode.INLINE
+
+        # The pools for the THREAD and PROCESS execution modes, created when first used.  See set_pool_size().
+        self.pool_sizes = {ExecutionMode.THREAD: None, ExecutionMode.PROCESS: None}
+        self.executors = {}
 
 
     def get(self, uri_name, noraise=False):
@@ -66,6 +63,8 @@ class URIManager:
             raise self.errors.invalid_uri.to_simple_exception('uri is not valid.', details=Options(uri=uri_name))
 
         uri = self.uris.get(uri_name)
+        if uri is None:
+            uri = standard_error_uris.get(uri_name)
         if uri is None and not noraise:
             raise self.errors.no_such_role.to_simple_exception('not found')
         return uri
@@ -84,6 +83,12 @@ class URIManager:
                 self.uris[name] = uri_obj
                 registration_id = self.uris[name].registration_id
                 self.registrations[registration_id] = name
+                if uri_obj.uri_type == URIType.TOPIC:
+                    self.topics[registration_id] = uri_obj
+                    uri_obj.manager = self
+                elif uri_obj.uri_type == URIType.PROCEDURE:
+                    self.procedures[registration_id] = uri_obj
+                    uri_obj.manager = self
                 return self.uris[name], registration_id
             elif returnifexists:
                 return uri, uri.registration_id
@@ -97,7 +102,13 @@ class URIManager:
         """
         Creates a uri that can be subscribed and published to.
         """
-        args = self.create(name, Topic(name, reserver=reserver))
+        uri = self.uris.get(name)
+        if uri is not None:
+            args = (uri, uri.registration_id)
+        else:
+            args = self.create(name, Topic(name, reserver=reserver, subscriptions=self.subscriptions))
+            if reserver is not None:
+                self.index_session(reserver, name)
 
         if args[0].uri_type != URIType.TOPIC:
             raise self.errors.no_such_subscription.to_simple_exception('uri type error', requested_type=URIType.TOPIC, uri=name, required_type=args[0].uri_type)
@@ -107,18 +118,70 @@ class URIManager:
 
     def create_error(self, name):
         """
-        Adds an entry for an error URI.
+        Adds an entry for an error URI.  The Error itself is interned, and shared with any other manager using it.
         """
-        args = self.create(name, Error(name))
+        args = self.create(name, intern_error(name))
 
         return args
 
-    def create_procedure(self, name, provider_handler):
+    def create_procedure(self, name, provider_handler, mode=None):
         """
         Add a new procedure provided by the provider_handler.  request_msg should generally be specified whenever the user.
+        For pseudo-rpcs, mode is the ExecutionMode of the callback.
+        """
+        (procedure, registration_id) = self.create(name, Procedure(name, provider_handler, mode=mode), returnifexists=False)
+
+        if not procedure.pseudo:
+            self.index_session(provider_handler, name)
+
+        sessionid = procedure.callees[0]
+        self.meta_event('wamp.registration.on_create', sessionid, self.registration_details(procedure))
+        self.meta_event('wamp.registration.on_register', sessionid, registration_id)
+
+        return procedure, registration_id
+
+
+    def executor(self, mode):
+        """
+        The pool running the callbacks of the given ExecutionMode (THREAD or PROCESS).
+        """
+        executor = self.executors.get(mode)
+        if executor is None:
+            if mode == ExecutionMode.THREAD:
+                executor = ThreadPoolExecutor(max_workers=self.pool_sizes[mode], thread_name_prefix='wampnado-callback')
+            elif mode == ExecutionMode.PROCESS:
+                executor = ProcessPoolExecutor(max_workers=self.pool_sizes[mode])
+            else:
+                raise ValueError('{} does not run in a pool'.format(mode))
+            self.executors[mode] = executor
+        return executor
+
+    def set_pool_size(self, mode, size):
+        """
+        Sets the number of workers of the THREAD or PROCESS pool.  None is the concurrent.futures default.  The current
+        pool, if any, finishes what it was given, and is replaced when next needed.
         """
-        return self.create(name, Procedure(name, provider_handler), returnifexists=False)
+        self.pool_sizes[mode] = size
+        executor = self.executors.pop(mode, None)
+        if executor is not None:
+            executor.shutdown(wait=False)
 
+    def shutdown_executors(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=False)
+        self.executors.clear()
+
+    def offload_callbacks(self, max_workers=None):
+        """
+        Runs pseudo-RPCs that don't ask for an ExecutionMode, and pseudo-subscribers, in a pool of max_workers threads
+        instead of on the IOLoop, so that a slow one doesn't stall every connection.  Their results are sent from the
+        IOLoop once they are ready.  With max_workers=0, they go back to running on the IOLoop.
+        """
+        if max_workers == 0:
+            self.default_mode = ExecutionMode.INLINE
+        else:
+            self.set_pool_size(ExecutionMode.THREAD, max_workers)
+            self.default_mode = ExecutionMode.THREAD
 
     def reserve_topic(self, uri_name, provider_handler):
         """
@@ -126,24 +189,87 @@ class URIManager:
         """
         return self.create_topic(uri_name, reserver=provider_handler)
 
+    def enable_history(self, uri_name, max_events=None, max_age=None, max_bytes=None):
+        """
+        Creates the topic if needed, and starts retaining its last events.  The history is bounded by max_events, by
+        max_age (in seconds), by max_bytes, and by the history_budget shared by all topics in this manager.
+        """
+        (topic, _) = self.create_topic(uri_name)
+        return topic.enable_history(max_events=max_events, max_age=max_age, max_bytes=max_bytes, budget=self.history_budget)
+
+    def get_subscription(self, subscription_id, noraise=False):
+        """
+        Returns the topic matching either a topic registration id or the subscription id of one of its subscribers.
+        """
+        topic = self.topics.get(subscription_id) or self.subscriptions.get(subscription_id)
+        if topic is not None:
+            return topic
+
+        if not noraise:
+            raise self.errors.no_such_subscription.to_simple_exception('not found', subscription_id=subscription_id)
+
+    def get_registration(self, registration_id):
+        """
+        Returns the procedure with the given registration id.
+        """
+        procedure = self.procedures.get(registration_id)
+        if procedure is None:
+            raise self.errors.no_such_registration.to_simple_exception('not found', registration_id=registration_id)
+        return procedure
+
+    def get_events(self, subscription_id, limit=None):
+        """
+        Returns the retained events of a subscription, oldest first.  Implements wamp.subscription.get_events.
+        """
+        topic = self.get_subscription(subscription_id)
+        if topic.history is None:
+            return []
+        return [entry.to_dict(subscription_id) for entry in topic.history.events(limit)]
+
     def remove(self, registration_id):
         """
         Removes a given registration, regardless of type.
         """
-        name = self.registrations.pop(registration_id, False)
-        if name:
-            for registration_id, registration_uri in self.registrations.items():
-                if name == registration_uri:
-                    self.registrations.pop(name)
-            return self.uris.pop(name)
-
+        name = self.registrations.pop(registration_id, None)
+        if name is not None:
+            uri = self.uris.pop(name)
+            # Errors are interned, so their ids are still in use elsewhere.
+            if uri.uri_type != URIType.ERROR:
+                release_global_id(registration_id)
+            if uri.uri_type == URIType.TOPIC:
+                self.topics.pop(registration_id, None)
+                uri.disable_history()
+                self.meta_event('wamp.subscription.on_delete', None, registration_id)
+            elif uri.uri_type == URIType.PROCEDURE:
+                self.procedures.pop(registration_id, None)
+                self.meta_event('wamp.registration.on_delete', None, registration_id)
+            return uri
+
+
+    def clear(self):
+        """
+        Removes every uri, releasing their ids.  Used when the manager itself is discarded.
+        """
+        for registration_id in list(self.registrations.keys()):
+            uri = self.remove(registration_id)
+            if uri is not None and uri.uri_type == URIType.TOPIC:
+                for subscription_id in list(uri.subscribers.keys()):
+                    uri.remove_subscription(subscription_id)
 
     def add_subscriber(self, uri_name, handler):
         """
         Add a handler as a uri's subscriber.  
         """
+        created = uri_name not in self.uris
         (uri, _) = self.create_topic(uri_name)
-        subscription_id = self.uris[uri.name].add_subscriber(handler)
+        subscription_id = uri.add_subscriber(handler)
+        self.index_session(handler, uri_name)
+
+        sessionid = uri.subscribers[subscription_id].sessionid
+        if created:
+            self.meta_event('wamp.subscription.on_create', sessionid, self.subscription_details(uri))
+        self.meta_event('wamp.subscription.on_subscribe', sessionid, uri.registration_id)
+
         return subscription_id
 
     def remove_subscriber(self, uri, handler):
@@ -153,30 +279,79 @@ class URIManager:
         - handler
         """
         uri = self.uris.get(uri)
-        uri.remove_subscriber(handler)
+        if handler.sessionid in uri.sessions:
+            uri.remove_subscriber(handler)
+            self.meta_event('wamp.subscription.on_unsubscribe', handler.sessionid, uri.registration_id)
+            if uri.reserver is not handler:
+                self.session_uris.get(handler.sessionid, set()).discard(uri.name)
 
-        # If there are no publishers and no subscribers, delete it.
-        if len(uri.subscriptions.keys) == 0 and len(uri.publishers.keys) == 0:
-            self.remove(uri)
+        # If there are no subscribers left, delete it.
+        if not uri.live:
+            self.remove(uri.registration_id)
+
+    def index_session(self, handler, uri_name):
+        """
+        Records that handler has a role in the URI named uri_name, for disconnect().
+        """
+        sessionid = getattr(handler, 'sessionid', None)
+        if sessionid is not None:
+            self.session_uris.setdefault(sessionid, set()).add(uri_name)
 
     def disconnect(self, handler, notify=False):
         """
         Removes a handler from the manager, effectively disconnecting it from the realm.  Can be called upon the closure of the
         transport as part of its cleanup, or by an authorized client to kick the other client.
         """
-        for name in list(self.uris.keys()):
-            self.uris[name].disconnect(handler)
-            if not self.uris[name].live:
-                del self.uris[name]
+        sessionid = handler.sessionid
+        for name in self.session_uris.pop(sessionid, ()):
+            uri = self.uris.get(name)
+            if uri is None:
+                continue
+            if uri.uri_type == URIType.TOPIC:
+                subscribed = sessionid in uri.sessions
+                uri.disconnect(handler)
+                if subscribed:
+                    self.meta_event('wamp.subscription.on_unsubscribe', sessionid, uri.registration_id)
+            elif uri.uri_type == URIType.PROCEDURE:
+                provided = sessionid in uri.callees
+                uri.disconnect(handler)
+                if provided:
+                    self.meta_event('wamp.registration.on_unregister', sessionid, uri.registration_id)
+            else:
+                uri.disconnect(handler)
+
+            if not uri.live:
+                self.remove(uri.registration_id)
         if notify:
             pass    # XXX Send the final message.
 
+    def meta_event(self, uri_name, *args, **kwargs):
+        """
+        Publishes a WAMP meta-event (wamp.session.on_join, wamp.subscription.on_create, ...) from the router.  This is a
+        dictionary lookup and nothing else unless someone is subscribed to it.
+        """
+        topic = self.uris.get(uri_name)
+        if topic is not None and topic.subscribers:
+            topic.publish(None, PublishMessage(uri_name=uri_name, request_id=random_id(), args=list(args), kwargs=kwargs))
+
+    def subscription_details(self, topic):
+        """
+        The description of a subscription used by the meta-API.
+        """
+        return {'id': topic.registration_id, 'created': topic.created.isoformat() + 'Z', 'uri': topic.name, 'match': 'exact'}
+
+    def registration_details(self, procedure):
+        """
+        The description of a registration used by the meta-API.
+        """
+        return {'id': procedure.registration_id, 'created': procedure.created.isoformat() + 'Z', 'uri': procedure.name, 'match': 'exact', 'invoke': 'single'}
+
     def publish(self, uri_name, origin_handler,  *args, request_id=None, **kwargs):
         """
         A convenience function to allow slightly more seamless publication.
         """
         if request_id is None:
-            request_id = create_global_id()
+            request_id = random_id()
         uri = self.get(uri_name, noraise=True)
 
         # It is possible, and not an error, that there are not subscribers.  In that case, do nothing.
@@ -188,7 +363,7 @@ class URIManager:
         A convenience function to allow slightly more seamless publication.
         """
         if request_id is None:
-            request_id = create_global_id()
+            request_id = random_id()
         self.get(uri_name).invoke(origin_handler, request_id, *args, **kwargs)
 
 
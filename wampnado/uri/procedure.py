@@ -1,15 +1,21 @@
 """
 Classes and methods for Procedure URIs for RPCs. 
 """
-from datetime import datetime
+from time import monotonic
 from warnings import warn
-from inspect import iscoroutinefunction, isfunction
-from asyncio import create_task, get_event_loop
+from functools import partial
+from inspect import iscoroutinefunction, isfunction, ismethod, isawaitable
+from asyncio import ensure_future
 
-from wampnado.uri import URI, URIType
+from tornado.ioloop import IOLoop
+from tornado.websocket import WebSocketClosedError
+
+from wampnado.uri import URI, URIType, ExecutionMode
 from wampnado.uri.error import WAMPSimpleException
 from wampnado.features import Options
-from wampnado.messages import Code, ResultMessage, InterruptMessage, InvocationMessage, ResultMessage
+from wampnado.auth import server_auth_ident
+from wampnado.messages import Code, ResultMessage, InterruptMessage, InvocationMessage, ResultMessage, PayloadError
+from wampnado.metrics import invocations, yields, pending_calls, LatencyHistogram
 
 class Procedure(URI):
     """
@@ -20,20 +26,31 @@ class Procedure(URI):
     # This is necessary because request responses are done by id.
     pending = {}
 
-    def __init__(self, name, provider):
+    def __init__(self, name, provider, mode=None):
         """
         provider is one of three things:
         1.  Some subclass of Handler.  In this case, we're dealing with a normal procedure that we invoke with an INVOCATION message to the registering client.
-        2.  A regular function, in which case it is called and the result returned immediately.
+        2.  A regular function or bound method, in which case it is called and the result returned immediately.
+        3.  A coroutine function, in which case it is run as a task, and the result is returned when it is done.
+
+        mode is the ExecutionMode of a pseudo-rpc.  By default, coroutine functions are run as coroutines, and other
+        functions in the default mode of the manager of the procedure (see URIManager.default_mode).
         """
         super().__init__(name, URIType.PROCEDURE)
 
-        if isfunction(provider):
+        # CALL to final RESULT, for the calls answered through this procedure.
+        self.latency = LatencyHistogram()
+
+        if isfunction(provider) or ismethod(provider):
             self.pseudo = True
             self.callback = provider
+            if mode is None and iscoroutinefunction(provider):
+                mode = ExecutionMode.COROUTINE
+            self.mode = mode
         else:
             self.pseudo = False
             self.provider = provider
+            self.mode = None
 
     def write_message(self, msg):
         """
@@ -41,26 +58,101 @@ class Procedure(URI):
         """
         return self.provider.write_message(msg)
 
+    @property
+    def execution_mode(self):
+        """
+        The ExecutionMode the callback of a pseudo-rpc is run in.
+        """
+        if self.mode is not None:
+            return self.mode
+        if self.manager is not None:
+            return self.manager.default_mode
+        return ExecutionMode.INLINE
 
     def invoke(self, invoking_handler, request_id, *args, options=Options(), **kwargs):
         """
-        Send an invokation message to the provider, or for pseudo-rpcs, just runs it directly and returns the result.
+        Send an invokation message to the provider, or for pseudo-rpcs, runs the callback in its execution mode.  Inline
+        callbacks are answered right away, the others when they are done.
         Options:
         receive_progress (bool): Set to true to allow progressive yields.  Otherwise, the first yield will end the request.
         """
         try:
             if self.pseudo:
-                result = self.callback(*args, **kwargs)
-                return ResultMessage(request_id=request_id, details={}, args=result)
+                invocations.inc('pseudo')
+                mode = self.execution_mode
+                start = monotonic()
+                if mode == ExecutionMode.INLINE:
+                    result = self.callback(*args, **kwargs)
+                    if not isawaitable(result):
+                        self.latency.record(monotonic() - start)
+                        return ResultMessage(request_id=request_id, details={}, args=result)
+                    future = ensure_future(result)
+                elif mode == ExecutionMode.COROUTINE:
+                    future = ensure_future(self.callback(*args, **kwargs))
+                else:
+                    future = IOLoop.current().run_in_executor(self.manager.executor(mode), partial(self.callback, *args, **kwargs))
+
+                future.add_done_callback(partial(self.send_result, invoking_handler, request_id, start))
+                return None
             else:
-                type(self).pending[request_id] = (invoking_handler, datetime.utcnow(), options)
-                return self.write_message(InvocationMessage(request_id=request_id, registration_id=self.registration_id, args=args, kwargs=kwargs, details=options))
+                return self.send_invocation(invoking_handler, request_id, options, InvocationMessage(request_id=request_id, registration_id=self.registration_id, args=args, kwargs=kwargs, details=options))
         # Convert a simple exception into a full one.
         except WAMPSimpleException as e:
             raise e.to_exception(Code.CALL, request_id)
         except Exception as e:
             raise invoking_handler.realm.errors.general_error.to_exception(Code.CALL, request_id, e)
 
+    def forward(self, invoking_handler, call_msg, options=Options()):
+        """
+        Invokes the procedure for a CALL message.  The INVOCATION of a remote procedure gets the arguments of the CALL as
+        they are, so that they are not decoded if they were received undecoded (see PayloadMessage).
+        """
+        if self.pseudo:
+            return self.invoke(invoking_handler, call_msg.request_id, *call_msg.args, options=options, **call_msg.kwargs)
+
+        try:
+            invocation = InvocationMessage(request_id=call_msg.request_id, registration_id=self.registration_id, details=options).payload_from(call_msg)
+            return self.send_invocation(invoking_handler, call_msg.request_id, options, invocation)
+        except WAMPSimpleException as e:
+            raise e.to_exception(Code.CALL, call_msg.request_id)
+        except PayloadError as e:
+            raise invoking_handler.realm.errors.invalid_argument.to_exception(Code.CALL, call_msg.request_id, reason=str(e))
+        except Exception as e:
+            raise invoking_handler.realm.errors.general_error.to_exception(Code.CALL, call_msg.request_id, e)
+
+    def send_invocation(self, invoking_handler, request_id, options, invocation):
+        """
+        Sends an INVOCATION to the provider, and keeps the call pending until it YIELDs.
+        """
+        invocations.inc('remote')
+        type(self).pending[request_id] = (invoking_handler, monotonic(), options, self)
+        try:
+            return self.write_message(invocation)
+        except (WAMPSimpleException, PayloadError):
+            # The callee never got it, so it will never answer.
+            type(self).pending.pop(request_id, None)
+            raise
+
+    def send_result(self, invoking_handler, request_id, start, future):
+        """
+        Answers a CALL to a pseudo-rpc that was not run inline, once its future is done.  Runs on the IOLoop.
+        """
+        self.latency.record(monotonic() - start)
+        try:
+            msg = ResultMessage(request_id=request_id, details={}, args=future.result())
+        except WAMPSimpleException as e:
+            msg = e.to_exception(Code.CALL, request_id).message()
+        except BaseException as e:
+            msg = invoking_handler.realm.errors.general_error.to_exception(Code.CALL, request_id, e).message()
+
+        try:
+            try:
+                invoking_handler.write_message(msg)
+            except WAMPSimpleException as e:
+                invoking_handler.write_message(e.to_exception(Code.CALL, request_id).message())
+        except WebSocketClosedError:
+            warn('caller of request_id {} is gone'.format(request_id))
+
     def cancel(self, request_id):
         """
         Removes a pending request without fulfilling it.
@@ -79,6 +171,17 @@ class Procedure(URI):
     def live(self):
         return (hasattr(self, 'provider') and self.provider is not None) or self.pseudo
 
+    @property
+    def callees(self):
+        """
+        The sessionids providing this procedure.  Pseudo-rpcs are provided by the router itself.
+        """
+        if self.pseudo:
+            return [server_auth_ident.sessionid]
+        elif self.provider is not None:
+            return [self.provider.sessionid]
+        return []
+
     @classmethod
     def yield_result(cls, yielding_handler, yield_msg):
         """
@@ -87,12 +190,33 @@ class Procedure(URI):
         progress (bool): A progressive response.  The request will be kept open, and the *details* send to back in the response will have the progress flag set.
         """
         if yield_msg.request_id in cls.pending:
-            (invoking_handler, request_time, call_options) = cls.pending[yield_msg.request_id]
-            invoking_handler.write_message(ResultMessage(request_id=yield_msg.request_id, details=yield_msg.options, args=yield_msg.args, kwargs=yield_msg.kwargs))
+            (invoking_handler, request_time, call_options, procedure) = cls.pending[yield_msg.request_id]
+            try:
+                invoking_handler.write_message(ResultMessage(request_id=yield_msg.request_id, details=yield_msg.options).payload_from(yield_msg))
+            except WAMPSimpleException as e:
+                # The result is more than the caller accepts.  The call ends with an ERROR instead.
+                cls.pending.pop(yield_msg.request_id)
+                yields.inc('error')
+                invoking_handler.write_message(e.to_exception(Code.CALL, yield_msg.request_id).message())
+                return
+            except PayloadError as e:
+                # The YIELD was received undecoded, and its arguments do not decode.  The call ends with an ERROR instead.
+                cls.pending.pop(yield_msg.request_id)
+                yields.inc('error')
+                invoking_handler.write_message(invoking_handler.realm.errors.invalid_argument.to_exception(Code.CALL, yield_msg.request_id, reason=str(e)).message())
+                return
             if not yield_msg.options.progress or not call_options.receive_progress:
                 cls.pending.pop(yield_msg.request_id)
+                procedure.latency.record(monotonic() - request_time)
+                yields.inc('result')
+            else:
+                yields.inc('progress')
         else:
+            yields.inc('not_pending')
             # If the client is gone, tell the yielding client to stop sending results.
             if yield_msg.options.progress:
                 yielding_handler.write_message(InterruptMessage(request_id=yield_msg.request_id, options=Options(mode='killnowait')))
             warn('request_id {} not pending'.format(yield_msg.request_id))
+
+
+pending_calls.set_function(lambda: (((), len(Procedure.pending)),))
@@ -9,15 +9,28 @@ import tornadis
 from tornado import ioloop
 from tornado.websocket import WebSocketClosedError
 
-from wampnado.uri import URI, URIType
+from wampnado.uri.error import WAMPSimpleException
+
+from wampnado.uri import URI, URIType, ExecutionMode
 from wampnado.features import Options, server_features
-from wampnado.identifier import create_global_id
+from wampnado.identifier import create_global_id, release_global_id, random_id
 from wampnado.auth import server_auth_ident
-from wampnado.messages import PublishedMessage, EventMessage
+from wampnado.messages import Code, PublishedMessage, EventMessage, SplicedMessage, PayloadError
+from wampnado.serializer import NONE_PROTOCOL
+from wampnado.uri.history import EventHistory
+from wampnado.metrics import publications, publish_fanout
 
 PUBSUB_TIMEOUT = 60
 PUBLISHER_CONNECTION_TIMEOUT = 3 * 3600 * 1000  # 3 hours in miliseconds
 
+def warn_on_error(future):
+    """
+    Reports the failure of a pseudo-subscriber run off the IOLoop, since there is nobody to report it to.
+    """
+    if future.exception() is not None:
+        warn('pseudo-subscriber failed: {!r}'.format(future.exception()))
+
+
 class Subscriber:
     def __init__(self, handler):
         self.subscription_id = create_global_id()
@@ -39,20 +52,72 @@ class Subscriber:
         else:
             return self.handler.sessionid
 
+    @property
+    def authid(self):
+        if self.pseudo:
+            return server_auth_ident.authid
+        else:
+            return self.handler.authid
+
+    @property
+    def authrole(self):
+        if self.pseudo:
+            return server_auth_ident.authrole
+        else:
+            return self.handler.authrole
+
 
 class Topic(URI):
     """
     A uri URI for use with pub/sub functionality.
     """
 
-    def __init__(self, name, reserver=None):
+    def __init__(self, name, reserver=None, subscriptions=None):
         """
-
+        subscriptions is an index of subscription id -> Topic, kept up to date as subscribers come and go.  It is
+        normally shared by all the topics of a URIManager.
         """
         super().__init__(name, URIType.TOPIC)
         self.subscribers = {}
+        self.subscriptions = subscriptions if subscriptions is not None else {}
         self.reserver = reserver
-        self.registration_id = create_global_id()
+
+        # Indexes of the subscribers, so that eligible/exclude lists can be resolved with set operations.
+        # sessionid -> subscription ids, authid -> sessionids and authrole -> sessionids respectively.
+        self.sessions = {}
+        self.authids = {}
+        self.authroles = {}
+
+        # Only set when the event history is enabled for this topic.  See enable_history().
+        self.history = None
+
+    def enable_history(self, max_events=None, max_age=None, max_bytes=None, budget=None):
+        """
+        Retain the most recent events published to this topic.  They can be retrieved with the wamp.subscription.get_events
+        meta-procedure, and are replayed to new subscribers that ask for it with the get_retained option.
+        """
+        if self.history is not None:
+            self.history.clear()
+        self.history = EventHistory(max_events=max_events, max_age=max_age, max_bytes=max_bytes, budget=budget)
+        return self.history
+
+    def disable_history(self):
+        """
+        Stop retaining events, and release the ones that were retained.
+        """
+        if self.history is not None:
+            self.history.clear()
+            self.history = None
+
+    def replay(self, handler, subscription_id, limit=None):
+        """
+        Sends the retained events to a single subscriber.
+        """
+        if self.history is None:
+            return
+
+        for entry in self.history.events(limit):
+            handler.write_message(entry.event_message(subscription_id))
 
     def publish(self, origin_handler, broadcast_msg):
         """
@@ -62,42 +127,146 @@ class Topic(URI):
         --https://wamp-proto.org/_static/gen/wamp_latest.html
 
         """
-        publication_id = create_global_id()
+        publication_id = random_id()
 
         purge = []
+        delivered = 0
+        executor = None
+
+        # The args and kwargs of the EVENTs, serialized (and compressed, see WebSocketTransport) only once for all the
+        # subscribers, or passed on as they were received if they were not decoded (see PayloadMessage).  Only the
+        # subscription id, publication id and details are serialized per subscriber.
+        tail = broadcast_msg.payload
 
-        for subscription_id in self.subscribers.keys():
+        subscriptions = [
+            (subscription_id, self.subscribers[subscription_id])
+            for sessionid in self.receivers(origin_handler, broadcast_msg.options)
+            for subscription_id in tuple(self.sessions.get(sessionid, ()))
+        ]
+
+        # Arguments received undecoded are decoded once, before anybody gets the event, if any subscriber needs them
+        # decoded, so that a publication whose arguments do not decode goes to nobody.
+        if broadcast_msg.undecoded and any(subscriber.pseudo or subscriber.handler.protocol != origin_handler.protocol for (_, subscriber) in subscriptions):
+            try:
+                broadcast_msg.unpack_payload()
+            except PayloadError as e:
+                if broadcast_msg.options.acknowledge:
+                    raise origin_handler.realm.errors.invalid_argument.to_exception(Code.PUBLISH, broadcast_msg.request_id, reason=str(e))
+                warn('publication {} to {} dropped: {}'.format(publication_id, self.name, e))
+                return None
+
+        if self.manager is not None and self.manager.default_mode == ExecutionMode.THREAD:
+            executor = self.manager.executor(ExecutionMode.THREAD)
+
+        for (subscription_id, subscriber) in subscriptions:
+            delivered += 1
             try:
-                if self.subscribers[subscription_id].pseudo:
+                if subscriber.pseudo:
                     # We expect all pseudo-subscribers to accept any provided parameters, or accept the output to the error log.
-                    self.subscribers[subscription_id].callback(*broadcast_msg.args, **broadcast_msg.kwargs)                     
+                    if executor is not None:
+                        executor.submit(subscriber.callback, *broadcast_msg.args, **broadcast_msg.kwargs).add_done_callback(warn_on_error)
+                    else:
+                        subscriber.callback(*broadcast_msg.args, **broadcast_msg.kwargs)
+                elif subscriber.handler.protocol == NONE_PROTOCOL:
+                    subscriber.write_message(EventMessage(subscription_id=subscription_id, publication_id=publication_id, args=broadcast_msg.args, kwargs=broadcast_msg.kwargs))
                 else:
-                    event_message = EventMessage(subscription_id=subscription_id, publication_id=publication_id, args=broadcast_msg.args, kwargs=broadcast_msg.kwargs)
-
-                    # Per WAMP standard, the publisher does not receive the message.
-                    if origin_handler is None or self.subscribers[subscription_id].sessionid != origin_handler.sessionid:
-                        self.subscribers[subscription_id].write_message(event_message)
+                    subscriber.write_message(SplicedMessage(Code.EVENT, [subscription_id, publication_id, {}], tail))
 
             # If we get an error, remove the subscription.
             except WebSocketClosedError:
                 purge.append(subscription_id)
+            # The event is longer than this subscriber accepts.  The others still get it.
+            except WAMPSimpleException:
+                delivered -= 1
 
         # We don't do this until the loop is done to prevent breaking the iterator.
         for subscription_id in purge:
-            del self.subscribers[subscription_id]
+            self.remove_subscription(subscription_id)
+
+        publications.inc()
+        publish_fanout.observe(delivered - len(purge))
+
+        if self.history is not None:
+            self.history.append(publication_id, tail)
 
-        if broadcast_msg.options.acknowlege:
-            return PublishedMessage(request_id=broadcast_msg.request_id, publication_id=self.registration_id)
+        if broadcast_msg.options.acknowledge:
+            return PublishedMessage(request_id=broadcast_msg.request_id, publication_id=publication_id)
         else:
             return None
-            
+
+    def receivers(self, origin_handler, options):
+        """
+        Returns the sessionids that should receive a publication, according to the publisher exclusion and
+        subscriber black/white-listing options of the PUBLISH message:
+
+        eligible, eligible_authid, eligible_authrole: only these sessions may receive the event.
+        exclude, exclude_authid, exclude_authrole: these sessions will not receive the event.
+        exclude_me: whether the publisher is excluded.  Defaults to True.
+
+        The cost is proportional to the size of the lists given, not to the number of subscribers, except when
+        nothing is eligible-listed, in which case every subscriber gets the event anyway.
+        """
+        eligible = None
+        for (sessions, index) in ((options.eligible, None), (options.eligible_authid, self.authids), (options.eligible_authrole, self.authroles)):
+            if sessions is not None:
+                sessions = self.resolve(sessions, index)
+                eligible = sessions if eligible is None else eligible & sessions
+
+        excluded = set()
+        for (sessions, index) in ((options.exclude, None), (options.exclude_authid, self.authids), (options.exclude_authrole, self.authroles)):
+            if sessions is not None:
+                excluded |= self.resolve(sessions, index)
+
+        # Per WAMP standard, the publisher does not receive the message unless it asks to.
+        if origin_handler is not None and options.get('exclude_me', True):
+            excluded.add(origin_handler.sessionid)
+
+        if eligible is None:
+            return self.sessions.keys() - excluded
+        return eligible - excluded
+
+    def resolve(self, keys, index=None):
+        """
+        Returns the set of subscribed sessionids matching keys, which are either sessionids (index is None), or
+        keys into one of the authid/authrole indexes.
+        """
+        if index is None:
+            return {sessionid for sessionid in keys if sessionid in self.sessions}
+
+        sessions = set()
+        for key in keys:
+            sessions |= index.get(key, set())
+        return sessions
+
+    def remove_subscription(self, subscription_id):
+        """
+        Removes a single subscription from the uri, keeping the indexes up to date.
+        """
+        subscriber = self.subscribers.pop(subscription_id, None)
+        if subscriber is None:
+            return None
+        self.subscriptions.pop(subscription_id, None)
+        release_global_id(subscription_id)
+
+        sessionid = subscriber.sessionid
+        subscriptions = self.sessions.get(sessionid)
+        if subscriptions is not None:
+            subscriptions.discard(subscription_id)
+            if not subscriptions:
+                del self.sessions[sessionid]
+                for (index, key) in ((self.authids, subscriber.authid), (self.authroles, subscriber.authrole)):
+                    index[key].discard(sessionid)
+                    if not index[key]:
+                        del index[key]
+
+        return subscriber
 
     def remove_subscriber(self, handler):
         """
-        Removes subscriber from uri.
+        Removes all of the handler's subscriptions from uri.
         """
-        if handler.sessionid in self.subscribers:
-            return self.subscribers.pop(handler.sessionid)
+        for subscription_id in list(self.sessions.get(handler.sessionid, ())):
+            self.remove_subscription(subscription_id)
 
     def add_subscriber(self, handler):
         """
@@ -105,6 +274,12 @@ class Topic(URI):
         """
         sub = Subscriber(handler)
         self.subscribers[sub.subscription_id] = sub
+        self.subscriptions[sub.subscription_id] = self
+
+        sessionid = sub.sessionid
+        self.sessions.setdefault(sessionid, set()).add(sub.subscription_id)
+        self.authids.setdefault(sub.authid, set()).add(sessionid)
+        self.authroles.setdefault(sub.authrole, set()).add(sessionid)
 
         return sub.subscription_id
 
@@ -119,7 +294,8 @@ class Topic(URI):
 
     @property
     def live(self):
-        if len(self.subscribers.keys()) > 0:
+        # A topic that retains history has to outlive its subscribers, or there would be nothing to retain.
+        if len(self.subscribers.keys()) > 0 or self.history is not None:
             return True
         else:
             return False
@@ -0,0 +1,167 @@
+"""
+IOLoop lag monitoring.
+
+A LoopWatchdog ticks on the IOLoop every interval seconds, and records how late each tick was in the
+wampnado_ioloop_lag_seconds histogram.  A thread of its own checks that the ticks keep coming.  When they stop for more
+than threshold seconds, it takes the stack of the IOLoop's thread, to find out which processor or callback is blocking
+it, while it is still blocking it.  Nothing is added to the handling of messages.
+
+    watchdog = LoopWatchdog(threshold=0.1)
+    watchdog.start()
+"""
+import sys
+import traceback
+from collections import deque
+from threading import Thread, Event, get_ident
+from time import monotonic, time
+
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+from wampnado.metrics import Counter, Gauge, Histogram
+
+WATCHDOG_INTERVAL = 0.05    # seconds
+WATCHDOG_THRESHOLD = 0.1    # seconds
+STALL_HISTORY = 100
+
+# Upper bounds, in seconds, of the buckets for IOLoop lag.
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# The modules running the code that gets dispatched to: the culprit of a stall is the first function called from them.
+DISPATCHING_MODULES = ('wampnado.agent', 'wampnado.uri.procedure', 'wampnado.uri.topic', 'tornado.', 'asyncio.')
+
+ioloop_lag = Histogram('wampnado_ioloop_lag_seconds', 'How late the IOLoop ran the watchdog tick.', buckets=LAG_BUCKETS)
+ioloop_lag_max = Gauge('wampnado_ioloop_lag_max_seconds', 'The longest IOLoop lag seen.')
+ioloop_stalls = Counter('wampnado_ioloop_stalls_total', 'IOLoop stalls longer than the watchdog threshold, by the function blocking it.', ('culprit',))
+
+
+def frame_name(frame):
+    return '{}.{}'.format(frame.f_globals.get('__name__', '?'), frame.f_code.co_name)
+
+
+def culprit(frame):
+    """
+    The function the IOLoop is stuck in: the innermost function called directly by a processor dispatch, a pseudo-RPC
+    invocation, a publication or the event loop.  If there is none, the innermost function.
+    """
+    innermost = frame
+    while frame is not None:
+        caller = frame.f_back
+        if caller is not None and caller.f_globals.get('__name__', '').startswith(DISPATCHING_MODULES):
+            if not frame.f_globals.get('__name__', '').startswith(DISPATCHING_MODULES):
+                return frame_name(frame)
+        frame = caller
+    return frame_name(innermost)
+
+
+class Stall(object):
+    """
+    A period during which the IOLoop did not run the watchdog tick for more than the threshold.
+    """
+    __slots__ = ('started', 'duration', 'culprit', 'stack')
+
+    def __init__(self, started, culprit, stack):
+        self.started = started
+        self.duration = None
+        self.culprit = culprit
+        self.stack = stack
+
+    def to_dict(self):
+        return {'started': self.started, 'duration': self.duration, 'culprit': self.culprit, 'stack': self.stack}
+
+
+class LoopWatchdog(object):
+    """
+    Watches the lag of an IOLoop (the current one by default).  The last STALL_HISTORY stalls are kept in stalls.
+    """
+    def __init__(self, interval=WATCHDOG_INTERVAL, threshold=WATCHDOG_THRESHOLD, loop=None, history=STALL_HISTORY):
+        self.interval = interval
+        self.threshold = threshold
+        self.loop = loop
+        self.stalls = deque(maxlen=history)
+        self.max_lag = 0.0
+
+        self.periodic = None
+        self.thread = None
+        self.stopping = Event()
+        self.loop_thread = None
+        self.heartbeat = None
+
+        # The stall in progress, if any.
+        self.stall = None
+
+    def start(self):
+        """
+        Starts watching.  Must be called from the thread running the IOLoop.
+        """
+        if self.periodic is not None:
+            return
+        self.loop = self.loop or IOLoop.current()
+        self.loop_thread = get_ident()
+        self.heartbeat = monotonic()
+        self.periodic = PeriodicCallback(self.tick, self.interval * 1000)
+        self.periodic.start()
+
+        self.stopping.clear()
+        self.thread = Thread(target=self.watch, name='wampnado-watchdog', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.periodic is not None:
+            self.periodic.stop()
+            self.periodic = None
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def tick(self):
+        """
+        Runs on the IOLoop.  Records how late it is, and ends the stall in progress, if any.
+        """
+        now = monotonic()
+        lag = max(0.0, now - self.heartbeat - self.interval)
+        self.heartbeat = now
+
+        ioloop_lag.observe(lag)
+        if lag > self.max_lag:
+            self.max_lag = lag
+            ioloop_lag_max.set(lag)
+
+        stall = self.stall
+        if stall is not None:
+            stall.duration = lag + self.interval
+            self.stall = None
+
+    def watch(self):
+        """
+        Runs on the watchdog thread.  Looks at what the IOLoop thread is doing whenever it misses a tick.
+        """
+        while not self.stopping.wait(self.interval / 2):
+            if self.stall is None and monotonic() - self.heartbeat > self.interval + self.threshold:
+                frame = sys._current_frames().get(self.loop_thread)
+                if frame is None:
+                    continue
+                stall = Stall(time(), culprit(frame), traceback.format_stack(frame))
+                del frame
+                self.stall = stall
+                # stalls and the metrics are read on the IOLoop, so they are only changed there, once it is free.
+                self.loop.add_callback(self.record, stall)
+
+    def record(self, stall):
+        """
+        Runs on the IOLoop.  Keeps a stall found by the watchdog thread.
+        """
+        self.stalls.append(stall)
+        ioloop_stalls.inc(stall.culprit)
+
+    def report(self):
+        return {
+            'interval': self.interval,
+            'threshold': self.threshold,
+            'max_lag': self.max_lag,
+            'stalls': [stall.to_dict() for stall in self.stalls],
+        }
+
+
+# The watchdog reported by the wampnado.watchdog.get meta-procedure.  Started by whoever wants it.
+watchdog = LoopWatchdog()